@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# =============================================================================
+# expect_scan
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""Compares the CPU time of waiting for the prompt after the long command output
+using the plain pexpect searcher, the incremental searcher and the event matcher
+combining the events into the single regular expression.
+
+The output is generated by the child process spawned in the pseudo terminal the same way
+the condoor protocols spawn the sessions. The events are the same as in the generic driver
+waiting for the IOS XR prompt after the command.
+
+Usage::
+
+    python benchmarks/expect_scan.py [--size 0.5,1,2,4]
+"""
+
+import os
+import sys
+import time
+import optparse
+import pexpect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from condoor.controllers.expect import IncrementalSearcher, EventMatcher, TAIL, DEFAULT_OVERLAP  # noqa
+from condoor.platforms import generic  # noqa
+
+PROMPT = "RP/0/RSP0/CPU0:ios#"
+
+GENERATOR = """
+import sys
+line = "  10.0.0.0/24        192.168.0.1        0 100 0 65001 65002 65003 i\\n"
+count = int(sys.argv[1]) // len(line) + 1
+sys.stdout.write(line * count + "{}")
+""".format(PROMPT)
+
+
+def make_events():
+    jumphost_prompt = generic.re.compile(generic.re.escape("[user@jumphost ~]$"))
+    return [generic.Connection.command_syntax_re, generic.Connection.connection_closed_re,
+            pexpect.TIMEOUT, pexpect.EOF, generic.prompt_patterns['IOSXR'], generic.Connection.press_return,
+            generic.Connection.more, jumphost_prompt]
+
+
+def spawn(size):
+    # the same settings as in Protocol._spawn_session
+    return pexpect.spawn(sys.executable, ["-c", GENERATOR, str(size)], maxread=50000, searchwindowsize=None,
+                         timeout=600)
+
+
+def measure_plain(size):
+    session = spawn(size)
+    start = time.clock()
+    index = session.expect(make_events())
+    elapsed = time.clock() - start
+    session.close(force=True)
+    return index, elapsed
+
+
+def measure_incremental(size, searcher_class=IncrementalSearcher):
+    session = spawn(size)
+    events = make_events()
+    windows = {event.pattern: TAIL for event in events[4:5] + events[7:]}
+    start = time.clock()
+    searcher = searcher_class(session.compile_pattern_list(events), windows, DEFAULT_OVERLAP)
+    index = session.expect_loop(searcher, session.timeout)
+    elapsed = time.clock() - start
+    session.close(force=True)
+    return index, elapsed
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--size", dest="size", default="0.5,1,2,4",
+                      help="Comma separated list of the output sizes in MB")
+    options, _ = parser.parse_args()
+
+    print("{:>8} {:>12} {:>16} {:>12} {:>8}".format("size[MB]", "pexpect[s]", "incremental[s]", "matcher[s]",
+                                                    "speedup"))
+    for size in [float(value) for value in options.size.split(',')]:
+        size_bytes = int(size * 1024 * 1024)
+        plain_index, plain_time = measure_plain(size_bytes)
+        incremental_index, incremental_time = measure_incremental(size_bytes)
+        matcher_index, matcher_time = measure_incremental(size_bytes, EventMatcher)
+        assert plain_index == incremental_index == matcher_index == 4, "Prompt not matched"
+        print("{:>8.2f} {:>12.3f} {:>16.3f} {:>12.3f} {:>7.1f}x".format(
+            size, plain_time, incremental_time, matcher_time, plain_time / matcher_time if matcher_time else 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# =============================================================================
+# fsm_logging
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""Measures the logging overhead per FSM transition. The FSM answers the --More-- prompt
+many times, so the time spent is the transition processing, the action call and the tracing only.
+
+Compares the eager message formatting used before with the lazy formatting at the INFO
+and DEBUG levels and with the structured event hook.
+
+Usage::
+
+    python benchmarks/fsm_logging.py [--transitions 100000]
+"""
+
+import os
+import sys
+import re
+import time
+import logging
+import optparse
+from functools import wraps
+
+import pexpect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from condoor.controllers.fsm import FSM, FSMTemplate, action  # noqa
+from condoor.exceptions import ConnectionError  # noqa
+
+PROMPT = re.compile("router#")
+MORE = re.compile(" --More-- ")
+
+
+def legacy_action(func):
+    """The action decorator formatting the message before the level is checked."""
+    @wraps(func)
+    def with_logging(*args, **kwargs):
+        for arg in args:
+            if isinstance(arg, FSM.Context):
+                logging.getLogger('condoor.controllers.fsm').debug("[{}]: [{}] A={}".format(
+                    arg.ctrl.hostname, arg.fsm_name, func.__name__))
+                break
+        else:
+            logging.getLogger('condoor.controllers.fsm').debug("[FSM] A={}".format(func.__name__))
+        return func(*args, **kwargs)
+    return with_logging
+
+
+class LegacyTemplate(FSMTemplate):
+    """The FSM run formatting all the debug messages regardless of the log level."""
+    def run(self, ctrl, init_pattern=None, timeout=300):
+        ctx = FSM.Context(self.name, ctrl)
+        table = self.table
+        transition_counter = 0
+        self._dbg(ctrl, 10, "FSM Started")
+        while transition_counter < self.max_transitions + 1:
+            transition_counter += 1
+            try:
+                start_time = time.time()
+                ctx.event = ctrl.expect(self.events, timeout=timeout)
+                finish_time = time.time() - start_time
+                ctx.pattern = self.events[ctx.event]
+
+                transition = table[ctx.state][ctx.event] if 0 <= ctx.state < len(table) else None
+                if transition is not None:
+                    next_state, action, next_timeout = transition
+                    self._dbg(ctrl, 10, "E={},S={},T={},RT={:.2f}".format(
+                        ctx.event, ctx.state, timeout, finish_time))
+                    if callable(action):
+                        if not action(ctx):
+                            self._dbg(ctrl, 50, "Error: {}".format(ctx.msg))
+                            return False
+                    elif action is None:
+                        self._dbg(ctrl, 10, "No action")
+
+                    if next_timeout != 0:
+                        timeout = next_timeout
+                    ctx.state = next_state
+                    self._dbg(ctrl, 10, "NS={},NT={}".format(next_state, timeout))
+                else:
+                    self._dbg(ctrl, 40, "Unknown transition: EVENT={},STATE={}".format(ctx.event, ctx.state))
+                    continue
+
+            except pexpect.EOF:
+                raise ConnectionError("Session closed unexpectedly", ctrl.hostname)
+
+            if ctx.finished or next_state == -1:
+                self._dbg(ctrl, 10, "FSM finished at E={},S={}".format(ctx.event, ctx.state))
+                return True
+        return False
+
+    def _dbg(self, ctrl, level, msg):
+        self.logger.log(level, "[{}]: [{}] {}".format(ctrl.hostname, self.name, msg))
+
+
+class FakeController(object):
+    """Returns --More-- for the given number of expect calls and then the prompt."""
+    hostname = "router"
+
+    def __init__(self, mores, hook=None):
+        self.mores = mores
+        self.fsm_event_hook = hook
+
+    def expect(self, events, timeout):
+        if self.mores:
+            self.mores -= 1
+            return 1
+        return 0
+
+    def send(self, data):
+        pass
+
+
+def send_space(ctx):
+    ctx.ctrl.send(' ')
+    return True
+
+
+def make_template(template_class, decorator, transitions):
+    return template_class("WAIT-4-PROMPT", [PROMPT, MORE], [
+        (MORE, [0], 0, decorator(send_space), 0),
+        (PROMPT, [0], -1, None, 0),
+    ], max_transitions=transitions + 1)
+
+
+def measure(template, transitions, hook=None):
+    start = time.clock()
+    template.run(FakeController(transitions, hook), timeout=10)
+    return (time.clock() - start) / transitions * 1000000
+
+
+class EventCounter(object):
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, event):
+        self.count += 1
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--transitions", dest="transitions", type="int", default=100000,
+                      help="Number of the FSM transitions")
+    options, _ = parser.parse_args()
+    transitions = options.transitions
+
+    logger = logging.getLogger("condoor")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    cases = [
+        ("eager formatting, INFO", logging.INFO, LegacyTemplate, legacy_action, None),
+        ("lazy formatting, INFO", logging.INFO, FSMTemplate, action, None),
+        ("lazy formatting, INFO + hook", logging.INFO, FSMTemplate, action, EventCounter()),
+        ("eager formatting, DEBUG", logging.DEBUG, LegacyTemplate, legacy_action, None),
+        ("lazy formatting, DEBUG", logging.DEBUG, FSMTemplate, action, None),
+    ]
+    print("{:<32} {:>16}".format("case", "transition[us]"))
+    for name, level, template_class, decorator, hook in cases:
+        logger.setLevel(level)
+        template = make_template(template_class, decorator, transitions)
+        print("{:<32} {:>16.2f}".format(name, measure(template, transitions, hook)))
+
+
+if __name__ == '__main__':
+    main()
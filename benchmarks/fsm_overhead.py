@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# =============================================================================
+# fsm_overhead
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""Measures the per command overhead of the FSM waiting for the prompt. The device
+answers immediately, so the time spent is the FSM setup and the transition processing only.
+
+Compares the FSM rebuilt for every command with the cached FSM template.
+
+Usage::
+
+    python benchmarks/fsm_overhead.py [--commands 20000] [--jumphosts 2]
+"""
+
+import os
+import sys
+import re
+import time
+import logging
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from condoor.controllers.fsm import FSM  # noqa
+from condoor.platforms import generic  # noqa
+
+
+class FakeController(object):
+    """Returns the target prompt event for every expect call."""
+    hostname = "router"
+    after = "router#"
+    detected_target_prompt = "router#"
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def expect(self, events, timeout):
+        return events.index(self.driver.compiled_prompts[-1])
+
+
+def make_driver(jumphosts):
+    hosts = [None] * (jumphosts + 1)
+    driver = generic.Connection("router", hosts, None, logging.getLogger("condoor"))
+    driver.compiled_prompts = [re.compile(re.escape("jumphost{}$".format(index))) for index in range(jumphosts)]
+    driver.compiled_prompts.append(re.compile(re.escape("router#")))
+    driver.ctrl = FakeController(driver)
+    return driver
+
+
+def rebuilt(driver, commands):
+    for _ in xrange(commands):
+        events, transitions = driver._wait_for_prompt_fsm()
+        FSM("WAIT-4-PROMPT", driver.ctrl, events, transitions, timeout=60).run()
+
+
+def template(driver, commands):
+    for _ in xrange(commands):
+        driver.wait_for_prompt(timeout=60)
+
+
+def measure(function, driver, commands):
+    start = time.clock()
+    function(driver, commands)
+    return (time.clock() - start) / commands * 1000000
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--commands", dest="commands", type="int", default=20000,
+                      help="Number of the commands")
+    parser.add_option("--jumphosts", dest="jumphosts", type="int", default=2,
+                      help="Number of the jumphosts adding the events")
+    options, _ = parser.parse_args()
+
+    logging.getLogger("condoor").setLevel(logging.INFO)
+    driver = make_driver(options.jumphosts)
+    rebuilt_time = measure(rebuilt, driver, options.commands)
+    template_time = measure(template, driver, options.commands)
+    print("{:>12} {:>14} {:>8}".format("rebuilt[us]", "template[us]", "speedup"))
+    print("{:>12.1f} {:>14.1f} {:>7.1f}x".format(rebuilt_time, template_time, rebuilt_time / template_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# =============================================================================
+# prompt_detection
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""Compares the prompt detection against the legacy byte-at-a-time algorithm.
+
+The session is simulated and the time is virtual, so the reported figures are the
+time the detection would take on a link with a given round trip time (RTT)
+and the number of read calls made by the algorithm.
+
+Usage::
+
+    python benchmarks/prompt_detection.py [--rtt 0.001,0.05,0.3] [--prompt 'RP/0/RSP0/CPU0:ios#']
+"""
+
+import os
+import sys
+import re
+import optparse
+import heapq
+import pexpect
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from condoor.controllers.protocols import base  # noqa
+from condoor.controllers.protocols.telnet import Telnet  # noqa
+from condoor.platforms import generic  # noqa
+from condoor.exceptions import ConnectionError  # noqa
+
+
+class VirtualClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class SimulatedSession(object):
+    """Echoes the prompt for every line sent, after the RTT, 30 bytes per millisecond."""
+    def __init__(self, clock, prompt, rtt, banner=""):
+        self.clock = clock
+        self.prompt = prompt
+        self.rtt = rtt
+        self.pending = []  # heap of (arrival time, sequence, byte)
+        self.sequence = 0
+        self.last_arrival = 0.0
+        self.reads = 0
+        self.is_target = True
+        self.hostname = 'simulated'
+        self.platform = generic.Connection
+        self._queue(banner)
+
+    def _queue(self, data):
+        # the link is serialized, the data is delivered after the data sent before
+        arrival = max(self.clock.now + self.rtt, self.last_arrival)
+        for char in data:
+            arrival += 1 / 30000.0
+            self.sequence += 1
+            heapq.heappush(self.pending, (arrival, self.sequence, char))
+        self.last_arrival = arrival
+
+    def sendline(self, line=""):
+        self._queue(line + "\r\n" + self.prompt)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        self.reads += 1
+        if not self.pending or self.pending[0][0] > self.clock.now + timeout:
+            self.clock.now += timeout
+            raise pexpect.TIMEOUT("Timeout")
+        self.clock.now = max(self.clock.now, self.pending[0][0])
+        data = ""
+        while self.pending and self.pending[0][0] <= self.clock.now and len(data) < size:
+            data += heapq.heappop(self.pending)[2]
+        return data
+
+    def read(self, size, timeout):
+        return self.read_nonblocking(size, timeout)
+
+    def expect(self, pattern, timeout=-1):
+        self.pending = []
+        return 0
+
+    def native_session(self, spawn):
+        # the session is never opened in-process
+        return False
+
+
+class LegacyTelnet(Telnet):
+    """The prompt detection algorithm used before the chunked reading engine."""
+    def try_read_prompt(self, timeout_multiplier):
+        first_char_timeout = timeout_multiplier * 2
+        inter_char_timeout = timeout_multiplier * 0.4
+        total_timeout = timeout_multiplier * 4
+
+        prompt = ""
+        begin = base.time.time()
+        expired = 0.0
+        timeout = first_char_timeout
+
+        while expired < total_timeout:
+            try:
+                p = self.ctrl.read_nonblocking(size=1, timeout=timeout)
+                if p not in ['\n', '\r']:
+                    timeout = inter_char_timeout
+                expired = base.time.time() - begin
+                prompt += p
+            except pexpect.TIMEOUT:
+                break
+            except pexpect.EOF:
+                raise ConnectionError('Session disconnected')
+        return prompt.strip()
+
+    def detect_prompt(self, sync_multiplier=4):
+        self.ctrl.sendline()
+        self.try_read_prompt(sync_multiplier)
+        attempt = 0
+        max_attempts = 10
+        while attempt < max_attempts:
+            attempt += 1
+            self.ctrl.sendline()
+            a = self.try_read_prompt(sync_multiplier)
+            self.ctrl.sendline()
+            b = self.try_read_prompt(sync_multiplier)
+            ld = self.levenshtein_distance(a, b)
+            len_a = len(a)
+            if len_a == 0:
+                continue
+            if float(ld) / len_a < 0.3:
+                self.prompt = b.splitlines(True)[-1]
+                compiled_prompt = re.compile("(\r\n|\n\r){}".format(re.escape(self.prompt)))
+                self.ctrl.sendline()
+                self.ctrl.expect(compiled_prompt)
+                return True
+            sync_multiplier *= 1.2
+        return False
+
+
+class NodeInfo(object):
+    protocol = 'telnet'
+    hostname = 'simulated'
+    port = 23
+    password = None
+    username = 'admin'
+
+
+def measure(protocol_class, prompt, rtt, banner):
+    clock = VirtualClock()
+    real_time = base.time
+    base.time = clock
+    try:
+        session = SimulatedSession(clock, prompt, rtt, banner)
+        protocol = protocol_class(session, NodeInfo(), False, None, None)
+        detected = protocol.detect_prompt()
+    finally:
+        base.time = real_time
+    return detected and protocol.prompt.strip() == prompt, clock.now, session.reads
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option("--rtt", dest="rtt", default="0.001,0.01,0.05,0.1,0.3",
+                      help="Comma separated list of the round trip times in seconds")
+    parser.add_option("--prompt", dest="prompt", default="RP/0/RSP0/CPU0:ios#",
+                      help="The prompt returned by the simulated device")
+    parser.add_option("--banner", dest="banner", default="\r\nUser Access Verification\r\n",
+                      help="The data received before the prompt detection starts")
+    options, _ = parser.parse_args()
+
+    print("{:>8} {:>10} {:>12} {:>8} {:>12} {:>8} {:>8}".format(
+        "RTT[s]", "detected", "legacy[s]", "reads", "chunked[s]", "reads", "speedup"))
+    for rtt in [float(value) for value in options.rtt.split(',')]:
+        legacy_ok, legacy_time, legacy_reads = measure(LegacyTelnet, options.prompt, rtt, options.banner)
+        new_ok, new_time, new_reads = measure(Telnet, options.prompt, rtt, options.banner)
+        print("{:>8.3f} {:>10} {:>12.3f} {:>8} {:>12.3f} {:>8} {:>7.1f}x".format(
+            rtt, "{}/{}".format("yes" if legacy_ok else "no", "yes" if new_ok else "no"),
+            legacy_time, legacy_reads, new_time, new_reads, legacy_time / new_time if new_time else 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -30,11 +30,22 @@ import sys
 import os
 import re
 import logging
+import threading
 import time
+from functools import partial
+from cStringIO import StringIO
 
 from hopinfo import make_hop_info_from_url
 from controllers.pexpect_ctrl import Controller
 from condoor.utils import delegate
+from condoor.cache import DiscoveryCache, CommandCache, make_discovery_key
+from condoor.metrics import get_default_registry as get_default_metrics_registry
+from condoor.controllers.recording import SessionRecorder, SessionReplay
+from condoor.controllers.transports import TRANSPORTS, SPAWN
+from condoor.reachability import get_default_service as get_default_reachability_service
+from condoor.reconnect import ReconnectScheduler
+from condoor.sessionlog import SessionLogger, SessionLog
+from condoor.controllers.protocols.sshmux import ControlSocketRegistry, get_default_registry
 
 from pexpect import TIMEOUT
 from condoor.controllers.fsm import FSM, action
@@ -71,12 +82,16 @@ os_names = {
 }
 
 
-@delegate("_driver", ("reload", "send", "enable", "run_fsm"))
+@delegate("_driver", ("send", "send_many", "send_iter", "enable", "run_fsm", "verify_prompt", "send_steps",
+                      "run_fsm_steps"))
 class Connection(object):
     """This is the main class interface for Condoor. Use this class to create
     a connection session, discover and control the remote device."""
 
-    def __init__(self, name, urls, log_dir=None, log_level=logging.DEBUG, log_session=True, account_manager=None):
+    def __init__(self, name, urls, log_dir=None, log_level=logging.DEBUG, log_session=True, account_manager=None,
+                 discovery_cache=None, ssh_multiplexing=False, command_framing='echo', metrics_registry=None,
+                 record=None, replay=None, transport=SPAWN, reachability=None, race=False,
+                 reconnect_scheduler=None, command_cache=None, session_logger=None):
         """This is the constructor. The *hostname* parameter is a string representing the name of the device.
         It is used mainly for verbose logging purposes.
 
@@ -132,6 +147,72 @@ class Connection(object):
         The default is DEBUG. If the *log_level* is set to 0 then no logging file is created.  The *log_session*
         parameters defines whether the device session log is created or not.
 
+        The *discovery_cache* parameter is either the path to the cache file or the
+        :class:`condoor.cache.DiscoveryCache` object. If provided, the :meth:`discovery` results are stored in the
+        cache and next time the device details are taken from the cache without accessing the device.
+        The :meth:`connect` verifies the detected prompt and the os version against the cached record and
+        repeats the discovery if they do not match.
+
+        The *ssh_multiplexing* parameter enables the OpenSSH connection sharing (ControlMaster/ControlPersist) for
+        the first hop SSH connections. Many devices behind the same jumphost then reuse single SSH connection
+        to the jumphost without the key exchange and authentication. If *True* the process wide
+        :class:`condoor.controllers.protocols.sshmux.ControlSocketRegistry` is used. The registry object
+        can be also passed directly.
+
+        The *command_framing* parameter defines how the command output boundaries are detected. In the default
+        'echo' mode the command is sent after the device echoes it back. In the 'prompt' mode the command is sent
+        at once and the output is framed by the device prompts only. The echo is removed from the output if
+        recognized. Use 'prompt' mode for the terminal servers or slow consoles garbling or wrapping the echo.
+
+        The *metrics_registry* parameter is the :class:`condoor.metrics.MetricsRegistry` object collecting the
+        connection phase timings and counters. If not provided the process wide registry is used. See :attr:`stats`.
+        The registry keeps the metrics of the device after disconnecting unless :meth:`disconnect` is called with
+        *remove_metrics=True*.
+
+        The *record* parameter is either the path to the recording file or the
+        :class:`condoor.controllers.recording.SessionRecorder` object. If provided, all the data read from and
+        written to the device sessions is recorded with the timestamps.
+        The *replay* parameter is either the path to the recording file or the
+        :class:`condoor.controllers.recording.SessionReplay` object. If provided, the recorded sessions are replayed
+        instead of connecting to the devices. The file path replays the data at full speed. Use the
+        :class:`condoor.controllers.recording.SessionReplay` object with *timing='original'* to keep the recorded
+        delays.
+
+        The *transport* parameter defines how the first hop session is opened. In the default 'spawn' mode the
+        telnet or ssh client is spawned with pexpect. In the 'native' mode the telnet session is opened in-process
+        without the client process and the pty. The ssh sessions are opened in-process if the paramiko is installed.
+        The ssh jumphosts are then used as the tunnels: the next hop session is opened through the direct-tcpip
+        channel and the connection to the jumphost is shared by all the devices behind it.
+        See :mod:`condoor.controllers.transports`.
+
+        The *reachability* parameter enables the verification of the first hop reachability before connecting.
+        If *True* the process wide :class:`condoor.reachability.ReachabilityService` is used. The service object
+        can be also passed directly. The first hops of all the urls chains are verified in parallel and the chains
+        with the unreachable first hop are skipped without waiting for the telnet or ssh timeout. The next hops
+        are reachable from the jumphosts only and are not verified.
+
+        The *race* parameter enables connecting the alternative urls chains (i.e. the consoles of both RPs)
+        in parallel instead of one after another. If *True* all the chains are started at once. If integer
+        then the first *race* chains are started. The first chain reaching the target device prompt is used and
+        the other connections are closed. The standby console never wins as it fails to connect. The racing is
+        not used when replaying the recorded sessions.
+
+        The *reconnect_scheduler* parameter is the :class:`condoor.reconnect.ReconnectScheduler` object scheduling
+        the :meth:`reconnect` attempts with the exponential backoff and remembering the failing paths and hops.
+        If not provided the scheduler with the default settings is created for the connection. The scheduler
+        can be shared by the connections. See :attr:`reconnect_timeline`.
+
+        The *command_cache* parameter is the :class:`condoor.cache.CommandCache` object keeping the outputs of the
+        show commands for the time to live, so the repeated :meth:`send` calls do not access the device.
+        If *True* the cache with the default settings is created. The cache can be shared by the connections,
+        the outputs are kept per device. The outputs of the device are invalidated when the device enters
+        the configuration mode and on :meth:`reload` and :meth:`reconnect`. Defaults to *None* (no caching).
+
+        The *session_logger* parameter is the :class:`condoor.sessionlog.SessionLogger` object writing the device
+        session log in the background thread to the *<name>.session.log* file with the rotation and compression.
+        If *True* the logger with the default settings writing to *log_dir* is created. The session log is flushed
+        on :meth:`disconnect`. If not provided the session is logged synchronously to the *session.log* file.
+
         """
 
         self._driver = None
@@ -160,6 +241,13 @@ class Connection(object):
         self._nodes = nodes
         self._last_driver_index = 0
 
+        if reachability is True:
+            reachability = get_default_reachability_service()
+        self._reachability = reachability or None
+        if self._reachability is not None:
+            for chain in self._nodes:
+                chain[0].verify_reachability = self._reachability.is_reachable
+
         self._account_manager = account_manager
         self._platform = 'generic'
         self._os_type = None
@@ -172,6 +260,46 @@ class Connection(object):
         self._info = {}
         self._is_console = False
 
+        if isinstance(discovery_cache, basestring):
+            discovery_cache = DiscoveryCache(discovery_cache)
+        self._discovery_cache = discovery_cache
+        self._discovery_cache_key = make_discovery_key(name, nodes)
+        self._discovery_from_cache = False
+        # set when discovery hands over its session to the platform driver, cleared by the following connect
+        self._session_handed_over = False
+
+        if command_framing not in ('echo', 'prompt'):
+            raise GeneralError("Unknown command framing mode: {}".format(command_framing))
+        self._command_framing = command_framing
+
+        if metrics_registry is None:
+            metrics_registry = get_default_metrics_registry()
+        self._metrics_registry = metrics_registry
+        self._metrics = metrics_registry.metrics_for(name)
+
+        if transport not in TRANSPORTS:
+            raise GeneralError("Unknown transport: {}".format(transport))
+
+        self._controller_options = {'transport': transport}
+        self._race = race if replay is None else False
+        self._reconnect_scheduler = reconnect_scheduler or ReconnectScheduler()
+        self._reconnect_timeline = []
+        if command_cache is True:
+            command_cache = CommandCache()
+        self._command_cache = command_cache
+        if ssh_multiplexing:
+            if not isinstance(ssh_multiplexing, ControlSocketRegistry):
+                ssh_multiplexing = get_default_registry()
+            self._controller_options['control_sockets'] = ssh_multiplexing
+        if record is not None:
+            if isinstance(record, basestring):
+                record = SessionRecorder(record)
+            self._controller_options['recorder'] = record
+        if replay is not None:
+            if isinstance(replay, basestring):
+                replay = SessionReplay(replay)
+            self._controller_options['replay'] = replay
+
         self._udi = {
             "name": "",
             "description": "",
@@ -205,10 +333,17 @@ class Connection(object):
         self.logger.addHandler(self._handler)
         self.logger.setLevel(log_level)
 
-        try:
-            self._session_fd = open(os.path.join(log_dir, 'session.log'), mode="w")
-        except IOError:
-            self._session_fd = None
+        if session_logger is True:
+            # the log_dir is not set when logging is disabled
+            session_logger = SessionLogger(log_dir or "./")
+        self._session_logger = session_logger
+        if self._session_logger is not None:
+            self._session_fd = self._session_logger.open(self._name)
+        else:
+            try:
+                self._session_fd = open(os.path.join(log_dir, 'session.log'), mode="w")
+            except IOError:
+                self._session_fd = None
 
         self.logger.info("Condoor version {}".format(__version__))
 
@@ -218,12 +353,15 @@ class Connection(object):
     def _set_default_log_fd(self, logfile=None):
         if self._log_session:
             if logfile is None:
+                if self._session_logger is not None:
+                    self._session_fd = self._session_logger.open(self._name)
+                    return
                 try:
                     self._session_fd = open(os.path.join(self._log_dir, 'session.log'), mode="a+")
                 except (IOError, AttributeError):
                     self._session_fd = None
             else:
-                self._session_fd = logfile if isinstance(logfile, file) else None
+                self._session_fd = logfile if isinstance(logfile, (file, SessionLog)) else None
 
     def _get_driver_name(self):
         for driver_name, families in drivers.iteritems():
@@ -233,6 +371,9 @@ class Connection(object):
             return 'generic'
 
     def _init_driver(self, driver_name='generic'):
+        self._driver = self._make_driver(driver_name, self._last_driver_index)
+
+    def _make_driver(self, driver_name, index):
 
         if driver_name == 'generic':
             if self._os_type in ["eXR", "XR"]:
@@ -252,12 +393,113 @@ class Connection(object):
 
         driver = driver_class(
             self._hostname,
-            self._nodes[self._last_driver_index],
-            Controller,
+            self._nodes[index],
+            partial(Controller, **self._controller_options),
             self.logger,
             account_manager=self._account_manager
         )
-        self._driver = driver
+        driver.command_framing = self._command_framing
+        driver.metrics = self._metrics
+        driver.command_cache = self._command_cache
+        driver.command_cache_key = self._discovery_cache_key
+        return driver
+
+    def _promote_driver(self, driver_name):
+        # hand over the live session of the generic driver to the platform specific driver
+        ctrl = self._driver.ctrl
+        self._init_driver(driver_name)
+        self.logger.debug("Handing over the session to the {} driver".format(self._driver.platform))
+        ctrl.platform = self._driver
+        self._driver.ctrl = ctrl
+        self._driver.connected = True
+        self._driver.connect(logfile=self._session_fd)
+        self._session_handed_over = True
+
+    def _racing(self):
+        if not self._race or len(self._nodes) < 2:
+            return False
+        return self._race is True or int(self._race) > 1
+
+    def _race_drivers(self):
+        # connect the alternative chains in parallel starting from the current one and keep the first connected
+        no_hosts = len(self._nodes)
+        count = no_hosts if self._race is True else min(int(self._race), no_hosts)
+        indexes = [(self._last_driver_index + shift) % no_hosts for shift in xrange(count)]
+        drivers = dict((index, self._make_driver('generic', index)) for index in indexes)
+        # the session logs are buffered and only the winner's log is written to the session log file
+        logs = dict((index, StringIO()) for index in indexes)
+        errors = {}
+        state = {'winner': None, 'pending': count}
+        lock = threading.Lock()
+        finished = threading.Event()
+
+        def run(index):
+            driver = drivers[index]
+            connected = False
+            try:
+                connected = driver.connect(logfile=logs[index] if self._session_fd else None)
+            except Exception as e:
+                errors[index] = e
+            with lock:
+                state['pending'] -= 1
+                won = connected and state['winner'] is None
+                if won:
+                    state['winner'] = index
+                if won or not state['pending']:
+                    finished.set()
+            if connected and not won:
+                self.logger.debug("Lost the race: {}".format(self._nodes[index][0]))
+                driver.disconnect()
+
+        self.logger.debug("Racing {} connection chains".format(count))
+        for index in indexes:
+            thread = threading.Thread(target=run, args=(index,), name="condoor-race-{}".format(index))
+            thread.daemon = True
+            thread.start()
+        while not finished.wait(1):
+            pass
+
+        with lock:
+            winner = state['winner']
+            # the chains still connecting are cancelled by closing their sessions
+            for index, driver in drivers.items():
+                if index != winner and getattr(driver, 'ctrl', None) is not None and driver.ctrl._session:
+                    try:
+                        driver.ctrl._session.close()
+                    except Exception:
+                        pass
+
+        if winner is None:
+            for index in indexes:
+                if isinstance(errors.get(index), GeneralError):
+                    raise errors[index]
+            raise ConnectionError("Unable to connect to the device")
+
+        self.logger.debug("Won the race: {}".format(self._nodes[winner][0]))
+        self._last_driver_index = winner
+        self._driver = drivers[winner]
+        if self._session_fd:
+            self._session_fd.write(logs[winner].getvalue())
+            self._driver.ctrl.session_log = self._session_fd
+            self._driver.ctrl._session.logfile_read = self._session_fd
+        return True
+
+    def _check_reachability(self):
+        # verify the first hops of all the chains in parallel and start from the first reachable chain
+        if self._reachability is None:
+            return
+        results = self._reachability.check_all((chain[0].hostname, chain[0].port) for chain in self._nodes)
+        no_hosts = len(self._nodes)
+        for shift in xrange(no_hosts):
+            index = (self._last_driver_index + shift) % no_hosts
+            first_hop = self._nodes[index][0]
+            if results[(first_hop.hostname, int(first_hop.port))]:
+                if index != self._last_driver_index:
+                    self.logger.debug("Skipping the unreachable chains. Starting from: {}".format(first_hop))
+                    self._last_driver_index = index
+                return
+            self.logger.debug("First hop not reachable: {}".format(first_hop))
+        raise ConnectionError("Unable to connect to the device. No reachable hosts")
 
     def _shift_driver(self):
         no_hosts = len(self._nodes)
@@ -384,46 +626,64 @@ class Connection(object):
         if match:
             self._udi['sn'] = match.group('sn')
 
-    def discovery(self, logfile=None):
+    def discovery(self, logfile=None, reuse_session=False):
         """This method detects the device details. This method discovery the several device attributes.
 
         Args:
             logfile (file): Optional file descriptor for session logging. The file must be open for write.
                 The session is logged only if ``log_session=True`` was passed to the constructor.
                 It the parameter is not passed then the default *session.log* file is created in `log_dir`.
+            reuse_session (bool): If *True* the session used for discovery is not disconnected, but handed over
+                to the detected platform driver. The following :meth:`connect` does not log in again. This saves
+                the second login through all the jumphosts. Defaults to *False*.
 
         """
 
         self._set_default_log_fd(logfile)
 
-        self._init_driver()
+        if self._load_discovery_cache():
+            self._init_driver(self._get_driver_name())
+            self._log_device_info()
+            return
 
-        no_hosts = len(self._nodes)
-        for _ in xrange(no_hosts):
-            try:
-                self._driver.connect(logfile=self._session_fd)
-                break
-            except ConnectionError:
-                self._shift_driver()
+        self._check_reachability()
+        if self._racing():
+            self._race_drivers()
         else:
-            raise ConnectionError("Unable to connect to the device")
+            self._init_driver()
+
+            no_hosts = len(self._nodes)
+            for _ in xrange(no_hosts):
+                try:
+                    self._driver.connect(logfile=self._session_fd)
+                    break
+                except ConnectionError:
+                    self._shift_driver()
+            else:
+                raise ConnectionError("Unable to connect to the device")
 
         self._update_device_info()
         self._update_udi()
 
         self._prompt = self._driver.prompt
         self._is_console = self._detect_console()
-        self._driver.disconnect()
 
         driver_name = self._get_driver_name()
-        if driver_name == 'generic':
-            raise RuntimeError("Platform {} not supported".format(self.family))
+        if reuse_session and driver_name != 'generic':
+            self._promote_driver(driver_name)
+        else:
+            self._driver.disconnect()
+            if driver_name == 'generic':
+                raise RuntimeError("Platform {} not supported".format(self.family))
+            self._init_driver(driver_name)
 
-        self._init_driver(driver_name)
         self._driver.determine_hostname(self._prompt)
 
         self._hostname = self._driver.hostname
+        self._store_discovery_cache()
+        self._log_device_info()
 
+    def _log_device_info(self):
         self.logger.info("Hostname: '{}'".format(self.hostname))
         self.logger.info("Family: {}".format(self.family))
         self.logger.info("Platform: {}".format(self.platform))
@@ -437,6 +697,60 @@ class Connection(object):
         self.logger.info("Prompt: '{}'".format(self._prompt))
         self.logger.info("Is connected to console: {}".format(self.is_console))
 
+    def _store_discovery_cache(self):
+        if self._discovery_cache is None:
+            return
+        record = {
+            'family': self._family,
+            'platform': self._platform,
+            'os_type': self._os_type,
+            'os_version': self._os_version,
+            'udi': self._udi,
+            'prompt': self._prompt,
+            'is_console': self._is_console,
+            'hostname': self._hostname,
+            'last_driver_index': self._last_driver_index,
+        }
+        self._discovery_cache.set(self._discovery_cache_key, record)
+
+    def _load_discovery_cache(self):
+        if self._discovery_cache is None:
+            return False
+        record = self._discovery_cache.get(self._discovery_cache_key)
+        if record is None:
+            return False
+        if record['last_driver_index'] >= len(self._nodes):
+            return False
+
+        self.logger.info("Device details taken from the discovery cache")
+        self._family = record['family']
+        self._platform = record['platform']
+        self._os_type = record['os_type']
+        self._os_version = record['os_version']
+        self._udi = record['udi']
+        self._prompt = record['prompt']
+        self._is_console = record['is_console']
+        self._hostname = record['hostname']
+        self._last_driver_index = record['last_driver_index']
+        self._discovery_from_cache = True
+        return True
+
+    def _verify_discovery_cache(self):
+        self._discovery_from_cache = False
+        prompt = self._driver.prompt
+        if prompt != self._prompt:
+            self.logger.info("Detected prompt '{}' does not match the cached one '{}'".format(prompt, self._prompt))
+            return False
+
+        if self._discovery_cache.verify_version:
+            cached_version = self._os_version
+            self._update_device_info()
+            if self._os_version != cached_version:
+                self.logger.info("OS version {} does not match the cached one {}".format(
+                    self._os_version, cached_version))
+                return False
+        return True
+
     def store_property(self, key, value):
         """This method stores a *value* identified by the *key* in the :class:`Connection` object.
 
@@ -478,6 +792,30 @@ class Connection(object):
 
         """
         self._set_default_log_fd(logfile)
+        if self._family is None:
+            self._load_discovery_cache()
+
+        result = self._connect()
+
+        if self._discovery_from_cache and not self._verify_discovery_cache():
+            self.logger.info("Discovery cache outdated. Starting the discovery")
+            self._discovery_cache.invalidate(self._discovery_cache_key)
+            self.disconnect()
+            self.discovery(logfile)
+            result = self._connect()
+
+        return result
+
+    def _connect(self):
+        handed_over, self._session_handed_over = self._session_handed_over, False
+        if handed_over and self._driver.is_connected:
+            self.logger.debug("Reusing the session established during discovery")
+            return True
+
+        self._check_reachability()
+        if self._racing():
+            return self._race_drivers()
+
         self._init_driver()
         no_hosts = len(self._nodes)
         result = False
@@ -500,6 +838,16 @@ class Connection(object):
 
         return result
 
+    def reload(self, *args, **kwargs):
+        """This method reloads the device and waits for device to boot up. The arguments are passed to the
+        platform driver. The command cache is invalidated."""
+        self._invalidate_command_cache("reload")
+        return self._driver.reload(*args, **kwargs)
+
+    def _invalidate_command_cache(self, reason):
+        if self._command_cache is not None:
+            self._command_cache.invalidate(reason, device=self._discovery_cache_key)
+
     def reconnect(self, max_timeout=360, logfile=None):
         """This method reconnects to the device. It can be called when after device reloads or the session was
         disconnected either by device or jumphost. If multiple jumphosts are used then `reconnect` starts from
@@ -521,35 +869,81 @@ class Connection(object):
         """
         self._set_default_log_fd(logfile)
 
+        if self._driver is None:
+            raise ConnectionError("Platform unknown. Try detect platform first")
+
+        self._invalidate_command_cache("reconnect")
+        scheduler = self._reconnect_scheduler
+        self._reconnect_timeline = []
         begin = time.time()
         expired = 0.0
         attempt = 0
         self.logger.info("Trying to reconnect within {} seconds".format(max_timeout))
         while expired < max_timeout:
+            index, delay = scheduler.choose(self._nodes, current=self._last_driver_index)
+            delay = min(delay, max_timeout - expired)
+            if delay > 0:
+                self.logger.debug("Waiting {:.1f}s before reconnecting".format(delay))
+                time.sleep(delay)
+            if index != self._last_driver_index:
+                self._last_driver_index = index
+                self._init_driver()
+
             self.logger.debug("Reconnecting. Attempt {}".format(attempt))
+            start = time.time()
+            record = {'attempt': attempt, 'path': index, 'delay': delay, 'start': start - begin}
+            self._reconnect_timeline.append(record)
             try:
                 self._driver.reconnect(logfile=self._session_fd)
-                break
-            except ConnectionError:
+            except ConnectionError as e:
+                failed_hop = getattr(getattr(self._driver, 'ctrl', None), 'failed_hop', None)
+                scheduler.record(self._nodes[index], False, failed_hop)
+                record.update(duration=time.time() - start, connected=False, error=str(e), failed_hop=failed_hop)
                 expired = time.time() - begin
-                self._shift_driver()
             except AttributeError:
                 raise ConnectionError("Platform unknown. Try detect platform first")
+            else:
+                scheduler.record(self._nodes[index], True)
+                record.update(duration=time.time() - start, connected=True, error=None, failed_hop=None)
+                break
             attempt += 1
         else:
             self.logger.error("Unable to reconnect")
             raise ConnectionTimeoutError("Unable to reconnect to device within {} s".format(max_timeout))
 
-    def disconnect(self):
+    @property
+    def reconnect_timeline(self):
+        """Returns the list of the attempts made by the last :meth:`reconnect` call. Every attempt is the dictionary
+        with the *attempt* number, the *path* index, the *delay* waited before the attempt, the *start* time relative
+        to the :meth:`reconnect` call, the *duration*, the *connected* flag, the *error* message and
+        the index of the *failed_hop* in the path if known.
+        """
+        return list(self._reconnect_timeline)
+
+    @property
+    def reconnect_health(self):
+        """Returns the failure history of the paths and hops kept by the reconnect scheduler."""
+        return self._reconnect_scheduler.health()
+
+    def disconnect(self, remove_metrics=False):
         """
         This method disconnect the session from the device and all the jumphosts in the path.
+
+        Args:
+            remove_metrics (bool): If *True* the metrics of the device are removed from the metrics registry,
+                i.e. when the device is not going to be connected again by the long running process.
         """
+        self._session_handed_over = False
+        if remove_metrics:
+            self._metrics_registry.remove(self._name)
         try:
             self._driver.disconnect()
         except AttributeError:
             pass
         finally:
             if self._session_fd:
+                if isinstance(self._session_fd, SessionLog):
+                    self._session_fd.close()
                 self._session_fd = None
 
     @property
@@ -620,6 +1014,14 @@ class Connection(object):
         """Returns *True* if the connection to the target device is over console port"""
         return self._is_console
 
+    @property
+    def stats(self):
+        """Returns the dict with the connection counters and the latency histograms of the connection phases:
+        hop connect, authentication and prompt detection, command echo wait, prompt wait and command execution.
+        See :meth:`condoor.metrics.ConnectionMetrics.as_dict`. The metrics of all the devices can be exported with
+        :meth:`condoor.metrics.MetricsRegistry.to_prometheus`."""
+        return self._metrics.as_dict()
+
     @property
     def name(self):
         """Returns the chassis name"""
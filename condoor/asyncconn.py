@@ -0,0 +1,544 @@
+# =============================================================================
+# asyncconn
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""The asynchronous connections sharing the single event loop thread.
+
+The commands are executed by the :class:`EventLoop` which waits for the events of all the sessions at once
+with select.poll, so thousands of connected sessions need one thread instead of one thread per session.
+The command code is the same as for :class:`condoor.Connection`: the platform driver provides the steps
+generators (see :class:`condoor.controllers.expect.Expect`) which are driven either blocking on the session
+or by the event loop. The prompt patterns and the FSM transition tables of the platform drivers are reused.
+
+The connection setup (the discovery, the login through the jumphosts and the prompt detection) is blocking
+and runs on the small :class:`Executor` pool. The pool bounds the number of the connections being set up
+at the same time, not the number of the connected sessions.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import select
+import sys
+import threading
+import time
+import Queue
+from collections import deque
+
+import pexpect
+
+from condoor import Connection
+from condoor.controllers.expect import Steps
+from condoor.exceptions import ConnectionTimeoutError
+
+# the max number of reads from the single session in one loop iteration
+MAX_READS = 16
+
+
+class Future(object):
+    """This class represents the result of the operation scheduled by :class:`AsyncConnection`."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def done(self):
+        """Returns *True* if the operation is finished."""
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the operation to finish and returns its result.
+
+        Args:
+            timeout (int): Maximum time in seconds to wait. If *None* waits forever.
+
+        Raises:
+            ConnectionTimeoutError: If the operation is not finished within *timeout*.
+            The exception raised by the operation, i.e. :class:`condoor.ConnectionError`.
+        """
+        if not self._done.wait(timeout):
+            raise ConnectionTimeoutError("Operation not finished within {} s".format(timeout))
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Waits for the operation to finish and returns the exception raised by the operation or *None*."""
+        if not self._done.wait(timeout):
+            raise ConnectionTimeoutError("Operation not finished within {} s".format(timeout))
+        return self._exception
+
+    def add_done_callback(self, callback):
+        """Adds the *callback* called with the future as an argument when the operation is finished.
+        If the operation is already finished the callback is called immediately."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, result):
+        self._finish(result, None)
+
+    def set_exception(self, exception):
+        self._finish(None, exception)
+
+    def _finish(self, result, exception):
+        with self._lock:
+            self._result = result
+            self._exception = exception
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.getLogger('condoor.async').exception("Future callback failed")
+
+
+class Executor(object):
+    """This class represents the bounded pool of worker threads running the blocking operations, i.e.
+    the connection setup, for many :class:`AsyncConnection` objects.
+    """
+
+    def __init__(self, workers=16):
+        """This is a class constructor.
+
+        Args:
+            workers (int): Number of worker threads. This is the maximum number of connections being set up
+                at the same time. Defaults to 16.
+        """
+        self.workers = max(1, workers)
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Schedules the *func* and returns the :class:`Future` object."""
+        future = Future()
+        self._start()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in xrange(self.workers):
+                thread = threading.Thread(target=self._worker, name="condoor-async-{}".format(index))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            future, func, args, kwargs = self._queue.get()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class _Task(object):
+    # the steps generator run by the event loop and the expect request it waits for
+    def __init__(self, steps):
+        self.steps = Steps(steps)
+        self.future = Future()
+        self.ctrl = None
+        self.expecter = None
+        self.fd = -1
+        self.deadline = None
+
+
+class EventLoop(object):
+    """This class runs the steps generators of many sessions in the single thread. The thread waits for the data
+    from all the sessions at once and resumes the generator when its expected event is received or the timeout
+    expires. Here is the example of usage::
+
+        loop = EventLoop()
+        future = loop.spawn(driver.send_steps("show version"))
+        print future.result()
+
+    The steps of the single session must not be run concurrently. The FSM actions are called in the loop thread,
+    so they must not wait for the device.
+    """
+
+    def __init__(self, poll_interval=0.01):
+        """This is a class constructor.
+
+        Args:
+            poll_interval (float): The interval in seconds the sessions without the file descriptor
+                (i.e. the replay) are polled at.
+        """
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger('condoor.async')
+        self._calls = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._waiting = set()
+        self._poller = select.poll() if hasattr(select, 'poll') else None
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        for fd in (self._wakeup_read, self._wakeup_write):
+            _set_nonblocking(fd)
+        if self._poller is not None:
+            self._poller.register(self._wakeup_read, select.POLLIN)
+
+    def spawn(self, steps):
+        """Schedules the *steps* generator and returns the :class:`Future` with its result."""
+        task = _Task(steps)
+        self.call_soon(self._step, task)
+        return task.future
+
+    def call_soon(self, func, *args):
+        """Calls the *func* in the loop thread. This method can be called from any thread."""
+        with self._lock:
+            self._calls.append((func, args))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="condoor-loop")
+                self._thread.daemon = True
+                self._thread.start()
+        try:
+            os.write(self._wakeup_write, 'x')
+        except OSError as e:
+            if e.errno != errno.EAGAIN:  # the loop is already woken up
+                raise
+
+    @property
+    def pending(self):
+        """Returns the number of the steps waiting for the session events."""
+        return len(self._waiting)
+
+    def _run(self):
+        while True:
+            while self._calls:
+                func, args = self._calls.popleft()
+                try:
+                    func(*args)
+                except Exception:
+                    self.logger.exception("Event loop call failed")
+
+            ready = self._poll(self._next_timeout())
+            now = time.time()
+            for task in list(self._waiting):
+                if task.fd < 0 or task.fd in ready:
+                    self._read(task)
+                elif task.deadline is not None and now >= task.deadline:
+                    self._expire(task)
+
+    def _next_timeout(self):
+        timeout = None
+        now = time.time()
+        for task in self._waiting:
+            if task.fd < 0:
+                remaining = self.poll_interval
+            elif task.deadline is not None:
+                remaining = max(0, task.deadline - now)
+            else:
+                continue
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _poll(self, timeout):
+        if self._poller is not None:
+            try:
+                events = self._poller.poll(None if timeout is None else timeout * 1000)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                return set()
+            ready = set(fd for fd, _ in events)
+        else:
+            fds = [task.fd for task in self._waiting if task.fd >= 0] + [self._wakeup_read]
+            try:
+                ready = set(select.select(fds, [], [], timeout)[0])
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+                return set()
+
+        if self._wakeup_read in ready:
+            try:
+                while os.read(self._wakeup_read, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+        return ready
+
+    def _step(self, task, value=None, error=None):
+        while True:
+            try:
+                request = task.steps.next(value, error)
+            except Exception as e:
+                task.future.set_exception(e)
+                return
+            if request is None:
+                task.future.set_result(task.steps.result)
+                return
+
+            value = error = None
+            try:
+                expecter = request.ctrl.expecter(request.events, exact=request.exact)
+                index = expecter.existing_data()
+            except Exception:
+                error = sys.exc_info()
+                continue
+            if index is not None:
+                request.ctrl.count_received()
+                value = index
+                continue
+
+            timeout = expecter.spawn.timeout if request.timeout == -1 else request.timeout
+            task.ctrl = request.ctrl
+            task.expecter = expecter
+            task.fd = request.ctrl.fileno()
+            task.deadline = None if timeout is None else time.time() + timeout
+            self._wait(task)
+            return
+
+    def _wait(self, task):
+        self._waiting.add(task)
+        if self._poller is not None and task.fd >= 0:
+            self._poller.register(task.fd, select.POLLIN | select.POLLPRI)
+
+    def _resume(self, task, value=None, error=None):
+        self._waiting.discard(task)
+        if self._poller is not None and task.fd >= 0:
+            try:
+                self._poller.unregister(task.fd)
+            except KeyError:
+                pass
+        task.ctrl.count_received()
+        task.ctrl = task.expecter = None
+        self._step(task, value, error)
+
+    def _read(self, task):
+        session = task.expecter.spawn
+        try:
+            for _ in xrange(MAX_READS):
+                data = session.read_nonblocking(session.maxread, timeout=0)
+                index = task.expecter.new_data(data)
+                if index is not None:
+                    self._resume(task, value=index)
+                    return
+        except pexpect.TIMEOUT:
+            # nothing more to read
+            pass
+        except pexpect.EOF as e:
+            try:
+                index = task.expecter.eof(e)
+            except pexpect.EOF:
+                self._resume(task, error=sys.exc_info())
+            else:
+                self._resume(task, value=index)
+            return
+        except Exception:
+            self._resume(task, error=sys.exc_info())
+            return
+
+        if task.deadline is not None and time.time() >= task.deadline:
+            self._expire(task)
+
+    def _expire(self, task):
+        try:
+            index = task.expecter.timeout()
+        except pexpect.TIMEOUT:
+            self._resume(task, error=sys.exc_info())
+        else:
+            self._resume(task, value=index)
+
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+_default_executor = None
+_default_loop = None
+_default_lock = threading.Lock()
+
+
+def get_default_executor():
+    """Returns the process wide :class:`Executor` used by :class:`AsyncConnection` if not specified otherwise."""
+    global _default_executor
+    with _default_lock:
+        if _default_executor is None:
+            _default_executor = Executor()
+        return _default_executor
+
+
+def get_default_loop():
+    """Returns the process wide :class:`EventLoop` used by :class:`AsyncConnection` if not specified otherwise."""
+    global _default_loop
+    with _default_lock:
+        if _default_loop is None:
+            _default_loop = EventLoop()
+        return _default_loop
+
+
+class AsyncConnection(object):
+    """This class mirrors the :class:`condoor.Connection` interface, but the methods return immediately with the
+    :class:`Future` object. The platform drivers, the prompt patterns and the FSM transition tables are the same
+    as for :class:`condoor.Connection`. Here is the example of usage::
+
+        connections = [AsyncConnection(name, urls) for name, urls in inventory]
+        for connection in connections:
+            connection.discovery()
+            connection.connect()
+        futures = [connection.send("show version") for connection in connections]
+        for future in as_completed(futures):
+            print future.result()
+
+    The :meth:`send` and :meth:`run_fsm` operations of all the connections are executed by the single
+    :class:`EventLoop` thread. The :meth:`discovery`, :meth:`connect`, :meth:`reconnect` and :meth:`disconnect`
+    operations are blocking and executed by the :class:`Executor` pool.
+
+    The operations of the single connection are executed in the order of calls, so the :meth:`send` scheduled
+    after :meth:`connect` waits for the connection to be established. If the operation fails, the exception is
+    passed to its future and the next operations are still executed. The wrapped :class:`condoor.Connection`
+    must not be used directly while the operations are pending.
+    """
+
+    def __init__(self, name, urls, executor=None, loop=None, **kwargs):
+        """This is the constructor. The *name*, *urls* and *kwargs* are passed to the :class:`condoor.Connection`
+        constructor.
+
+        Args:
+            executor (Executor): The executor running the connection setup. If *None* the process wide default
+                executor is used.
+            loop (EventLoop): The event loop running the commands. If *None* the process wide default
+                event loop is used.
+        """
+        self.connection = Connection(name, urls, **kwargs)
+        self.executor = executor or get_default_executor()
+        self.loop = loop or get_default_loop()
+        self._pending = deque()
+        self._running = False
+        self._lock = threading.Lock()
+
+    def __getattr__(self, item):
+        # properties like hostname, prompt, os_type, etc. are taken from the synchronous connection
+        if item == 'connection':
+            raise AttributeError(item)
+        return getattr(self.connection, item)
+
+    def discovery(self, logfile=None):
+        """Schedules :meth:`condoor.Connection.discovery` and returns :class:`Future`."""
+        return self._schedule(self._blocking, self.connection.discovery, logfile=logfile)
+
+    def connect(self, logfile=None):
+        """Schedules :meth:`condoor.Connection.connect` and returns :class:`Future`."""
+        return self._schedule(self._blocking, self.connection.connect, logfile=logfile)
+
+    def reconnect(self, max_timeout=360, logfile=None):
+        """Schedules :meth:`condoor.Connection.reconnect` and returns :class:`Future`."""
+        return self._schedule(self._blocking, self.connection.reconnect, max_timeout=max_timeout, logfile=logfile)
+
+    def disconnect(self, remove_metrics=False):
+        """Schedules :meth:`condoor.Connection.disconnect` and returns :class:`Future`."""
+        return self._schedule(self._blocking, self.connection.disconnect, remove_metrics=remove_metrics)
+
+    def send(self, cmd="", timeout=60, wait_for_string=None):
+        """Schedules :meth:`condoor.platforms.generic.Connection.send` on the event loop and returns
+        :class:`Future` with the command output as a result."""
+        return self._schedule(self._steps, 'send_steps', cmd, timeout=timeout, wait_for_string=wait_for_string)
+
+    def run_fsm(self, name, command, events, transitions, timeout, max_transitions=20):
+        """Schedules :meth:`condoor.platforms.generic.Connection.run_fsm` on the event loop and
+        returns :class:`Future`."""
+        return self._schedule(self._steps, 'run_fsm_steps', name, command, events, transitions, timeout,
+                              max_transitions=max_transitions)
+
+    def _blocking(self, func, *args, **kwargs):
+        return self.executor.submit(func, *args, **kwargs)
+
+    def _steps(self, method, *args, **kwargs):
+        # the driver may be replaced by the previous operation, so the steps are created when started
+        try:
+            steps = getattr(self.connection, method)(*args, **kwargs)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        return self.loop.spawn(steps)
+
+    def _schedule(self, start, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            self._pending.append((future, start, args, kwargs))
+            if self._running:
+                return future
+            self._running = True
+        self._start_next()
+        return future
+
+    def _start_next(self):
+        with self._lock:
+            if not self._pending:
+                self._running = False
+                return
+            future, start, args, kwargs = self._pending.popleft()
+
+        def done(executed):
+            if executed.exception() is not None:
+                future.set_exception(executed.exception())
+            else:
+                future.set_result(executed.result())
+            self._start_next()
+
+        start(*args, **kwargs).add_done_callback(done)
+
+
+def as_completed(futures, timeout=None):
+    """This function yields the *futures* in the order of completion.
+
+    Args:
+        futures (list): List of :class:`Future` objects.
+        timeout (int): Maximum time in seconds to wait for all the futures. If *None* waits forever.
+
+    Raises:
+        ConnectionTimeoutError: If not all the futures finished within *timeout*.
+    """
+    finished = Queue.Queue()
+    futures = list(futures)
+    for future in futures:
+        future.add_done_callback(finished.put)
+
+    deadline = None if timeout is None else time.time() + timeout
+    for _ in futures:
+        remaining = None if deadline is None else max(0, deadline - time.time())
+        try:
+            yield finished.get(timeout=remaining)
+        except Queue.Empty:
+            raise ConnectionTimeoutError("Operations not finished within {} s".format(timeout))
@@ -0,0 +1,227 @@
+# =============================================================================
+# cache
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import fnmatch
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# the show commands are the only commands cached
+_SHOW_COMMAND = re.compile(r'^sh(o(w)?)?$')
+
+
+def _to_str(item):
+    # json returns unicode strings, the rest of condoor works with str
+    if isinstance(item, unicode):
+        return item.encode('utf-8')
+    elif isinstance(item, dict):
+        return dict((_to_str(key), _to_str(value)) for key, value in item.iteritems())
+    elif isinstance(item, list):
+        return [_to_str(value) for value in item]
+    return item
+
+
+def make_discovery_key(name, nodes):
+    """This function returns the cache key for the device *name* reachable over the chains of *nodes*.
+    The key does not contain the passwords.
+
+    Args:
+        name (str): The device name passed to :class:`condoor.Connection`.
+        nodes (list): List of the lists of :class:`condoor.hopinfo.HopInfo` objects.
+    """
+    chains = ["->".join(repr(hop).lower() for hop in chain) for chain in nodes]
+    return "{}|{}".format(name, "|".join(chains))
+
+
+class DiscoveryCache(object):
+    """This class stores the results of :meth:`condoor.Connection.discovery` in the JSON file, so the next
+    script run can connect directly with the right platform driver. Here is the example of usage::
+
+        conn = condoor.Connection("router1", urls, discovery_cache="~/.condoor/discovery.json")
+        conn.discovery()  # no device access if the device is already in the cache
+        conn.connect()
+
+    The cache file can be shared between many :class:`condoor.Connection` objects.
+    """
+
+    fields = ['family', 'platform', 'os_type', 'os_version', 'udi', 'prompt', 'is_console', 'hostname',
+              'last_driver_index']
+
+    def __init__(self, filename, verify_version=True):
+        """This is a class constructor.
+
+        Args:
+            filename (str): The path to the cache file. The file is created if does not exist.
+            verify_version (bool): If *True* the os version is verified after connecting with the cached
+                data and the entry is invalidated if it does not match. Defaults to *True*.
+        """
+        self.filename = os.path.expanduser(filename)
+        self.verify_version = verify_version
+        self.logger = logging.getLogger('condoor.cache')
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def get(self, key):
+        """Returns the dict with the cached discovery record for the *key* or *None*."""
+        with self._lock:
+            record = self._load().get(key)
+        self.logger.debug("Discovery cache {}: {}".format("hit" if record else "miss", key))
+        return record
+
+    def set(self, key, record):
+        """Stores the discovery *record* for the *key*."""
+        record = dict(record, timestamp=time.time())
+        with self._lock:
+            self._entries = None  # re-read to keep the entries stored by other processes
+            self._load()[key] = record
+            self._save()
+
+    def invalidate(self, key):
+        """Removes the record for the *key* from the cache."""
+        with self._lock:
+            self._entries = None
+            if self._load().pop(key, None) is not None:
+                self.logger.debug("Discovery cache invalidated: {}".format(key))
+                self._save()
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.filename) as fd:
+                    self._entries = _to_str(json.load(fd))
+            except (IOError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        directory = os.path.dirname(self.filename) or "."
+        try:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            fd, tmp_filename = tempfile.mkstemp(dir=directory, prefix=".condoor-cache")
+            with os.fdopen(fd, "w") as tmp:
+                json.dump(self._entries, tmp, indent=2, sort_keys=True)
+            os.rename(tmp_filename, self.filename)
+        except (IOError, OSError) as e:
+            self.logger.warning("Unable to store the discovery cache {}: {}".format(self.filename, e))
+
+
+def normalize_command(command):
+    """Returns the *command* with the whitespaces collapsed."""
+    return " ".join(command.split())
+
+
+class CommandCache(object):
+    """This class keeps the outputs of the show commands sent with :meth:`condoor.Connection.send`, so repeated
+    calls within the time to live do not access the device. Here is the example of usage::
+
+        conn = condoor.Connection("router1", urls, command_cache=CommandCache(ttls={"show version": 600}))
+        conn.connect()
+        conn.send("show version")  # the device is accessed
+        conn.send("show  version")  # the cached output is returned
+
+    The outputs are cached per device and device mode, so the cache can be shared by the connections, i.e. passed
+    in the *connection_options* of :class:`condoor.fleet.Fleet` or :class:`condoor.pool.ConnectionPool`.
+    The least recently used output is removed when the cache is full.
+    Only the commands starting with the *show* keyword are cached. The cache is cleared when the device enters
+    the configuration mode and on :meth:`condoor.Connection.reload` and :meth:`condoor.Connection.reconnect`.
+    """
+
+    def __init__(self, ttl=60, ttls=None, max_entries=256):
+        """This is a class constructor.
+
+        Args:
+            ttl (float): The default time to live of the command output in seconds.
+            ttls (dict): The time to live for the commands matching the shell-style patterns,
+                i.e. {"show version": 600, "show int*": 5}. The first matching pattern in the alphabetical order is
+                used. The commands with the time to live 0 are not cached.
+            max_entries (int): The maximum number of the outputs kept.
+        """
+        self.ttl = ttl
+        self.ttls = dict((normalize_command(pattern), value) for pattern, value in (ttls or {}).items())
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.logger = logging.getLogger('condoor.cache')
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl_for(self, command):
+        """Returns the time to live for the *command* output. The 0 is returned for the commands not cached."""
+        command = normalize_command(command)
+        words = command.split()
+        if not words or not _SHOW_COMMAND.match(words[0]):
+            return 0
+        for pattern in sorted(self.ttls):
+            if fnmatch.fnmatchcase(command, pattern):
+                return self.ttls[pattern]
+        return self.ttl
+
+    def get(self, mode, command, device=None):
+        """Returns the cached output of the *command* executed on the *device* in the *mode* or *None*.
+        The *device* is the key identifying the device, i.e. returned by :func:`make_discovery_key`."""
+        key = (device, mode, normalize_command(command))
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None and entry[1] > time.time():
+                self._entries[key] = entry  # the most recently used
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        return None
+
+    def set(self, mode, command, output, device=None):
+        """Stores the *output* of the *command* executed on the *device* in the *mode*."""
+        ttl = self.ttl_for(command)
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        key = (device, mode, normalize_command(command))
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (output, time.time() + ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, reason=None, device=None):
+        """Removes the cached outputs of the *device*. All the cached outputs are removed if *device* is *None*."""
+        with self._lock:
+            keys = [key for key in self._entries if device is None or key[0] == device]
+            if keys:
+                self.logger.debug("Command cache invalidated{}".format(": " + reason if reason else ""))
+            for key in keys:
+                del self._entries[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,344 @@
+# =============================================================================
+# expect
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import re
+import sys
+import types
+from collections import OrderedDict
+
+from pexpect.expect import searcher_re
+
+# the event is searched from the beginning of the line which was incomplete in the previous search
+TAIL = 'tail'
+# the number of bytes already searched which are searched again with the new data
+DEFAULT_OVERLAP = 1024
+# the max length of the trailing line searched by the TAIL events
+MAX_LINE = 4096
+
+_LITERAL = re.compile(r'^[^.^$*+?{}\[\]\\|()]*$')
+# the literal string alternatives with the escaped punctuation, i.e. "reset by peer|closed by foreign host"
+_LITERAL_CHAR = r'(?:[^.^$*+?{}\[\]\\|()]|\\[^0-9A-Za-z])'
+_LITERAL_ALTERNATIVES = re.compile(r'^{0}*(?:\|{0}*)*$'.format(_LITERAL_CHAR))
+_ESCAPED = re.compile(r'\\([^0-9A-Za-z])')
+# the patterns which can't be safely combined with the other patterns in one alternation
+_NOT_COMBINABLE = re.compile(r'\\[1-9]|\(\?P[<=]|\(\?[iLmsux]+\)')
+
+
+def window_key(pattern):
+    """Returns the key identifying the *pattern* in the search windows dictionary."""
+    return getattr(pattern, 'pattern', pattern)
+
+
+class IncrementalSearcher(searcher_re):
+    """This is the pexpect searcher which scans only the newly received data and the bounded overlap
+    of the data already searched. This avoids the quadratic CPU usage while waiting for the pattern
+    in the long outputs.
+
+    The search window is defined for each event separately:
+
+    - *int*: the number of bytes already searched which are scanned again together with the new data.
+      It must be not shorter than the longest expected match.
+    - *TAIL*: the event is searched only from the beginning of the trailing line, which is suitable
+      for the prompts as they never span multiple lines.
+    - *None*: the whole buffer is searched as with the plain pexpect searcher.
+
+    The literal events use its own length as a window. The other events use the default window.
+    The priority of the events is the same as in pexpect: the earliest match wins and if more events
+    match at the same position the first one from the list wins.
+    """
+    def __init__(self, patterns, windows=None, default_window=DEFAULT_OVERLAP):
+        """The class constructor.
+
+        Args:
+            patterns (list): The list of the compiled regular expressions or EOF/TIMEOUT
+                as returned by pexpect `compile_pattern_list`.
+            windows (dict): The dictionary of the search windows for the events. The key is the pattern string.
+            default_window: The search window for the events not found in *windows*.
+        """
+        super(IncrementalSearcher, self).__init__(patterns)
+        windows = windows or {}
+        self._windows = []
+        for _, pattern in self._searches:
+            key = window_key(pattern)
+            if key in windows:
+                window = windows[key]
+            elif _LITERAL.match(key):
+                window = len(key)
+            else:
+                window = default_window
+            self._windows.append(window)
+
+        if None in self._windows:
+            # the whole buffer must be kept
+            self.longest_string = 0
+        else:
+            self.longest_string = max([MAX_LINE if size == TAIL else size for size in self._windows] + [0])
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        """This searches the 'buffer' for the first occurrence of one of the regular expressions.
+        The 'freshlen' indicates the number of bytes at the end of 'buffer' which have not been searched before.
+        If there is a match this returns the index of that event, and sets 'start', 'end' and 'match'.
+        Otherwise, returns -1.
+        """
+        first_match = None
+        self._prepare(buffer, freshlen, searchwindowsize)
+        for (index, pattern), window in zip(self._searches, self._windows):
+            match = pattern.search(buffer, self._window_start(buffer, window))
+            if match is None:
+                continue
+            if first_match is None or match.start() < first_match.start():
+                first_match = match
+                best_index = index
+
+        if first_match is None:
+            return -1
+        self.start = first_match.start()
+        self.end = first_match.end()
+        self.match = first_match
+        return best_index
+
+    def _prepare(self, buffer, freshlen, searchwindowsize):
+        self._fresh_start = len(buffer) - freshlen
+        self._min_start = 0 if searchwindowsize is None else max(0, len(buffer) - searchwindowsize)
+        self._line_start = None
+
+    def _window_start(self, buffer, window):
+        if window == TAIL:
+            if self._line_start is None:
+                limit = max(0, self._fresh_start - MAX_LINE)
+                newline = buffer.rfind('\n', limit, self._fresh_start)
+                self._line_start = newline + 1 if newline >= 0 else limit
+            start = self._line_start
+        elif window is None:
+            start = 0
+        else:
+            start = max(0, self._fresh_start - window)
+        return max(start, self._min_start)
+
+
+def literal_alternatives(pattern):
+    """Returns the list of the literal strings matched by the compiled *pattern* or None
+    if the pattern is not a plain string or the alternative of the plain strings."""
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE):
+        return None
+    if not _LITERAL_ALTERNATIVES.match(pattern.pattern):
+        return None
+    return [_ESCAPED.sub(r'\1', alternative) for alternative in pattern.pattern.split('|')]
+
+
+class EventMatcher(IncrementalSearcher):
+    """This is the incremental searcher compiling the event list once and finding the first event
+    in a single pass over the data.
+
+    The regular expression events with the same search window and flags are combined into the single
+    alternation with the named group for every event. The literal events and the alternatives
+    of the literals are found with the plain string search. The events which can't be combined
+    (i.e. with backreferences or inline flags) are searched separately.
+
+    The priority of the events is the same as in pexpect: the earliest match wins and if more events
+    match at the same position the first one from the list wins. The match object is always
+    created by the regular expression of the winning event.
+    """
+    def __init__(self, patterns, windows=None, default_window=DEFAULT_OVERLAP):
+        """The class constructor.
+
+        Args:
+            patterns (list): The list of the compiled regular expressions or EOF/TIMEOUT
+                as returned by pexpect `compile_pattern_list`.
+            windows (dict): The dictionary of the search windows for the events. The key is the pattern string.
+            default_window: The search window for the events not found in *windows*.
+        """
+        super(EventMatcher, self).__init__(patterns, windows, default_window)
+        self._patterns = dict(self._searches)
+        self._literals = []
+        self._separate = []
+        self._alternations = []
+
+        groups = OrderedDict()
+        for (index, pattern), window in zip(self._searches, self._windows):
+            literals = literal_alternatives(pattern)
+            if literals:
+                self._literals.append((index, window, literals))
+            elif _NOT_COMBINABLE.search(pattern.pattern):
+                self._separate.append((index, window, pattern))
+            else:
+                groups.setdefault((window, pattern.flags), []).append((index, pattern))
+
+        for (window, flags), members in groups.items():
+            if len(members) == 1:
+                self._separate.append((members[0][0], window, members[0][1]))
+                continue
+            source = "|".join("(?P<_e{}>{})".format(index, pattern.pattern) for index, pattern in members)
+            try:
+                # python 2.7 raises AssertionError if there are more than 100 groups
+                compiled = re.compile(source, flags)
+            except (re.error, AssertionError, OverflowError):
+                self._separate.extend((index, window, pattern) for index, pattern in members)
+            else:
+                self._alternations.append((window, compiled))
+
+    def search(self, buffer, freshlen, searchwindowsize=None):
+        """This searches the 'buffer' for the first occurrence of one of the events.
+        The 'freshlen' indicates the number of bytes at the end of 'buffer' which have not been searched before.
+        If there is a match this returns the index of that event, and sets 'start', 'end' and 'match'.
+        Otherwise, returns -1.
+        """
+        best = None
+        self._prepare(buffer, freshlen, searchwindowsize)
+        for window, compiled in self._alternations:
+            match = compiled.search(buffer, self._window_start(buffer, window))
+            if match:
+                candidate = (match.start(), int(match.lastgroup[2:]))
+                if best is None or candidate < best:
+                    best = candidate
+
+        for index, window, literals in self._literals:
+            start = self._window_start(buffer, window)
+            for literal in literals:
+                position = buffer.find(literal, start)
+                if position >= 0 and (best is None or (position, index) < best):
+                    best = (position, index)
+
+        for index, window, pattern in self._separate:
+            match = pattern.search(buffer, self._window_start(buffer, window))
+            if match and (best is None or (match.start(), index) < best):
+                best = (match.start(), index)
+
+        if best is None:
+            return -1
+        start, index = best
+        match = self._patterns[index].match(buffer, start)
+        self.start = start
+        self.end = match.end()
+        self.match = match
+        return index
+
+
+class Return(Exception):
+    """This exception ends the steps generator with the *value*. The Python 2 generators can't return the value."""
+
+    def __init__(self, value=None):
+        super(Return, self).__init__(value)
+        self.value = value
+
+
+class Expect(object):
+    """This is the request yielded by the steps generator to wait for one of the *events* on the controller
+    session. The generator receives the index of the event or the pexpect.TIMEOUT/EOF exception is raised
+    at the yield point, exactly like from the controller expect method.
+
+    The steps generator can also yield another steps generator which is run to completion. The value
+    passed with :class:`Return` is the result of the yield expression. This way the same code is run
+    by :func:`run_steps` blocking on the controller and by the event loop
+    (see :class:`condoor.asyncconn.EventLoop`)::
+
+        def steps(ctrl):
+            ctrl.sendline("show version")
+            index = yield Expect(ctrl, [PROMPT, pexpect.TIMEOUT], timeout=10)
+            raise Return(ctrl.before if index == 0 else None)
+    """
+    __slots__ = ['ctrl', 'events', 'timeout', 'exact']
+
+    def __init__(self, ctrl, events, timeout=-1, exact=False):
+        """The class constructor.
+
+        Args:
+            ctrl (object): The controller.
+            events (list|EventMatcher): The events or the compiled event list.
+            timeout (int): Timeout in seconds. If -1 the session timeout is used.
+            exact (bool): If *True* the events are the plain strings as for the pexpect expect_exact.
+        """
+        self.ctrl = ctrl
+        self.events = events
+        self.timeout = timeout
+        self.exact = exact
+
+    def run(self):
+        """Waits for the events blocking on the controller session and returns the event index."""
+        if self.exact:
+            return self.ctrl.expect_exact(self.events, timeout=self.timeout)
+        return self.ctrl.expect(self.events, timeout=self.timeout)
+
+
+class Steps(object):
+    """This class resumes the steps generator and the nested generators until the next :class:`Expect`
+    request. The *result* attribute is set to the value returned by the generator."""
+
+    def __init__(self, steps):
+        self._stack = [steps]
+        self.result = None
+
+    def next(self, value=None, error=None):
+        """Resumes the steps with the *value* of the last request or raises the *error* (the sys.exc_info()
+        tuple) at the yield point. Returns the next :class:`Expect` request or *None* if the steps are finished.
+        The exception not handled by the steps is raised."""
+        while self._stack:
+            try:
+                if error is not None:
+                    exc_info, error = error, None
+                    request = self._stack[-1].throw(*exc_info)
+                else:
+                    request = self._stack[-1].send(value)
+            except Return as e:
+                self._stack.pop()
+                value = e.value
+                continue
+            except StopIteration:
+                self._stack.pop()
+                value = None
+                continue
+            except Exception:
+                self._stack.pop()
+                if not self._stack:
+                    raise
+                error = sys.exc_info()
+                continue
+
+            if isinstance(request, types.GeneratorType):
+                self._stack.append(request)
+                value = None
+                continue
+            return request
+
+        self.result = value
+        return None
+
+
+def run_steps(steps):
+    """Runs the steps generator blocking on the controller sessions and returns its result."""
+    runner = Steps(steps)
+    request = runner.next()
+    while request is not None:
+        try:
+            value = request.run()
+        except Exception:
+            request = runner.next(error=sys.exc_info())
+        else:
+            request = runner.next(value)
+    return runner.result
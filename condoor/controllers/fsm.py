@@ -28,24 +28,36 @@
 # =============================================================================
 
 import logging
+from collections import namedtuple
+from copy import copy
 from functools import wraps
 from pexpect import EOF
 from time import time
 
+from .expect import Expect, Return, run_steps
 from ..exceptions import \
     ConnectionError
 
 
+_action_logger = logging.getLogger(__name__)
+
+# the structured FSM event passed to the controller fsm_event_hook
+FSMEvent = namedtuple('FSMEvent', ['hostname', 'fsm_name', 'event', 'pattern', 'state', 'next_state', 'action',
+                                   'elapsed'])
+
+
 def action(func):
     @wraps(func)
     def with_logging(*args, **kwargs):
-        for arg in args:
-            if isinstance(arg, FSM.Context):
-                logging.getLogger(__name__).debug("[{}]: [{}] A={}".format(
-                    arg.ctrl.hostname, arg.fsm_name, func.__name__))
-                break
-        else:
-            logging.getLogger(__name__).debug("[FSM] A={}".format(func.__name__))
+        # no cost if the debug level is disabled
+        if _action_logger.isEnabledFor(logging.DEBUG):
+            for arg in args:
+                if isinstance(arg, FSM.Context):
+                    _action_logger.debug("[{}]: [{}] A={}".format(
+                        arg.ctrl.hostname, arg.fsm_name, func.__name__))
+                    break
+            else:
+                _action_logger.debug("[FSM] A={}".format(func.__name__))
         return func(*args, **kwargs)
     return with_logging
 
@@ -85,7 +97,7 @@ class FSM(object):
         """
 
     class Context(object):
-        _slots__ = ['fsm_name', 'ctrl', 'event_index', 'event', 'state', 'finished', 'msg']
+        _slots__ = ['fsm_name', 'ctrl', 'event_index', 'event', 'state', 'finished', 'msg', 'transitions']
         fsm_name = "FSM"
         ctrl = None
         event_index = 0
@@ -93,6 +105,7 @@ class FSM(object):
         state = 0
         finished = False
         msg = ""
+        transitions = 0
 
         def __init__(self, fsm_name, ctrl):
             """This is a class constructor.
@@ -140,91 +153,179 @@ class FSM(object):
         self.max_transitions = max_transitions
         self.logger = logging.getLogger('condoor.fsm')
 
-        self.transition_table = self._compile(transitions, events)
+        self.template = FSMTemplate(name, events, transitions, max_transitions=max_transitions)
+
+    def run(self):
+        """This method starts the FSM.
+
+            Returns:
+                boolean: True if FSM reaches the last state or false if the exception or error message was raised
+        """
+        return self.template.run(self.ctrl, init_pattern=self.init_pattern, timeout=self.timeout)
+
+    def steps(self):
+        """This method returns the steps generator running the FSM. See :meth:`FSMTemplate.steps`."""
+        return self.template.steps(self.ctrl, init_pattern=self.init_pattern, timeout=self.timeout)
+
+
+class FSMTemplate(object):
+    """This class represents the compiled Finite State Machine which can be run many times. The events
+    and transitions are the same as for :class:`FSM`. The transitions are compiled once into the dense table
+    indexed by the state and the event index. Every run starts with the fresh
+    :class:`condoor.controllers.fsm.FSM.Context` object.
+
+    The template does not keep any state between runs, so it can be cached and reused for every command
+    sent to the device as long as the events and actions do not change::
+
+        template = FSMTemplate("WAIT-4-PROMPT", events, transitions)
+        template.run(ctrl, timeout=60)
+
+    If the action is the exception instance the copy of the exception is raised on every run.
+
+    The :meth:`steps` generator runs the same FSM without blocking on the session, so it can be driven by
+    the event loop (see :class:`condoor.asyncconn.EventLoop`). The actions are called in the loop thread,
+    so they must not wait for the device.
+
+    If the controller has the *fsm_event_hook* callable set, it is called for every transition
+    with the :data:`FSMEvent` named tuple. This is the structured alternative to the debug log
+    which costs nothing if not set. The number of transitions of every run is added to the
+    'condoor_fsm_transitions_total' counter of the controller *metrics*, if available.
+    """
+
+    def __init__(self, name, events, transitions, max_transitions=20):
+        """This is a FSMTemplate class constructor.
+
+        Args:
+            name (str): Name of the state machine used for logging purposes. Can't be *None*
+            events (list): List of expected strings or pexpect.TIMEOUT exception expected from the device.
+            transitions (list): List of tuples in defining the state machine transitions.
+            max_transitions (int): Max number of transitions allowed before quiting the FSM.
+        """
+        self.name = name
+        self.events = events
+        self.max_transitions = max_transitions
+        self.logger = logging.getLogger('condoor.fsm')
+        self.table = self._compile(transitions, events)
 
     def _compile(self, transitions, events):
         compiled = {}
         for transition in transitions:
             event, states, new_state, action, timeout = transition
-            if not isinstance(states, list):
-                states = list(states)
             try:
                 event_index = events.index(event)
             except ValueError:
-                self._dbg(10, "Transition for non-existing event: {}".format(
-                    event if isinstance(event, str) else event.pattern))
+                self.logger.debug("[{}] Transition for non-existing event: {}".format(
+                    self.name, event if isinstance(event, str) else event.pattern))
             else:
                 for state in states:
-                    key = (event_index, state)
-                    compiled[key] = (new_state, action, timeout)
+                    compiled[(event_index, state)] = (new_state, action, timeout)
 
-        return compiled
+        states = [state for _, state in compiled]
+        table = [[None] * len(events) for _ in range(max(states) + 1 if states else 0)]
+        for (event_index, state), transition in compiled.items():
+            table[state][event_index] = transition
+        return table
 
-    def run(self):
+    def run(self, ctrl, init_pattern=None, timeout=300):
         """This method starts the FSM.
 
+            Args:
+                ctrl (object): Controller class representing the connection to the device
+                init_pattern (str): The pattern that was expected in the previous operation.
+                timeout (int): Timeout between states in seconds. Defaults to 300 seconds.
+
             Returns:
                 boolean: True if FSM reaches the last state or false if the exception or error message was raised
         """
-        ctx = FSM.Context(self.name, self.ctrl)
+        return run_steps(self.steps(ctrl, init_pattern=init_pattern, timeout=timeout))
+
+    def steps(self, ctrl, init_pattern=None, timeout=300):
+        """This method returns the steps generator running the FSM. The generator yields the
+        :class:`condoor.controllers.expect.Expect` requests and returns the same result as :meth:`run`.
+        """
+        ctx = FSM.Context(self.name, ctrl)
+        metrics = getattr(ctrl, 'metrics', None)
+        try:
+            result = yield self._steps(ctx, init_pattern, timeout)
+        finally:
+            if metrics is not None:
+                metrics.inc('condoor_fsm_transitions_total', ctx.transitions, fsm=self.name)
+        raise Return(result)
+
+    def _steps(self, ctx, init_pattern, timeout):
+        ctrl = ctx.ctrl
+        # the event list is compiled once for the whole FSM run
+        compile_events = getattr(ctrl, 'compile_events', None)
+        events = compile_events(self.events) if compile_events else self.events
+        # the level is checked once for the whole FSM run, the messages are not formatted if disabled
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        hook = getattr(ctrl, 'fsm_event_hook', None)
+        table = self.table
         transition_counter = 0
-        timeout = self.timeout
-        self._dbg(10, "FSM Started")
+        if debug:
+            self._dbg(ctrl, 10, "FSM Started")
         while transition_counter < self.max_transitions + 1:
             transition_counter += 1
             try:
                 start_time = time()
-                if self.init_pattern is None:
-                    ctx.event = self.ctrl.expect(self.events, timeout=timeout)
+                if init_pattern is None:
+                    ctx.event = yield Expect(ctrl, events, timeout)
                 else:
-                    if isinstance(self.init_pattern, str):
-                        self._dbg(10, "INIT_PATTERN={}".format(self.init_pattern.encode('string_escape')))
-                    elif self.init_pattern is not None:
-                        self._dbg(10, "INIT_PATTERN={}".format(self.init_pattern.pattern.encode('string_escape')))
-                    ctx.event = self.events.index(self.init_pattern)
-                    self.init_pattern = None
+                    if debug:
+                        pattern = init_pattern if isinstance(init_pattern, str) else init_pattern.pattern
+                        self._dbg(ctrl, 10, "INIT_PATTERN={}", pattern.encode('string_escape'))
+                    ctx.event = self.events.index(init_pattern)
+                    init_pattern = None
                 finish_time = time() - start_time
-                key = (ctx.event, ctx.state)
                 ctx.pattern = self.events[ctx.event]
 
-                if key in self.transition_table:
-                    transition = self.transition_table[key]
+                transition = table[ctx.state][ctx.event] if 0 <= ctx.state < len(table) else None
+                if transition is not None:
                     next_state, action, next_timeout = transition
-                    self._dbg(10, "E={},S={},T={},RT={:.2f}".format(
-                        ctx.event, ctx.state, timeout, finish_time))
+                    ctx.transitions += 1
+                    if debug:
+                        self._dbg(ctrl, 10, "E={},S={},T={},RT={:.2f}", ctx.event, ctx.state, timeout, finish_time)
+                    if hook is not None:
+                        hook(FSMEvent(ctrl.hostname, self.name, ctx.event, ctx.pattern, ctx.state, next_state,
+                                      getattr(action, '__name__', action), finish_time))
                     if callable(action):
                         if not action(ctx):
-                            self._dbg(50, "Error: {}".format(ctx.msg))
-                            return False
+                            self._dbg(ctrl, 50, "Error: {}", ctx.msg)
+                            raise Return(False)
                     elif isinstance(action, Exception):
-                        raise action
+                        # the template is reused so the exception instance is not shared between runs
+                        raise copy(action)
                     elif action is None:
-                        self._dbg(10, "No action")
+                        if debug:
+                            self._dbg(ctrl, 10, "No action")
                     else:
-                        self._dbg(40, "FSM Action is not callable: {}".format(action.__name__))
+                        self._dbg(ctrl, 40, "FSM Action is not callable: {}", action.__name__)
                         raise Exception("FSM Action is not callable")
 
                     if next_timeout != 0:  # no change if set to 0
                         timeout = next_timeout
                     ctx.state = next_state
-                    self._dbg(10, "NS={},NT={}".format(next_state, timeout))
+                    if debug:
+                        self._dbg(ctrl, 10, "NS={},NT={}", next_state, timeout)
 
                 else:
-                    self._dbg(40, "Unknown transition: EVENT={},STATE={}".format(ctx.event, ctx.state))
+                    self._dbg(ctrl, 40, "Unknown transition: EVENT={},STATE={}", ctx.event, ctx.state)
                     continue
 
             except EOF:
-                raise ConnectionError("Session closed unexpectedly", self.ctrl.hostname)
+                raise ConnectionError("Session closed unexpectedly", ctrl.hostname)
 
             if ctx.finished or next_state == -1:
-                self._dbg(10, "FSM finished at E={},S={}".format(ctx.event, ctx.state))
-                return True
+                if debug:
+                    self._dbg(ctrl, 10, "FSM finished at E={},S={}", ctx.event, ctx.state)
+                raise Return(True)
 
         else:  # check while else if even exists
-            self._dbg(40, "FSM looped. Exiting")
-            return False
-
-    def _dbg(self, level, msg):
-        self.logger.log(
-            level, "[{}]: [{}] {}".format(self.ctrl.hostname, self.name, msg)
-        )
+            self._dbg(ctrl, 40, "FSM looped. Exiting")
+            raise Return(False)
+
+    def _dbg(self, ctrl, level, msg, *args):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(
+                level, "[{}]: [{}] {}".format(ctrl.hostname, self.name, msg.format(*args) if args else msg)
+            )
@@ -35,22 +35,52 @@ from ..utils import to_list
 from ..utils import delegate
 
 from ..controllers.protocols import make_protocol
+from ..controllers.expect import EventMatcher, DEFAULT_OVERLAP, window_key
+from ..controllers.transports import SPAWN, NATIVE
+from ..controllers.transports.ssh import get_default_registry
 from ..exceptions import ConnectionError, ConnectionTimeoutError
+from ..metrics import ConnectionMetrics
 
 import pexpect
+from pexpect.expect import Expecter, searcher_string
+
+# the max number of the compiled event lists kept by the controller
+MAX_MATCHERS = 64
+
+
+def _event_key(event):
+    # the string events are compiled by pexpect with the different flags than the compiled patterns
+    if isinstance(event, basestring):
+        return 'str', event
+    if hasattr(event, 'pattern'):
+        return event.pattern, event.flags
+    return event
 
 
 # Delegate following methods to _session class
-@delegate("_session", ("expect", "expect_exact", "sendline",
+@delegate("_session", ("expect_exact", "sendline",
                        "isalive", "sendcontrol", "send", "read_nonblocking", "setecho"))
 class Controller(object):
-    def __init__(self, platform, hostname, hosts, account_manager=None, max_attempts=1, logfile=None):
+    def __init__(self, platform, hostname, hosts, account_manager=None, max_attempts=1, logfile=None,
+                 control_sockets=None, search_window=DEFAULT_OVERLAP, recorder=None, replay=None,
+                 transport=SPAWN, ssh_transports=None):
         self.hosts = to_list(hosts)
         self.max_attempts = max_attempts
         self.account_mgr = account_manager
         self.session_log = logfile
         self.hostname = hostname
         self.platform = platform
+        self.control_sockets = control_sockets  # ssh multiplexing registry
+        self.recorder = recorder  # condoor.controllers.recording.SessionRecorder
+        self.replay = replay  # condoor.controllers.recording.SessionReplay
+        self.transport = transport  # condoor.controllers.transports.SPAWN or NATIVE
+        self.ssh_transports = ssh_transports  # condoor.controllers.transports.ssh.TransportRegistry
+        self.tunnels = []  # the SSH transports to the jumphosts used by the native sessions
+        self.search_windows = {}
+        self.default_search_window = search_window
+        self._matchers = {}
+        self.fsm_event_hook = None  # called with condoor.controllers.fsm.FSMEvent for every FSM transition
+        self.metrics = getattr(platform, 'metrics', None) or ConnectionMetrics(hostname)
         self.connected = False
         self.authenticated = False
         self._session = None
@@ -58,6 +88,7 @@ class Controller(object):
         self.is_target = False
         self.last_hop = 0
         self.last_pattern = None
+        self.failed_hop = None  # the index of the hop failed by the last connect
         self.logger = logging.getLogger("condoor.controller")
         self._clear_detected_prompts()
 
@@ -85,9 +116,154 @@ class Controller(object):
     @detected_target_prompt.setter
     def detected_target_prompt(self, prompt):
         target_hop = len(self.hosts)
-        self._dbg(10, "[{}] {}: Updated target prompt: {}".format(target_hop, self.hosts[-1].hostname, prompt))
+        self._dbg(10, "[{}] {}: Updated target prompt: {}", target_hop, self.hosts[-1].hostname, prompt)
         self.detected_prompts[-1] = prompt
 
+    def expect(self, pattern, timeout=-1, searchwindowsize=-1):
+        """
+        Imitates the pexpect.spawn expect method. Only the new data and the bounded overlap
+        of the data already searched is scanned for the events.
+        See :class:`condoor.controllers.expect.EventMatcher`.
+        """
+        if timeout == -1:
+            timeout = self._session.timeout
+        matcher = pattern if isinstance(pattern, EventMatcher) else self.compile_events(pattern)
+        try:
+            return self._session.expect_loop(matcher, timeout, searchwindowsize)
+        finally:
+            self.count_received()
+
+    def expecter(self, pattern, searchwindowsize=-1, exact=False):
+        """
+        Returns the pexpect Expecter for the *pattern* events used to wait for the events without blocking.
+        The caller reads the session when its :meth:`fileno` is readable and passes the data to the Expecter.
+        See :class:`condoor.asyncconn.EventLoop`.
+        """
+        if exact:
+            searcher = searcher_string(to_list(pattern))
+        else:
+            searcher = pattern if isinstance(pattern, EventMatcher) else self.compile_events(pattern)
+        return Expecter(self._session, searcher, searchwindowsize)
+
+    def fileno(self):
+        """
+        Returns the file descriptor of the session or -1 if the session has no descriptor, i.e. the replay.
+        """
+        fd = getattr(self._session, 'child_fd', -1)
+        return -1 if fd is None else fd
+
+    def count_received(self):
+        """
+        Adds the data matched by the last expect to the 'condoor_bytes_received_total' counter.
+        """
+        received = len(self._session.before or "")
+        if isinstance(self._session.after, basestring):
+            received += len(self._session.after)
+        self.metrics.inc('condoor_bytes_received_total', received)
+
+    def spawn_session(self, command, factory=None, **kwargs):
+        """
+        Spawns the session for the first hop *command*. If the replay is set the recorded session is returned
+        instead of running the command. If the recorder is set the session data is recorded.
+        See :mod:`condoor.controllers.recording`.
+        The *factory* callable returns the in-process session used instead of spawning the command.
+        See :mod:`condoor.controllers.transports`.
+        """
+        if self.replay is not None:
+            session = self.replay.spawn(command, **kwargs)
+        elif factory is not None:
+            session = factory(**kwargs)
+        else:
+            session = pexpect.spawn(command, **kwargs)
+        if self.recorder is not None:
+            self.recorder.attach(session, command)
+        return session
+
+    def native_session(self, spawn):
+        """
+        Returns *True* if the hop session is opened in-process. The first hop session or the session through
+        the SSH tunnel to the jumphost can be opened in-process with the native transport.
+        """
+        return self.transport == NATIVE and bool(spawn or (self.tunnels and self._session is None))
+
+    def open_tunnel(self, hostname, port, username, password):
+        """
+        Opens or reuses the SSH transport to the jumphost. The next hop session is opened through the
+        direct-tcpip channel instead of the jumphost shell. The transport is not opened when replaying
+        the recorded sessions.
+        """
+        if self.replay is not None:
+            self.tunnels.append(None)
+            return
+        registry = self.ssh_transports or get_default_registry()
+        tunnel = self.tunnels[-1] if self.tunnels else None
+        self.tunnels.append(registry.acquire(hostname, port, username, password, tunnel=tunnel))
+
+    def close_tunnels(self):
+        """
+        Releases the SSH transports to the jumphosts.
+        """
+        registry = self.ssh_transports or get_default_registry()
+        while self.tunnels:
+            tunnel = self.tunnels.pop()
+            if tunnel is not None:
+                registry.release(tunnel)
+
+    def compile_events(self, events):
+        """
+        Returns the :class:`condoor.controllers.expect.EventMatcher` for the list of *events*.
+        The matcher is compiled once and reused for the same list of events.
+        """
+        events = to_list(events)
+        key = tuple(_event_key(event) for event in events)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            if len(self._matchers) >= MAX_MATCHERS:
+                self._matchers.clear()
+            patterns = self._session.compile_pattern_list(events)
+            matcher = EventMatcher(patterns, self.search_windows, self.default_search_window)
+            self._matchers[key] = matcher
+        return matcher
+
+    def set_search_window(self, pattern, window):
+        """
+        Sets the search window used by :meth:`expect` for the event *pattern*. The *window* is either the number
+        of bytes already searched to be searched again with the new data, TAIL to search the trailing line only
+        or None to search the whole buffer.
+        """
+        self.search_windows[window_key(pattern)] = window
+        self._matchers.clear()
+
+    def read(self, size, timeout):
+        """
+        Returns the data left in the session buffer by the previous expect call.
+        If the buffer is empty, reads up to *size* bytes from the session waiting for at most *timeout* seconds.
+        """
+        data = self._pending_data()
+        if data:
+            self._set_pending_data(data[size:])
+            return data[:size]
+        data = self._session.read_nonblocking(size=size, timeout=timeout)
+        self.metrics.inc('condoor_bytes_received_total', len(data))
+        return data
+
+    def unread(self, data):
+        """
+        Puts the *data* back to the session buffer for the next expect or read call.
+        """
+        self._set_pending_data(data + self._pending_data())
+
+    def _pending_data(self):
+        # pexpect 4.3+ keeps the data not consumed by expect in _before and only the search window in buffer
+        before = getattr(self._session, '_before', None)
+        return before.getvalue() if before is not None else self._session.buffer
+
+    def _set_pending_data(self, data):
+        self._session.buffer = data
+        if getattr(self._session, '_before', None) is not None:
+            self._session._before = self._session.buffer_type()
+            self._session._before.write(data)
+
     def connect(self, start_hop=0, spawn=True, detect_prompt=True):
         # it can restart from the last hop.
 
@@ -100,6 +276,7 @@ class Controller(object):
 
         hosts = self.hosts[self.last_hop:]
         host_count = len(hosts)
+        self.failed_hop = None
 
         self._dbg(10, "Restarting from hop: {}".format(start_hop))
 
@@ -113,6 +290,7 @@ class Controller(object):
             while attempt <= self.max_attempts:
                 if not host.is_reachable():
                     self._dbg(40, "[{}] {}: Host not reachable".format(hop, host.hostname))
+                    self.metrics.inc('condoor_hop_failures_total', hop=hop, host=host.hostname)
                 else:
                     self._dbg(
                         10,
@@ -125,30 +303,44 @@ class Controller(object):
                             self._dbg(10, "[{}] {}: Connecting to jump host".format(hop, host.hostname))
 
                         protocol = make_protocol(self, host, spawn, self.account_mgr, self.session_log)
-                        if protocol.connect():
-                            if protocol.authenticate(self.detected_prompts[hop]):
+                        labels = {'hop': hop, 'host': host.hostname, 'protocol': host.protocol}
+                        with self.metrics.timer('condoor_hop_connect_seconds', **labels):
+                            opened = protocol.connect()
+                        if opened:
+                            with self.metrics.timer('condoor_hop_authenticate_seconds', **labels):
+                                authenticated = protocol.authenticate(self.detected_prompts[hop])
+                            if authenticated:
                                 connected = True
                                 if detect_prompt:
-                                    if not protocol.detect_prompt():
-                                        connected = False
+                                    with self.metrics.timer('condoor_prompt_detection_seconds', **labels):
+                                        if not protocol.detect_prompt():
+                                            connected = False
                         else:
                             connected = False
                     except ConnectionTimeoutError as e:
                         self._dbg(40, "Error during connecting to device: {}".format(e.message))
+                        self.metrics.inc('condoor_timeouts_total', phase='connect')
+                        self.metrics.inc('condoor_hop_failures_total', hop=hop, host=host.hostname)
+                        self.failed_hop = hop - 1
                         self.disconnect()
                         raise
                     except Exception as e:
                         self._dbg(40, "Error during connecting to device: {}".format(e.message))
+                        self.metrics.inc('condoor_hop_failures_total', hop=hop, host=host.hostname)
+                        self.failed_hop = hop - 1
                         raise
 
                     if connected:
                         self.detected_prompts[hop] = protocol.prompt
                         break
+                    self.metrics.inc('condoor_hop_failures_total', hop=hop, host=host.hostname)
 
                 attempt += 1
-                sleep(2)
+                if attempt <= self.max_attempts:
+                    sleep(2)
             else:
                 self._dbg(40, "[{}] {}: Connection error. ""Max attempts reached.".format(hop, host.hostname))
+                self.failed_hop = hop - 1
                 self.disconnect()
                 raise ConnectionError(host=self.hostname)
 
@@ -167,10 +359,14 @@ class Controller(object):
         self._dbg(10, "Initializing the disconnection process")
         if self._session and self.isalive():
             self._dbg(10, "Disconnecting the sessions")
-            self.sendline('\x04')
-            self.sendline('\x03')
-            self.sendcontrol(']')
-            self.sendline('quit')
+            try:
+                self.sendline('\x04')
+                self.sendline('\x03')
+                self.sendcontrol(']')
+                self.sendline('quit')
+            except pexpect.EOF:
+                # the in-process session is closed by the device
+                pass
 
             # self._dbg(10, "Disconnecting the sessions")
             # index = 0
@@ -192,14 +388,18 @@ class Controller(object):
             #
             #     hop += 1
 
-        self._session.close()
+        if self._session:
+            self._session.close()
+        self.close_tunnels()
         self._dbg(10, "Disconnected")
         self.last_hop = 0
         self.last_pattern = None
         self.connected = False
 
-    def _dbg(self, level, msg):
-        self.logger.log(level, "[{}]: [CTRL] {}".format(self.hostname, msg))
+    def _dbg(self, level, msg, *args):
+        # the message is formatted only if the level is enabled
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "[{}]: [CTRL] {}".format(self.hostname, msg.format(*args) if args else msg))
 
     def _clear_detected_prompts(self):
         self.detected_prompts = []
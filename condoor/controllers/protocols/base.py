@@ -65,6 +65,47 @@ UNABLE_TO_CONNECT = "nodename nor servname provided, or not known|" \
                     "[U|u]nable to connect|" \
                     "[C|c]onnection refused"
 
+# the chunk size used for reading the prompt
+PROMPT_READ_CHUNK = 1024
+# the time without any data after which the stale output is considered flushed
+FLUSH_TIMEOUT = 0.1
+# the max time spent on flushing the stale output
+FLUSH_TOTAL_TIMEOUT = 2
+# the terminal echo of the new line sent for the next prompt, i.e. "router#^J"
+_NEWLINE_ECHO = re.compile(r"(\^[JM])+")
+# the prompts end with one of these characters, the banner lines usually don't
+_PROMPT_END = re.compile(r"[#>$%:\]]$")
+_MAX_PROMPT_LENGTH = 80
+
+
+def _trailing_lines(data):
+    lines = (_NEWLINE_ECHO.sub("", line).strip() for line in data.splitlines())
+    return [line for line in lines if line]
+
+
+def _is_prompt_like(line):
+    return len(line) <= _MAX_PROMPT_LENGTH and _PROMPT_END.search(line) is not None
+
+
+def _same_trailing_lines(data):
+    lines = _trailing_lines(data)
+    return len(lines) > 1 and lines[-1] == lines[-2] and _is_prompt_like(lines[-1])
+
+
+def _is_full_match(pattern, text):
+    match = re.match(pattern, text)
+    return match is not None and match.end() == len(text)
+
+
+def _prompt_received(known_prompts):
+    # returns the stop condition for reading the responses to the new lines
+    def stop(data):
+        if _same_trailing_lines(data):
+            return True
+        lines = _trailing_lines(data)
+        return bool(lines) and any(_is_full_match(pattern, lines[-1]) for pattern in known_prompts)
+    return stop
+
 
 class Protocol(object):
 
@@ -87,7 +128,7 @@ class Protocol(object):
         self.last_pattern = None
         self.logger = logging.getLogger("condoor.controller.protocol")
 
-    def _spawn_session(self, command):
+    def _spawn_session(self, command, factory=None):
         self._dbg(10, "Executing command: '{}'".format(command))
         if self.ctrl._session and self.ctrl.isalive():
             try:
@@ -102,8 +143,9 @@ class Protocol(object):
 
         else:
             try:
-                self.ctrl._session = pexpect.spawn(
+                self.ctrl._session = self.ctrl.spawn_session(
                     command,
+                    factory=factory,
                     maxread=50000,
                     searchwindowsize=None,
                     echo=True  # KEEP YOUR DIRTY HANDS OFF FROM ECHO!
@@ -140,6 +182,59 @@ class Protocol(object):
         """
         raise NotImplementedError("Authentication method not implemented")
 
+    def read_until_quiet(self, first_timeout, quiet_timeout, total_timeout, stop=None):
+        """
+        This reads the data from the session in chunks until nothing is received within *quiet_timeout*
+        or *stop* callable returns True for the data collected so far.
+
+        Args:
+            first_timeout (float): Maximum time allowed to receive the first non cr/lf data.
+            quiet_timeout (float): Maximum time allowed between subsequent chunks.
+            total_timeout (float): Maximum time for reading.
+            stop (callable): Optional callable getting the data read so far and returning True if reading
+                should finish without waiting for *quiet_timeout*.
+
+        Returns:
+            The data read from the session.
+        """
+        data = ""
+        begin = time.time()
+        timeout = first_timeout
+        while time.time() - begin < total_timeout:
+            try:
+                data += self.ctrl.read_nonblocking(size=PROMPT_READ_CHUNK, timeout=timeout)
+            except pexpect.TIMEOUT:
+                break
+            except pexpect.EOF:
+                raise ConnectionError('Session disconnected')
+
+            # \r=0x0d CR \n=0x0a LF
+            if data.strip("\r\n"):  # omit the cr/lf sent to get the prompt
+                timeout = quiet_timeout
+            if stop is not None and stop(data):
+                break
+        return data
+
+    def flush(self, quiet_timeout=FLUSH_TIMEOUT, total_timeout=FLUSH_TOTAL_TIMEOUT):
+        """
+        This discards the output left in the session, i.e. the banner or the login messages, including
+        the data buffered by the previous expect. The reading finishes when nothing is received
+        within *quiet_timeout* or after *total_timeout*.
+
+        Returns:
+            The discarded data.
+        """
+        data = ""
+        begin = time.time()
+        while time.time() - begin < total_timeout:
+            try:
+                data += self.ctrl.read(PROMPT_READ_CHUNK, quiet_timeout)
+            except pexpect.TIMEOUT:
+                break
+            except pexpect.EOF:
+                raise ConnectionError('Session disconnected')
+        return data
+
     def try_read_prompt(self, timeout_multiplier):
         """
         based on try_read_prompt from pxssh.py
@@ -154,33 +249,7 @@ class Protocol(object):
         # maximum time for reading the entire prompt
         total_timeout = timeout_multiplier * 4
 
-        prompt = ""
-        begin = time.time()
-        expired = 0.0
-        timeout = first_char_timeout
-
-        while expired < total_timeout:
-            try:
-                p = self.ctrl.read_nonblocking(size=1, timeout=timeout)
-                # \r=0x0d CR \n=0x0a LF
-                if p not in ['\n', '\r']:  # omit the cr/lf sent to get the prompt
-                    timeout = inter_char_timeout
-                expired = time.time() - begin
-                prompt += p
-            except pexpect.TIMEOUT:
-                break
-            except pexpect.EOF:
-                raise ConnectionError('Session disconnected')
-
-        #  print("expired:{},total:{}".format(expired, total_timeout))
-        #  print(":".join("{:02x}".format(ord(c)) for c in prompt))
-        #  print("RAW: {}".format(repr(prompt)))
-        #  print prompt.split('\r')
-        #  print prompt.strip()
-        #  prompt = prompt.split('\r')[-1].strip()
-        prompt = prompt.strip()
-        #  print("PROMPT: '%s'" % prompt)
-        return prompt
+        return self.read_until_quiet(first_char_timeout, inter_char_timeout, total_timeout).strip()
 
     def levenshtein_distance(self, a, b):
         """
@@ -208,18 +277,21 @@ class Protocol(object):
 
     def detect_prompt(self, sync_multiplier=4):
         """
-        This attempts to find the prompt. Basically, press enter and record
-        the response; press enter again and record the response; if the two
-        responses are similar then assume we are at the original prompt.
-        This can be a slow function. Worst case with the default sync_multiplier
-        can take 16 seconds. Low latency connections are more likely to fail
-        with a low sync_multiplier. Best case sync time gets worse with a
-        high sync multiplier (500 ms with default).
+        This attempts to find the prompt. Basically, the stale output is discarded, then press enter twice
+        and record the response. The reading finishes as soon as the last line fully matches one of
+        the known target device prompt patterns or the last two lines are identical, which takes single
+        round trip time. Otherwise, when the reading times out, the last two lines are compared
+        for similarity. Worst case with the default sync_multiplier can take 16 seconds per attempt.
+        Low latency connections are more likely to fail with a low sync_multiplier.
 
         """
-        self.ctrl.sendline()
-        self.try_read_prompt(sync_multiplier)
+        known_prompts = self._known_prompts()
+        stop = _prompt_received(known_prompts)
+        stale = self.flush()
+        if stale:
+            self._dbg(10, "Discarded the stale output: '{}'".format(repr(stale)))
 
+        received = ""
         attempt = 0
         max_attempts = 10
         while attempt < max_attempts:
@@ -227,29 +299,53 @@ class Protocol(object):
             self._dbg(10, "Detecting prompt. Attempt ({}/{})".format(attempt, max_attempts))
 
             self.ctrl.sendline()
-            a = self.try_read_prompt(sync_multiplier)
-
             self.ctrl.sendline()
-            b = self.try_read_prompt(sync_multiplier)
+            data = self.read_until_quiet(
+                sync_multiplier * 2, sync_multiplier * 0.4, sync_multiplier * 4, stop=stop)
+            received += data
 
-            ld = self.levenshtein_distance(a, b)
-            len_a = len(a)
-            self._dbg(10, "LD={},MP={}".format(ld, sync_multiplier))
+            lines = _trailing_lines(data)
             sync_multiplier *= 1.2
-            if len_a == 0:
+            if not lines:
                 continue
 
-            if float(ld)/len_a < 0.3:
-                self.prompt = b.splitlines(True)[-1]
-                self._dbg(10, "Detected prompt: '{}'".format(self.prompt))
-                compiled_prompt = re.compile("(\r\n|\n\r){}".format(re.escape(self.prompt)))
-                self._dbg(10, "Compiled prompt: '{}".format(repr(compiled_prompt.pattern)))
-                self.ctrl.sendline()
-                self.ctrl.expect(compiled_prompt)  # match from new line
-                return True
+            prompt = lines[-1]
+            if any(_is_full_match(pattern, prompt) for pattern in known_prompts):
+                self._dbg(10, "Prompt matches the known pattern")
+            elif len(lines) > 1 and lines[-2] == prompt and _is_prompt_like(prompt):
+                self._dbg(10, "Prompt repeated")
+            elif len(lines) > 1:
+                ld = self.levenshtein_distance(lines[-2], prompt)
+                self._dbg(10, "LD={},MP={}".format(ld, sync_multiplier))
+                if float(ld) / len(lines[-2]) >= 0.3:
+                    continue
+            else:
+                continue
+
+            self.prompt = prompt
+            self._dbg(10, "Detected prompt: '{}'".format(self.prompt))
+            # the terminal echo of the new lines can be interleaved with the prompt
+            compiled_prompt = re.compile(r"(\r\n|\n\r)({})?{}".format(_NEWLINE_ECHO.pattern, re.escape(self.prompt)))
+            self._dbg(10, "Compiled prompt: '{}".format(repr(compiled_prompt.pattern)))
+            # the responses to the new lines not read yet are consumed together with the last one
+            pending = max(0, 2 * attempt - received.count(self.prompt))
+            self.ctrl.sendline()
+            for _ in xrange(pending + 1):
+                if self.ctrl.expect([compiled_prompt, pexpect.TIMEOUT], timeout=sync_multiplier * 2) == 1:
+                    break
+            return True
 
         return False
 
+    def _known_prompts(self):
+        # the platform prompt patterns are meaningful only for the target device
+        if not self.ctrl.is_target:
+            return []
+        platform = self.ctrl.platform
+        prompts = [platform.platform_prompt]
+        prompts.extend(getattr(platform, 'known_prompts', []))
+        return prompts
+
     def _acquire_password(self):
         password = self.password
         if not password:
@@ -30,6 +30,7 @@
 from base import *
 import pexpect
 from ..fsm import FSM, action
+from ..transports import ssh as ssh_transport
 
 from ...exceptions import \
     ConnectionAuthenticationError, \
@@ -48,22 +49,40 @@ class SSH(Protocol):
     def __init__(self, controller, device, spawn, account_manager, logfile):
         super(SSH, self).__init__(controller, device, account_manager, logfile)
 
+        # the session can be opened in-process if paramiko is installed. The jumphost is used as the tunnel
+        self.native = self.ctrl.native_session(spawn) and ssh_transport.is_available()
+        self.tunnel = self.native and not self.ctrl.is_target
+        # only the local ssh client can use the control sockets
+        self.multiplexing = spawn and not self.native and self.ctrl.control_sockets is not None
         command = self._get_command()
-        if spawn:
+        if self.tunnel:
+            self._dbg(10, "Opening the SSH tunnel")
+            # the tunnel has no shell prompt. Same as the local host (hop 0)
+            self.prompt = self.ctrl.detected_prompts[0]
+            self.ctrl.open_tunnel(self.hostname, self.port, self.username, self.password)
+        elif self.native:
+            self._spawn_session(command, factory=self._open_session)
+        elif spawn:
             self._spawn_session(command)
 
     def _get_command(self, version=2):
+        options = "-o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
+        if self.multiplexing and version == 2:
+            options += " " + self.ctrl.control_sockets.options(self.username, self.hostname, self.port)
+
         if self.username:
-            command = "ssh -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no -{} -p {} {}@{}".format(
-                version, self.port, self.username, self.hostname
+            command = "ssh {} -{} -p {} {}@{}".format(
+                options, version, self.port, self.username, self.hostname
             )
         else:
-            command = "ssh -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no -{} -p {} {}".format(
-                version, self.port, self.hostname
+            command = "ssh {} -{} -p {} {}".format(
+                options, version, self.port, self.hostname
             )
         return command
 
     def connect(self):
+        if self.tunnel:
+            return True
 
         if self.ctrl.is_target:
             prompt = self.ctrl.platform.platform_prompt
@@ -103,6 +122,9 @@ class SSH(Protocol):
         return sm.run()
 
     def authenticate(self, prompt=None):
+        if self.tunnel:
+            return True
+
         if self.ctrl.is_target:
             prompt = self.ctrl.platform.prompt
             rommon_prompt = self.ctrl.platform.rommon_prompt
@@ -136,9 +158,26 @@ class SSH(Protocol):
         self.try_read_prompt(1)
         return True
 
+    def detect_prompt(self, sync_multiplier=4):
+        if self.tunnel:
+            return True
+        return super(SSH, self).detect_prompt(sync_multiplier)
+
     def disconnect(self):
+        if self.tunnel:
+            return
+        if self.native:
+            self.ctrl._session.close()
+            return
         self.ctrl.sendline('\x03')
 
+    def _open_session(self, **kwargs):
+        # the session through the SSH tunnel to the jumphost uses the direct-tcpip channel
+        tunnel = self.ctrl.tunnels[-1] if self.ctrl.tunnels else None
+        sock = ssh_transport.open_channel(tunnel, self.hostname, self.port) if tunnel else None
+        client = ssh_transport.open_client(self.hostname, self.port, self.username, self.password, sock=sock)
+        return ssh_transport.SSHSession(client, **kwargs)
+
     @action
     def send_yes(self, ctx):
         ctx.ctrl.sendline("yes")
@@ -150,7 +189,8 @@ class SSH(Protocol):
         self._spawn_session(command)
         return True
 
-    def _dbg(self, level, msg):
-        self.logger.log(
-            level, "[{}]: [SSH]: {}".format(self.ctrl.hostname, msg)
-        )
\ No newline at end of file
+    def _dbg(self, level, msg, *args):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(
+                level, "[{}]: [SSH]: {}".format(self.ctrl.hostname, msg.format(*args) if args else msg)
+            )
\ No newline at end of file
@@ -0,0 +1,133 @@
+# =============================================================================
+# sshmux
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import atexit
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+
+class ControlSocketRegistry(object):
+    """This class keeps track of the OpenSSH control sockets (ControlMaster/ControlPersist) shared by the SSH
+    sessions spawned by condoor. The first connection to the host sets up the persistent master connection and
+    next connections to the same host, port and user reuse it without the key exchange and authentication.
+
+    The master connection exits on its own after *persist* seconds of inactivity. The :meth:`expire` method
+    removes such sockets from the registry and :meth:`cleanup` closes all the master connections. The
+    :meth:`cleanup` is called automatically on the interpreter exit.
+    """
+
+    def __init__(self, directory=None, persist=600):
+        """This is a class constructor.
+
+        Args:
+            directory (str): Directory for the control sockets. If *None* a private temporary directory is created.
+                The path should be short as the unix socket path length is limited.
+            persist (int): Time in seconds the idle master connection stays open. Defaults to 600s.
+        """
+        self._tmp_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="condoor-ssh-")
+        self.persist = persist
+        self.logger = logging.getLogger("condoor.controller.protocol")
+        self._sockets = {}
+        self._lock = threading.Lock()
+        atexit.register(self.cleanup)
+
+    def options(self, username, hostname, port):
+        """Returns the ssh command line options for the connection to the *hostname*."""
+        path = self.control_path(username, hostname, port)
+        return "-o ControlMaster=auto -o ControlPath={} -o ControlPersist={}".format(path, self.persist)
+
+    def control_path(self, username, hostname, port):
+        """Returns the control socket path for the connection and marks it as recently used."""
+        key = (username, hostname, port)
+        name = hashlib.md5("{}@{}:{}".format(*key)).hexdigest()[:16]
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory, 0700)
+            self.expire()
+            if key not in self._sockets:
+                self.logger.debug("SSH control socket for {}@{}:{}: {}".format(username, hostname, port, path))
+            self._sockets[key] = (path, time.time())
+        return path
+
+    def is_active(self, username, hostname, port):
+        """Returns *True* if the master connection for the host is expected to be alive."""
+        with self._lock:
+            entry = self._sockets.get((username, hostname, port))
+        if entry is None:
+            return False
+        path, last_used = entry
+        return os.path.exists(path) and time.time() - last_used < self.persist
+
+    def expire(self):
+        """Removes the sockets idle for longer than *persist* seconds. The master connections already exited."""
+        now = time.time()
+        for key, (path, last_used) in self._sockets.items():
+            if now - last_used >= self.persist:
+                self.logger.debug("SSH control socket expired: {}".format(path))
+                del self._sockets[key]
+
+    def cleanup(self):
+        """Closes all the master connections and removes the sockets."""
+        with self._lock:
+            sockets, self._sockets = self._sockets, {}
+
+        for (username, hostname, port), (path, _) in sockets.items():
+            if not os.path.exists(path):
+                continue
+            target = "{}@{}".format(username, hostname) if username else hostname
+            try:
+                with open(os.devnull, "w") as devnull:
+                    subprocess.call(["ssh", "-O", "exit", "-o", "ControlPath={}".format(path), "-p", str(port),
+                                     target], stdout=devnull, stderr=devnull)
+            except OSError:
+                pass
+
+        if self._tmp_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Returns the process wide :class:`ControlSocketRegistry`."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = ControlSocketRegistry()
+        return _default_registry
@@ -29,6 +29,8 @@
 
 from base import *
 from ..fsm import FSM, action
+from ..transports.telnet import TelnetSession
+from ..transports.ssh import open_channel
 
 from ...exceptions import \
     ConnectionError, \
@@ -49,7 +51,11 @@ class Telnet(Protocol):
         command = "telnet {} {}".format(
             self.hostname, self.port
         )
-        if spawn:
+        # the session can be opened in-process instead of spawning the telnet client
+        self.native = self.ctrl.native_session(spawn)
+        if self.native:
+            self._spawn_session(command, factory=self._open_session)
+        elif spawn:
             self._spawn_session(command)
 
     def connect(self):
@@ -152,11 +158,21 @@ class Telnet(Protocol):
         ctx.failed = True
         return False
 
+    def _open_session(self, **kwargs):
+        # the session through the SSH tunnel to the jumphost uses the direct-tcpip channel
+        tunnel = self.ctrl.tunnels[-1] if self.ctrl.tunnels else None
+        sock = open_channel(tunnel, self.hostname, self.port) if tunnel else None
+        return TelnetSession(self.hostname, self.port, sock=sock, **kwargs)
+
     def disconnect(self):
+        if self.native:
+            self.ctrl._session.close()
+            return
         self.ctrl.sendcontrol(']')
         self.ctrl.sendline('quit')
 
-    def _dbg(self, level, msg):
-        self.logger.log(
-            level, "[{}]: [TELNET]: {}".format(self.ctrl.hostname, msg)
-        )
\ No newline at end of file
+    def _dbg(self, level, msg, *args):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(
+                level, "[{}]: [TELNET]: {}".format(self.ctrl.hostname, msg.format(*args) if args else msg)
+            )
\ No newline at end of file
@@ -0,0 +1,400 @@
+# =============================================================================
+# recording
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""The recording of the device sessions and the replay transport.
+
+The :class:`SessionRecorder` stores every chunk of data read from and written to the session together with the time
+elapsed since the session was spawned. The :class:`SessionReplay` spawns the :class:`ReplaySession` objects
+feeding the recorded data back to the controller instead of running the telnet or ssh client. This allows to
+re-run the discovery, the commands and the custom FSMs without the devices either at full speed or at the original
+pace of the device.
+
+The recording is the text file with one JSON document per line. The first line is the header and every next line is
+the event list: ``["spawn", time, command]``, ``["read", time, data]``, ``["write", time, data]``,
+``["timeout", time]`` or ``["eof", time]``. The data is stored as latin-1 decoded text. The write answering
+the password prompt is stored as ``["write", time, "***", length]``, so the credentials are not kept in the file.
+"""
+
+import json
+import re
+import time
+import logging
+import threading
+
+import pexpect
+from pexpect.spawnbase import SpawnBase
+
+RECORDING_VERSION = 1
+
+SPAWN = 'spawn'
+READ = 'read'
+WRITE = 'write'
+TIMEOUT = 'timeout'
+EOF = 'eof'
+
+# replay timing modes
+FAST = 'fast'
+ORIGINAL = 'original'
+
+# the data written after the prompt matching the pattern is redacted
+SECRET_PROMPT = re.compile(r"(?i)(password|passphrase|secret)[^\r\n]*:\s*$")
+REDACTED = '***'
+# the redacted characters replayed match any character sent
+_REDACTED_CHAR = '\x00'
+# the length of the data read kept for matching the secret prompt
+_PROMPT_TAIL = 256
+
+_CONTROL_CHARACTERS = {'@': 0, '`': 0, '[': 27, '\\': 28, ']': 29, '^': 30, '_': 31, '?': 127}
+
+logger = logging.getLogger("condoor.recording")
+
+
+def _control_byte(char):
+    """Returns the byte sent by the pexpect sendcontrol for *char*."""
+    char = char.lower()
+    if 'a' <= char <= 'z':
+        return chr(ord(char) - ord('a') + 1)
+    return chr(_CONTROL_CHARACTERS.get(char, 0))
+
+
+def _matches(sent, recorded):
+    """Returns *True* if the *sent* data starts with the *recorded* data."""
+    return len(sent) >= len(recorded) and all(r == _REDACTED_CHAR or c == r for c, r in zip(sent, recorded))
+
+
+class SessionRecorder(object):
+    """Records the timestamped data read from and written to the sessions."""
+
+    def __init__(self, filename):
+        """The class constructor.
+
+        Args:
+            filename (str): The path to the recording file. The file is overwritten.
+        """
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._file = open(filename, 'w', 1)
+        self._write_line({'version': RECORDING_VERSION, 'start': self._start})
+
+    def attach(self, session, command):
+        """Starts recording the *session* spawned for *command*.
+
+        The session methods reading and writing the data are replaced with the recording wrappers.
+        The data written when the data read ends with the password prompt is redacted.
+
+        Args:
+            session (pexpect.spawn): The session object.
+            command (str): The command the session was spawned for.
+
+        Returns:
+            The *session* object.
+        """
+        self._event(SPAWN, command)
+        read_nonblocking = session.read_nonblocking
+        send = session.send
+        sendcontrol = session.sendcontrol
+        received = {'tail': ''}
+
+        def recorded_read_nonblocking(size=1, timeout=-1):
+            try:
+                data = read_nonblocking(size, timeout)
+            except pexpect.TIMEOUT:
+                self._event(TIMEOUT)
+                raise
+            except pexpect.EOF:
+                self._event(EOF)
+                raise
+            self._event(READ, data)
+            received['tail'] = (received['tail'] + data)[-_PROMPT_TAIL:]
+            return data
+
+        def recorded_send(s):
+            if SECRET_PROMPT.search(received['tail']):
+                self._event(WRITE, REDACTED, len(s))
+            else:
+                self._event(WRITE, s)
+            received['tail'] = ''
+            return send(s)
+
+        def recorded_sendcontrol(char):
+            self._event(WRITE, _control_byte(char))
+            return sendcontrol(char)
+
+        session.read_nonblocking = recorded_read_nonblocking
+        session.send = recorded_send
+        session.sendcontrol = recorded_sendcontrol
+        return session
+
+    def close(self):
+        """Closes the recording file."""
+        with self._lock:
+            self._file.close()
+
+    def _event(self, kind, data=None, length=None):
+        event = [kind, round(time.time() - self._start, 6)]
+        if data is not None:
+            event.append(data.decode('latin-1') if isinstance(data, str) else data)
+        if length is not None:
+            event.append(length)
+        self._write_line(event)
+
+    def _write_line(self, document):
+        line = json.dumps(document) + '\n'
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+
+def load_recording(filename):
+    """Loads the sessions from the recording file.
+
+    Args:
+        filename (str): The path to the recording file.
+
+    Returns:
+        The list of (command, events) tuples, one for every recorded session. The events are the (kind, time, data)
+        tuples with the time relative to the session spawn. The data of the redacted write matches any data
+        of the same length sent during the replay.
+
+    Raises:
+        ValueError: If the file is not a valid recording.
+    """
+    sessions = []
+    with open(filename) as f:
+        header = json.loads(f.readline() or 'null')
+        if not isinstance(header, dict) or header.get('version') != RECORDING_VERSION:
+            raise ValueError("Not a session recording: {}".format(filename))
+
+        events = None
+        spawned = 0
+        for line in f:
+            event = json.loads(line)
+            kind, timestamp = event[0], event[1]
+            data = event[2].encode('latin-1') if len(event) > 2 else None
+            if len(event) > 3:
+                data = _REDACTED_CHAR * event[3]
+            if kind == SPAWN:
+                events = []
+                spawned = timestamp
+                sessions.append((data, events))
+            elif events is not None:
+                events.append((kind, timestamp - spawned, data))
+    return sessions
+
+
+class ReplaySession(SpawnBase):
+    """The session object feeding the recorded data back to the controller.
+
+    The recorded data is returned by :meth:`read_nonblocking` only after the data written before it during the
+    recording is sent again, so the replay follows the same conversation as the original session.
+    """
+
+    def __init__(self, command, events, timing=FAST, maxread=2000, searchwindowsize=None, **kwargs):
+        """The class constructor.
+
+        Args:
+            command (str): The command the session was spawned for.
+            events (list): The recorded (kind, time, data) event tuples.
+            timing (str): Either 'fast' to replay the data at once or 'original' to keep the recorded delays.
+            maxread (int): See the pexpect.spawn.
+            searchwindowsize (int): See the pexpect.spawn.
+        """
+        super(ReplaySession, self).__init__(maxread=maxread, searchwindowsize=searchwindowsize)
+        self.command = command
+        self.name = '<replay {}>'.format(command)
+        self.timing = timing
+        self.delayafterread = None
+        self.closed = False
+        self._events = events
+        self._index = 0
+        self._pending = ''
+        self._sent = ''
+        self._expected = ''
+        # the wall clock time and the recording time of the last event the replay was synchronized at
+        self._anchor = (time.time(), 0.0)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Returns up to *size* bytes of the recorded data.
+
+        Raises:
+            pexpect.TIMEOUT: If the timeout was recorded or the recording expects the data to be sent first.
+            pexpect.EOF: If the end of the recording is reached.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+
+        if not self._pending:
+            self._consume_writes()
+            event = self._next_event()
+            if event is None or event[0] == EOF:
+                self._index += 1
+                self.flag_eof = True
+                raise pexpect.EOF("End of the recorded session")
+
+            kind, timestamp, data = event
+            if kind == WRITE:
+                # the device waits for the data which is not sent yet
+                if self.timing == ORIGINAL and timeout:
+                    time.sleep(timeout)
+                raise pexpect.TIMEOUT("Timeout waiting for the recorded data")
+
+            if not self._wait(timestamp, timeout):
+                raise pexpect.TIMEOUT("Timeout waiting for the recorded data")
+            self._index += 1
+            if kind == TIMEOUT:
+                raise pexpect.TIMEOUT("Recorded timeout")
+            self._pending = data
+
+        data, self._pending = self._pending[:size], self._pending[size:]
+        self._log(data, 'read')
+        return data
+
+    def send(self, s):
+        """Sends the data to the replayed session. The data is compared with the recorded data."""
+        self._log(s, 'send')
+        self._sent += s
+        self._consume_writes()
+        return len(s)
+
+    def sendline(self, s=''):
+        """Sends the data followed by the line separator."""
+        return self.send(s + self.linesep)
+
+    def sendcontrol(self, char):
+        """Sends the control character."""
+        return self.send(_control_byte(char))
+
+    def write(self, s):
+        """Sends the data to the replayed session."""
+        self.send(s)
+
+    def isalive(self):
+        """Returns False if the end of the recorded session is reached."""
+        return not (self.closed or self.flag_eof)
+
+    def close(self, force=True):
+        """Closes the replayed session."""
+        self.closed = True
+
+    def terminate(self, force=False):
+        """Closes the replayed session."""
+        self.close()
+        return True
+
+    def setecho(self, state):
+        """The echo is part of the recording."""
+        pass
+
+    def getwinsize(self):
+        """Returns the terminal size set by the condoor protocols."""
+        return 24, 160
+
+    def setwinsize(self, rows, cols):
+        """The terminal size is part of the recording."""
+        pass
+
+    def _next_event(self):
+        return self._events[self._index] if self._index < len(self._events) else None
+
+    def _consume_writes(self):
+        # consume the recorded writes already sent again by the client
+        event = self._next_event()
+        while event is not None and event[0] == WRITE:
+            self._expected += event[2]
+            if len(self._expected) > len(self._sent):
+                self._expected = self._expected[:-len(event[2])]
+                break
+            self._index += 1
+            self._anchor = (time.time(), event[1])
+            event = self._next_event()
+
+        if self._expected:
+            if not _matches(self._sent, self._expected):
+                logger.debug("Replay of '{}' diverged from the recording: sent {!r}, recorded {!r}".format(
+                    self.command, self._sent[:len(self._expected)], self._expected))
+            self._sent = self._sent[len(self._expected):]
+            self._expected = ''
+
+    def _wait(self, timestamp, timeout):
+        # keep the recorded delay between the last synchronization point and the event
+        if self.timing != ORIGINAL:
+            return True
+        now, recorded = self._anchor
+        delay = now + timestamp - recorded - time.time()
+        if delay > 0:
+            if timeout is not None and delay > timeout:
+                time.sleep(timeout)
+                return False
+            time.sleep(delay)
+        self._anchor = (time.time(), timestamp)
+        return True
+
+
+class SessionReplay(object):
+    """Replays the recorded sessions. Every spawned session is the next session from the recording."""
+
+    def __init__(self, filename, timing=FAST):
+        """The class constructor.
+
+        Args:
+            filename (str): The path to the recording file created by :class:`SessionRecorder`.
+            timing (str): Either 'fast' to replay the data at once or 'original' to keep the recorded delays.
+
+        Raises:
+            ValueError: If the timing is unknown or the file is not a valid recording.
+        """
+        if timing not in (FAST, ORIGINAL):
+            raise ValueError("Unknown replay timing: {}".format(timing))
+        self.filename = filename
+        self.timing = timing
+        self._sessions = load_recording(filename)
+        self._lock = threading.Lock()
+
+    def spawn(self, command, **kwargs):
+        """Returns the :class:`ReplaySession` object for the next recorded session.
+
+        Args:
+            command (str): The command to spawn. It is compared with the recorded command.
+            kwargs: The pexpect.spawn keyword arguments.
+
+        Returns:
+            The :class:`ReplaySession` object.
+
+        Raises:
+            pexpect.EOF: If there is no more sessions in the recording.
+        """
+        with self._lock:
+            if not self._sessions:
+                raise pexpect.EOF("No more sessions in the recording")
+            recorded_command, events = self._sessions.pop(0)
+        if recorded_command != command:
+            logger.debug("Replaying '{}' for '{}'".format(recorded_command, command))
+        kwargs.pop('echo', None)
+        return ReplaySession(recorded_command, events, timing=self.timing, **kwargs)
@@ -0,0 +1,315 @@
+# =============================================================================
+# ssh
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""The in-process SSH client session based on paramiko. The paramiko is optional. If not installed the ssh
+client is spawned as with the 'spawn' transport.
+"""
+
+import atexit
+import socket
+import logging
+import threading
+import time
+
+import pexpect
+from pexpect.spawnbase import SpawnBase
+
+from ...exceptions import ConnectionError, ConnectionAuthenticationError, ConnectionTimeoutError
+
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+
+logger = logging.getLogger("condoor.transports.ssh")
+
+
+def is_available():
+    """Returns *True* if the paramiko is installed."""
+    return paramiko is not None
+
+
+def open_client(hostname, port, username, password, sock=None, timeout=30):
+    """Opens the SSH connection and authenticates the user. The host key is not verified as with the
+    StrictHostKeyChecking=no option of the ssh client.
+
+    Args:
+        hostname (str): The hostname or IP address.
+        port (int): The TCP port.
+        username (str): The username.
+        password (str): The password. The keys from the ssh agent and ~/.ssh are tried as well.
+        sock (object): The socket like object, i.e. the direct-tcpip channel used instead of the new TCP
+            connection.
+        timeout (float): The TCP connection, SSH banner and authentication timeout in seconds.
+
+    Returns:
+        The paramiko.SSHClient object.
+
+    Raises:
+        ConnectionAuthenticationError: If the authentication failed.
+        ConnectionTimeoutError: If the connection timed out.
+        ConnectionError: If the connection can not be established.
+    """
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(hostname, port=int(port), username=username, password=password, sock=sock,
+                       timeout=timeout, banner_timeout=timeout, auth_timeout=timeout)
+    except paramiko.AuthenticationException as e:
+        client.close()
+        raise ConnectionAuthenticationError("Authentication error: {}".format(e), hostname)
+    except socket.timeout:
+        client.close()
+        raise ConnectionTimeoutError("Connection timeout", hostname)
+    except (socket.error, paramiko.SSHException, EOFError) as e:
+        client.close()
+        raise ConnectionError("Unable to connect: {}".format(e), hostname)
+    return client
+
+
+def open_channel(transport, hostname, port, timeout=30):
+    """Opens the direct-tcpip channel to *hostname* and *port* through the SSH *transport*.
+
+    Raises:
+        ConnectionError: If the channel can not be opened.
+    """
+    try:
+        return transport.open_channel('direct-tcpip', (hostname, int(port)), ('127.0.0.1', 0), timeout=timeout)
+    except (socket.error, paramiko.SSHException, EOFError) as e:
+        raise ConnectionError("Unable to connect: {}".format(e), hostname)
+
+
+class SSHSession(SpawnBase):
+    """The interactive shell on the SSH channel implementing the pexpect.spawn interface used by the controller."""
+
+    def __init__(self, client, terminal_type='vt100', maxread=2000, searchwindowsize=None, logfile=None, **kwargs):
+        """The class constructor. Opens the shell channel.
+
+        Args:
+            client (paramiko.SSHClient): The connected client. The client is closed with the session.
+            terminal_type (str): The terminal type.
+            maxread (int): See the pexpect.spawn.
+            searchwindowsize (int): See the pexpect.spawn.
+            logfile (file): See the pexpect.spawn.
+
+        Raises:
+            ConnectionError: If the shell channel can not be opened.
+        """
+        super(SSHSession, self).__init__(maxread=maxread, searchwindowsize=searchwindowsize, logfile=logfile)
+        self.client = client
+        self.delayafterread = None
+        self._window_size = (24, 160)
+        transport = client.get_transport()
+        self.name = '<ssh>'
+        try:
+            self.channel = transport.open_session()
+            self.channel.get_pty(term=terminal_type, width=self._window_size[1], height=self._window_size[0])
+            self.channel.invoke_shell()
+        except (socket.error, paramiko.SSHException, EOFError) as e:
+            client.close()
+            raise ConnectionError("Unable to open the shell: {}".format(e))
+        self.child_fd = self.channel.fileno()
+        self.closed = False
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Reads up to *size* bytes from the channel.
+
+        Raises:
+            pexpect.TIMEOUT: If no data is received within *timeout* seconds.
+            pexpect.EOF: If the channel is closed.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        if self.flag_eof:
+            raise pexpect.EOF("Channel closed")
+        self.channel.settimeout(None if timeout is None else max(0, timeout))
+        try:
+            data = self.channel.recv(size)
+        except socket.timeout:
+            raise pexpect.TIMEOUT("Timeout exceeded")
+        except (socket.error, EOFError):
+            data = ''
+        if not data:
+            self.flag_eof = True
+            raise pexpect.EOF("Channel closed")
+        self._log(data, 'read')
+        return data
+
+    def send(self, s):
+        """Sends the data to the channel."""
+        self._log(s, 'send')
+        try:
+            self.channel.sendall(s)
+        except (socket.error, EOFError) as e:
+            self.flag_eof = True
+            raise pexpect.EOF("Channel closed: {}".format(e))
+        return len(s)
+
+    def sendline(self, s=''):
+        """Sends the data followed by the line separator."""
+        return self.send(s + self.linesep)
+
+    def sendcontrol(self, char):
+        """Sends the control character."""
+        char = char.lower()
+        byte = ord(char) - ord('a') + 1 if 'a' <= char <= 'z' else \
+            {'@': 0, '[': 27, '\\': 28, ']': 29, '^': 30, '_': 31, '?': 127}.get(char, 0)
+        return self.send(chr(byte))
+
+    def write(self, s):
+        """Sends the data to the channel."""
+        self.send(s)
+
+    def isalive(self):
+        """Returns True if the channel is open."""
+        return not (self.closed or self.flag_eof or self.channel.closed)
+
+    def close(self, force=True):
+        """Closes the channel and the SSH connection."""
+        if not self.closed:
+            self.channel.close()
+            self.client.close()
+            self.closed = True
+
+    def terminate(self, force=False):
+        """Closes the channel and the SSH connection."""
+        self.close()
+        return True
+
+    def setecho(self, state):
+        """The echo is handled by the remote pty."""
+        pass
+
+    def getwinsize(self):
+        """Returns the (rows, cols) window size of the remote pty."""
+        return self._window_size
+
+    def setwinsize(self, rows, cols):
+        """Sets the window size of the remote pty."""
+        self._window_size = (rows, cols)
+        self.channel.resize_pty(width=cols, height=rows)
+
+
+class TransportRegistry(object):
+    """This class keeps the SSH connections to the jumphosts shared by the sessions opened with the 'native'
+    transport. The first session going through the jumphost opens the connection and next sessions open the
+    direct-tcpip channels through it without the key exchange and authentication.
+
+    The connection not used by any session is closed after *persist* seconds of inactivity by :meth:`expire`.
+    The :meth:`cleanup` closes all the connections and is called automatically on the interpreter exit.
+    """
+
+    def __init__(self, persist=600):
+        """This is a class constructor.
+
+        Args:
+            persist (int): Time in seconds the idle connection stays open. Defaults to 600s.
+        """
+        self.persist = persist
+        self._clients = {}  # key -> [client, users, last used]
+        self._lock = threading.Lock()
+        atexit.register(self.cleanup)
+
+    def acquire(self, hostname, port, username, password, tunnel=None, timeout=30):
+        """Returns the transport to the jumphost. Opens the new connection if there is no active one.
+
+        Args:
+            hostname (str): The jumphost hostname or IP address.
+            port (int): The TCP port.
+            username (str): The username.
+            password (str): The password.
+            tunnel (paramiko.Transport): The transport to the previous jumphost or *None*.
+            timeout (float): The connection timeout in seconds.
+
+        Returns:
+            The paramiko.Transport object. Call :meth:`release` when not used anymore.
+        """
+        key = (username, hostname, int(port), id(tunnel) if tunnel else None)
+        with self._lock:
+            self.expire()
+            entry = self._clients.get(key)
+            if entry is not None and entry[0].get_transport().is_active():
+                entry[1] += 1
+                entry[2] = time.time()
+                logger.debug("Reusing the SSH connection to {}@{}:{}".format(username, hostname, port))
+                return entry[0].get_transport()
+
+        sock = open_channel(tunnel, hostname, port, timeout) if tunnel else None
+        client = open_client(hostname, port, username, password, sock=sock, timeout=timeout)
+        logger.debug("Opened the SSH connection to {}@{}:{}".format(username, hostname, port))
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry[0].get_transport().is_active():
+                # opened concurrently by the other session
+                client.close()
+                entry[1] += 1
+                entry[2] = time.time()
+            else:
+                entry = self._clients[key] = [client, 1, time.time()]
+        return entry[0].get_transport()
+
+    def release(self, transport):
+        """Marks the *transport* as not used by the session."""
+        with self._lock:
+            for entry in self._clients.values():
+                if entry[0].get_transport() is transport:
+                    entry[1] = max(0, entry[1] - 1)
+                    entry[2] = time.time()
+            self.expire()
+
+    def expire(self):
+        """Closes the connections not used for longer than *persist* seconds."""
+        now = time.time()
+        for key, (client, users, last_used) in self._clients.items():
+            transport = client.get_transport()
+            if transport is None or not transport.is_active() or (not users and now - last_used >= self.persist):
+                logger.debug("SSH connection to {}@{}:{} expired".format(*key[:3]))
+                client.close()
+                del self._clients[key]
+
+    def cleanup(self):
+        """Closes all the connections."""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        # the connections through the other jumphosts first
+        for key in sorted(clients, key=lambda item: item[3] is None):
+            clients[key][0].close()
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Returns the process wide :class:`TransportRegistry`."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = TransportRegistry()
+        return _default_registry
@@ -0,0 +1,323 @@
+# =============================================================================
+# telnet
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""The in-process Telnet client session (RFC 854) with the option negotiation."""
+
+import re
+import time
+import errno
+import select
+import socket
+import struct
+import logging
+
+import pexpect
+from pexpect.spawnbase import SpawnBase
+
+from ...exceptions import ConnectionError, ConnectionTimeoutError
+
+# commands
+IAC = chr(255)
+DONT = chr(254)
+DO = chr(253)
+WONT = chr(252)
+WILL = chr(251)
+SB = chr(250)
+SE = chr(240)
+NOP = chr(241)
+
+# options
+BINARY = chr(0)
+ECHO = chr(1)
+SGA = chr(3)
+TTYPE = chr(24)
+NAWS = chr(31)
+
+# the terminal type subnegotiation commands
+TTYPE_IS = chr(0)
+TTYPE_SEND = chr(1)
+
+# the options the client agrees to enable locally
+LOCAL_OPTIONS = (BINARY, SGA, TTYPE, NAWS)
+# the options the client agrees the server enables
+REMOTE_OPTIONS = (BINARY, ECHO, SGA)
+
+# the CR not followed by LF
+_BARE_CR = re.compile('\r(?!\n)')
+
+# the parser states
+_DATA, _IAC, _OPTION, _SB, _SB_IAC, _CR = range(6)
+
+logger = logging.getLogger("condoor.transports.telnet")
+
+
+class TelnetSession(SpawnBase):
+    """The Telnet session over the TCP socket implementing the pexpect.spawn interface used by the controller."""
+
+    def __init__(self, host, port=23, connect_timeout=30, terminal_type='vt100', sock=None, maxread=2000,
+                 searchwindowsize=None, logfile=None, **kwargs):
+        """The class constructor. Opens the connection.
+
+        Args:
+            host (str): The hostname or IP address.
+            port (int): The TCP port.
+            connect_timeout (float): The TCP connection timeout in seconds.
+            terminal_type (str): The terminal type reported to the server.
+            sock (object): The connected socket like object, i.e. the SSH direct-tcpip channel. If *None* the
+                TCP connection to *host* and *port* is opened.
+            maxread (int): See the pexpect.spawn.
+            searchwindowsize (int): See the pexpect.spawn.
+            logfile (file): See the pexpect.spawn.
+
+        Raises:
+            ConnectionTimeoutError: If the connection is not established within *connect_timeout*.
+            ConnectionError: If the connection can not be established.
+        """
+        super(TelnetSession, self).__init__(maxread=maxread, searchwindowsize=searchwindowsize, logfile=logfile)
+        self.host = host
+        self.port = port
+        self.name = '<telnet {}:{}>'.format(host, port)
+        self.terminal_type = terminal_type
+        self.delayafterread = None
+        self._window_size = (24, 160)
+        self._local = set()  # the options enabled by the client
+        self._remote = set()  # the options enabled by the server
+        self._state = _DATA
+        self._command = None
+        self._subnegotiation = ''
+        self._data = ''
+
+        if sock is None:
+            try:
+                sock = socket.create_connection((host, int(port)), connect_timeout)
+            except socket.timeout:
+                raise ConnectionTimeoutError("Connection timeout", host)
+            except (socket.error, socket.gaierror) as e:
+                raise ConnectionError("Unable to connect: {}".format(e), host)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket = sock
+        self.socket.setblocking(0)
+        self.child_fd = self.socket.fileno()
+        self.closed = False
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Reads up to *size* bytes of the data received from the server. The option negotiation is handled
+        in the background.
+
+        Raises:
+            pexpect.TIMEOUT: If no data is received within *timeout* seconds.
+            pexpect.EOF: If the connection is closed.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.time() + timeout
+
+        while not self._data:
+            if self.flag_eof:
+                raise pexpect.EOF("Connection closed")
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            readable, _, _ = select.select([self.socket], [], [], remaining)
+            if not readable:
+                raise pexpect.TIMEOUT("Timeout exceeded")
+            try:
+                received = self.socket.recv(self.maxread)
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                if e.args[0] in (errno.EAGAIN, errno.EINTR):
+                    continue
+                received = ''
+            if not received:
+                self.flag_eof = True
+                raise pexpect.EOF("Connection closed by foreign host")
+            self._data += self._process(received)
+
+        data, self._data = self._data[:size], self._data[size:]
+        self._log(data, 'read')
+        return data
+
+    def send(self, s):
+        """Sends the data to the server. The IAC bytes are escaped and the bare CR is sent as CR NUL."""
+        self._log(s, 'send')
+        data = s.replace(IAC, IAC + IAC)
+        if '\r' in data:
+            data = _BARE_CR.sub('\r\x00', data)
+        self._write(data)
+        return len(s)
+
+    def sendline(self, s=''):
+        """Sends the data followed by the line separator."""
+        return self.send(s + self.linesep)
+
+    def sendcontrol(self, char):
+        """Sends the control character."""
+        char = char.lower()
+        byte = ord(char) - ord('a') + 1 if 'a' <= char <= 'z' else \
+            {'@': 0, '[': 27, '\\': 28, ']': 29, '^': 30, '_': 31, '?': 127}.get(char, 0)
+        return self.send(chr(byte))
+
+    def write(self, s):
+        """Sends the data to the server."""
+        self.send(s)
+
+    def isalive(self):
+        """Returns True if the connection is open."""
+        return not (self.closed or self.flag_eof)
+
+    def close(self, force=True):
+        """Closes the connection."""
+        if not self.closed:
+            self.socket.close()
+            self.closed = True
+
+    def terminate(self, force=False):
+        """Closes the connection."""
+        self.close()
+        return True
+
+    def setecho(self, state):
+        """The echo is negotiated with the server."""
+        pass
+
+    def getwinsize(self):
+        """Returns the (rows, cols) window size reported to the server."""
+        return self._window_size
+
+    def setwinsize(self, rows, cols):
+        """Sets the window size reported to the server."""
+        self._window_size = (rows, cols)
+        if NAWS in self._local:
+            self._send_window_size()
+
+    def _write(self, data):
+        try:
+            self.socket.setblocking(1)
+            self.socket.sendall(data)
+        except socket.error as e:
+            self.flag_eof = True
+            raise pexpect.EOF("Connection closed: {}".format(e))
+        finally:
+            self.socket.setblocking(0)
+
+    def _process(self, received):
+        # strips the telnet commands from the received data and answers the option negotiation
+        if self._state in (_DATA, _CR) and IAC not in received:
+            if self._state == _CR and received.startswith('\x00'):
+                received = received[1:]
+            self._state = _CR if received.endswith('\r') else _DATA
+            return received.replace('\r\x00', '\r')
+
+        data = []
+        for char in received:
+            state = self._state
+            if state == _DATA:
+                if char == IAC:
+                    self._state = _IAC
+                elif char == '\r':
+                    self._state = _CR
+                    data.append(char)
+                else:
+                    data.append(char)
+            elif state == _CR:
+                # the bare CR is sent as CR NUL
+                self._state = _DATA
+                if char == IAC:
+                    self._state = _IAC
+                elif char != '\x00':
+                    data.append(char)
+            elif state == _IAC:
+                if char == IAC:
+                    data.append(char)
+                    self._state = _DATA
+                elif char in (DO, DONT, WILL, WONT):
+                    self._command = char
+                    self._state = _OPTION
+                elif char == SB:
+                    self._subnegotiation = ''
+                    self._state = _SB
+                else:
+                    self._state = _DATA
+            elif state == _OPTION:
+                self._negotiate(self._command, char)
+                self._state = _DATA
+            elif state == _SB:
+                if char == IAC:
+                    self._state = _SB_IAC
+                else:
+                    self._subnegotiation += char
+            elif state == _SB_IAC:
+                if char == SE:
+                    self._subnegotiate(self._subnegotiation)
+                    self._state = _DATA
+                else:
+                    self._subnegotiation += char
+                    self._state = _SB
+        return ''.join(data)
+
+    def _negotiate(self, command, option):
+        logger.debug("%s: Received %s %d", self.name, _name(command), ord(option))
+        if command == DO:
+            if option in self._local:
+                return
+            if option in LOCAL_OPTIONS:
+                self._local.add(option)
+                self._write(IAC + WILL + option)
+                if option == NAWS:
+                    self._send_window_size()
+            else:
+                self._write(IAC + WONT + option)
+        elif command == DONT:
+            if option in self._local:
+                self._local.discard(option)
+                self._write(IAC + WONT + option)
+        elif command == WILL:
+            if option in self._remote:
+                return
+            if option in REMOTE_OPTIONS:
+                self._remote.add(option)
+                self._write(IAC + DO + option)
+            else:
+                self._write(IAC + DONT + option)
+        elif command == WONT:
+            if option in self._remote:
+                self._remote.discard(option)
+                self._write(IAC + DONT + option)
+
+    def _subnegotiate(self, data):
+        if data[:2] == TTYPE + TTYPE_SEND and TTYPE in self._local:
+            self._write(IAC + SB + TTYPE + TTYPE_IS + self.terminal_type.upper() + IAC + SE)
+
+    def _send_window_size(self):
+        rows, cols = self._window_size
+        size = struct.pack('>HH', cols, rows).replace(IAC, IAC + IAC)
+        self._write(IAC + SB + NAWS + size + IAC + SE)
+
+
+def _name(command):
+    return {DO: 'DO', DONT: 'DONT', WILL: 'WILL', WONT: 'WONT'}.get(command, repr(command))
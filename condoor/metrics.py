@@ -0,0 +1,313 @@
+# =============================================================================
+# metrics
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+
+# the upper bounds of the latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# the maximum number of the distinct full command labels per device, the other commands are labeled 'other'
+MAX_COMMAND_LABELS = 100
+
+# name -> (type, help) of the metrics collected by condoor
+METRICS = {
+    'condoor_hop_connect_seconds': (HISTOGRAM, "Time to open the session to the hop."),
+    'condoor_hop_authenticate_seconds': (HISTOGRAM, "Time to authenticate on the hop."),
+    'condoor_prompt_detection_seconds': (HISTOGRAM, "Time to detect the hop prompt."),
+    'condoor_echo_wait_seconds': (HISTOGRAM, "Time waiting for the command echo."),
+    'condoor_prompt_wait_seconds': (HISTOGRAM, "Time waiting for the prompt after the command."),
+    'condoor_command_seconds': (HISTOGRAM, "Time to execute the command."),
+    'condoor_hop_failures_total': (COUNTER, "Number of the failed attempts to connect to the hop."),
+    'condoor_bytes_received_total': (COUNTER, "Number of bytes received from the device."),
+    'condoor_more_pages_total': (COUNTER, "Number of the --More-- prompts answered."),
+    'condoor_fsm_transitions_total': (COUNTER, "Number of the FSM transitions."),
+    'condoor_timeouts_total': (COUNTER, "Number of the timeouts."),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.iteritems()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return "{" + ",".join('{}="{}"'.format(key, _escape(value)) for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram(object):
+    __slots__ = ['buckets', 'counts', 'count', 'sum', 'min', 'max']
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def cumulative(self):
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'avg': self.sum / self.count if self.count else 0.0,
+            'buckets': [[bound, count] for bound, count in self.cumulative()],
+        }
+
+
+class ConnectionMetrics(object):
+    """This class collects the counters and the latency histograms of the single device. The connection phases
+    are measured by the controller and the platform drivers, for example::
+
+        with metrics.timer('condoor_prompt_wait_seconds'):
+            driver.wait_for_prompt()
+
+    The additional labels are passed as keyword arguments. The *device* label is added on export.
+    See :data:`METRICS` for the metrics collected by condoor.
+    """
+
+    def __init__(self, device, buckets=DEFAULT_BUCKETS, command_labels=False):
+        """This is a class constructor.
+
+        Args:
+            device (str): The device name used as the *device* label.
+            buckets (tuple): The sorted upper bounds of the histogram buckets in seconds.
+            command_labels (bool): If *True* the command timings are labeled with the full command.
+                Otherwise only the first word of the command is used. See :meth:`command_label`.
+        """
+        self.device = device
+        self.buckets = tuple(buckets)
+        self.command_labels = command_labels
+        self._commands = set()
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """Increments the counter *name* by *value*."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Records the *value* in the histogram *name*."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def command_label(self, command):
+        """Returns the *command* label value for the *command*. The label is the first word of the command,
+        i.e. 'show', unless the full command labels are enabled. The number of the full command labels is limited
+        to :data:`MAX_COMMAND_LABELS`, the commands above the limit are labeled 'other'."""
+        words = command.split()
+        if not self.command_labels:
+            return words[0] if words else ''
+        label = " ".join(words)
+        with self._lock:
+            if label not in self._commands:
+                if len(self._commands) >= MAX_COMMAND_LABELS:
+                    return 'other'
+                self._commands.add(label)
+        return label
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Records the time spent in the *with* block in the histogram *name*.
+        The time is recorded also if the exception is raised."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def samples(self):
+        """Returns the list of (name, type, labels, value) tuples. The labels are the sorted tuple of the
+        (key, value) pairs including the *device* label. The histogram value is the snapshot of the histogram."""
+        device = (('device', str(self.device)),)
+        with self._lock:
+            result = [(name, COUNTER, device + labels, value)
+                      for (name, labels), value in self._counters.iteritems()]
+            for (name, labels), histogram in self._histograms.iteritems():
+                copy = _Histogram(histogram.buckets)
+                copy.counts = list(histogram.counts)
+                copy.count, copy.sum, copy.min, copy.max = \
+                    histogram.count, histogram.sum, histogram.min, histogram.max
+                result.append((name, HISTOGRAM, device + labels, copy))
+        return sorted(result, key=lambda sample: (sample[0], sample[2]))
+
+    def as_dict(self):
+        """Returns the dict with the counters and the histograms. For example::
+
+            {
+                'device': 'router1',
+                'counters': {'condoor_more_pages_total': [{'labels': {}, 'value': 12}]},
+                'histograms': {'condoor_command_seconds': [{'labels': {'command': 'show version'},
+                                                            'count': 1, 'sum': 0.52, ...}]}
+            }
+        """
+        result = {'device': self.device, 'counters': {}, 'histograms': {}}
+        for name, metric_type, labels, value in self.samples():
+            labels = dict(labels[1:])
+            if metric_type == COUNTER:
+                result['counters'].setdefault(name, []).append({'labels': labels, 'value': value})
+            else:
+                result['histograms'].setdefault(name, []).append(dict(value.as_dict(), labels=labels))
+        return result
+
+    def reset(self):
+        """Removes all the collected values."""
+        with self._lock:
+            self._commands.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class MetricsRegistry(object):
+    """This class aggregates the :class:`ConnectionMetrics` of all the devices in the process and exports them
+    in the Prometheus text format or JSON. The :class:`condoor.Connection` objects for the same device name
+    share the same metrics, so the values are not lost when the connection object is recreated::
+
+        registry = condoor.metrics.get_default_registry()
+        with open("/var/lib/node_exporter/condoor.prom", "w") as fd:
+            fd.write(registry.to_prometheus())
+
+    The metrics of the device are kept until removed with :meth:`remove`,
+    i.e. by :meth:`condoor.Connection.disconnect` called with *remove_metrics=True*.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, command_labels=False):
+        """This is a class constructor.
+
+        Args:
+            buckets (tuple): The sorted upper bounds of the histogram buckets in seconds.
+            command_labels (bool): If *True* the command timings are labeled with the full command.
+                See :meth:`ConnectionMetrics.command_label`.
+        """
+        self.buckets = tuple(buckets)
+        self.command_labels = command_labels
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def metrics_for(self, device):
+        """Returns the :class:`ConnectionMetrics` object for the *device* name. The object is created if
+        does not exist."""
+        with self._lock:
+            metrics = self._devices.get(device)
+            if metrics is None:
+                metrics = self._devices[device] = ConnectionMetrics(device, self.buckets, self.command_labels)
+            return metrics
+
+    def remove(self, device):
+        """Removes the metrics of the *device*."""
+        with self._lock:
+            self._devices.pop(device, None)
+
+    def _all_metrics(self):
+        with self._lock:
+            return [self._devices[device] for device in sorted(self._devices)]
+
+    def as_dict(self):
+        """Returns the dict with the list of :meth:`ConnectionMetrics.as_dict` records under the 'devices' key."""
+        return {'devices': [metrics.as_dict() for metrics in self._all_metrics()]}
+
+    def to_json(self, **kwargs):
+        """Returns the JSON string representing :meth:`as_dict`. The *kwargs* are passed to :func:`json.dumps`."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_prometheus(self):
+        """Returns the string in the Prometheus text exposition format."""
+        families = {}
+        for metrics in self._all_metrics():
+            for name, metric_type, labels, value in metrics.samples():
+                families.setdefault((name, metric_type), []).append((labels, value))
+
+        lines = []
+        for (name, metric_type), samples in sorted(families.iteritems()):
+            description = METRICS.get(name)
+            if description is not None:
+                lines.append("# HELP {} {}".format(name, description[1]))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+            for labels, value in sorted(samples):
+                if metric_type == COUNTER:
+                    lines.append("{}{} {}".format(name, _format_labels(labels), _format_value(value)))
+                    continue
+                for bound, count in value.cumulative():
+                    bucket_labels = labels + (('le', _format_value(bound)),)
+                    lines.append("{}_bucket{} {}".format(name, _format_labels(bucket_labels), count))
+                lines.append("{}_sum{} {}".format(name, _format_labels(labels), _format_value(value.sum)))
+                lines.append("{}_count{} {}".format(name, _format_labels(labels), value.count))
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Returns the process wide :class:`MetricsRegistry` used by :class:`condoor.Connection` by default."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = MetricsRegistry()
+        return _default_registry
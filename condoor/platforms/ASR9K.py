@@ -91,7 +91,7 @@ class Connection(generic.Connection):
                 self.hostname = 'NOT-SET'
             else:
                 self.hostname = prompt.split(":")[-1][:-1].split('(')[0]
-            self._debug("Hostname detected: {}".format(self.hostname))
+            self._debug("Hostname detected: {}", self.hostname)
             if self.ctrl:
                 self.ctrl.hostname = self.hostname
         except:
@@ -192,7 +192,7 @@ class Connection(generic.Connection):
         fs = FSM("RELOAD", self.ctrl, events, transitions, timeout=10)
         return fs.run()
 
-    def wait_for_prompt(self, timeout=60):
+    def _wait_for_prompt_fsm(self):
         # ASR with IOSXR specific error when cmd is longer than 256 characters
         _BUFFER_OVERFLOW = "input buffer overflow"
         events = [self.command_syntax_re, self.connection_closed_re,
@@ -202,8 +202,6 @@ class Connection(generic.Connection):
         # add detected prompts chain
         events += self.compiled_prompts[:-1]  # without target prompt
 
-        self._debug("Waiting for prompt")
-
         transitions = [
             (self.command_syntax_re, [0], -1, CommandSyntaxError("Command unknown", self.hostname), 0),
             (self.connection_closed_re, [0], 1, self._connection_closed, 10),
@@ -218,8 +216,7 @@ class Connection(generic.Connection):
         for prompt in self.compiled_prompts[:-1]:
             transitions.append((prompt, [0, 1], 0, self._unexpected_prompt, 0))
 
-        sm = FSM("WAIT-4-PROMPT", self.ctrl, events, transitions, timeout=timeout)
-        return sm.run()
+        return events, transitions
 
     @action
     def _send_boot(self, ctx):
@@ -29,17 +29,23 @@
 
 
 import re
+import time
+import logging
 import pexpect
 from threading import Lock
 
 from ..exceptions import \
+    GeneralError, \
     ConnectionError,\
+    CommandError, \
     CommandSyntaxError, \
     CommandTimeoutError
 
-from ..controllers.fsm import FSM, action
+from ..controllers.fsm import FSM, FSMTemplate, action
+from ..controllers.expect import TAIL, Expect, Return, run_steps
 
 from ..controllers.protocols.base import PRESS_RETURN
+from ..metrics import ConnectionMetrics
 
 _PROMPT_IOSXR = re.compile('\w+/\w+/\w+/\w+:.+#')
 _PROMPT_SHELL = re.compile('\$\s*|>\s*')
@@ -49,6 +55,16 @@ _INVALID_INPUT = "Invalid input detected"
 _INCOMPLETE_COMMAND = "Incomplete command."
 _CONNECTION_CLOSED = "Connection closed"
 
+# the carriage returns and the backspaces erasing the --More-- prompt are removed from the streamed output
+_STREAM_JUNK = re.compile('\x08+ *\x08+|[\r\x08]')
+# the size of the single read while streaming the output
+_STREAM_READ_SIZE = 4096
+# the longest unterminated line kept while streaming, the rest is released keeping the room for the prompt
+_STREAM_MAX_LINE = 65536
+_STREAM_KEEP = 1024
+# the max number of the FSM templates kept by the driver
+_MAX_FSM_TEMPLATES = 32
+
 prompt_patterns = {
     'IOSXR': re.compile('(RP/\d+/RS?P[0-1]/CPU[0-3]:.*?)(\([^()]*\))?#'),
     'CALVADOS': re.compile("sysadmin-vm:[0-3]_RS?P[0-1]#"),
@@ -82,6 +98,13 @@ class Connection(object):
     press_return = re.compile("Press RETURN to get started\.")
     more = re.compile(" --More-- ")
     standby_console = re.compile("Standby console disabled|\(standby\)")
+    # used for the prompt detection
+    known_prompts = [prompt_patterns[os_type] for os_type in os_types]
+    # 'echo' - wait for the command echo before sending the new line, 'prompt' - only the prompt frames the output
+    command_framing = 'echo'
+    # condoor.cache.CommandCache or None
+    command_cache = None
+    command_cache_key = None
 
     def __init__(self, name, hosts, controller_class, logger, account_manager=None):
         self.hosts = hosts
@@ -89,6 +112,7 @@ class Connection(object):
         self.pending_connection = False
         self.connected = False
         self.command_execution_pending = Lock()
+        self._stream = None
         self.ctrl = None
         self.ctrl_class = controller_class
         self.name = name
@@ -97,6 +121,8 @@ class Connection(object):
         self.prompt = self.platform_prompt
         self._os_type = 'unknown'
         self.mode = None
+        self._fsm_templates = {}
+        self.metrics = ConnectionMetrics(name)
         self.compiled_prompts = []
         for _ in hosts:
             self.compiled_prompts.append(None)
@@ -121,12 +147,14 @@ class Connection(object):
 
         if not self.connected:
             self.ctrl = self.ctrl_class(self, self.hostname, self.hosts, self.account_manager, logfile=logfile)
+            self._set_search_windows()
             self._info("Connecting to {} using {} driver".format(self.__repr__(), self.platform))
             self.connected = self.ctrl.connect()
 
         if self.connected:
             self._info("Connected to {}".format(self.__repr__()))
             self._compile_prompts()
+            self._set_search_windows()
             self.prepare_prompt()
             self.prepare_terminal_session()
         else:
@@ -149,6 +177,7 @@ class Connection(object):
         self.ctrl.disconnect()
         self.connected = False
         self.pending_connection = False
+        self._stream = None
         self._info("Disconnected")
 
     def reconnect(self, logfile=None):
@@ -161,6 +190,25 @@ class Connection(object):
         else:
             return False
 
+    def verify_prompt(self, timeout=10):
+        """This method checks if the session is still usable. It sends the empty line and waits for the target
+        device prompt. This is cheap comparing to :attr:`is_connected` which only reflects the last known state.
+
+        Args:
+            timeout (int): Timeout in seconds. Defaults to 10s
+
+        Returns:
+            True if the prompt was received, False otherwise.
+        """
+        if not self.is_connected:
+            return False
+        try:
+            self.send(timeout=timeout)
+        except (ConnectionError, CommandError) as e:
+            self._warning("Prompt verification failed: {}".format(e))
+            return False
+        return True
+
     def send(self, cmd="", timeout=60, wait_for_string=None):
         """
         Send the command to the device and return the output
@@ -180,24 +228,153 @@ class Connection(object):
             CommandSyntaxError: Command syntax error or unknown command.
             CommandTimeoutError: Timeout during command execution
         """
+        return run_steps(self.send_steps(cmd, timeout, wait_for_string))
+
+    def send_steps(self, cmd="", timeout=60, wait_for_string=None):
+        """
+        Returns the steps generator sending the command to the device. The generator yields the
+        :class:`condoor.controllers.expect.Expect` requests and returns the command output.
+        The arguments and the exceptions are the same as for :meth:`send`.
+        """
         if self.connected:
-            self._debug("Sending command: '{}'".format(cmd))
+            # the outputs are not cached in the config mode and when waiting for the custom string
+            cache = self.command_cache if wait_for_string is None and self.mode != 'config' else None
+            if cache is not None:
+                output = cache.get(self.mode, cmd, device=self.command_cache_key)
+                if output is not None:
+                    self._debug("Command output cached: '{}'", cmd)
+                    raise Return(output)
+
+            self._debug("Sending command: '{}'", cmd)
 
             try:
-                self._execute_command(cmd, timeout, wait_for_string)
+                if cmd:
+                    with self.metrics.timer('condoor_command_seconds', command=self.metrics.command_label(cmd)):
+                        yield self._execute_command_steps(cmd, timeout, wait_for_string)
+                else:
+                    # the empty command only verifies the prompt and is not timed
+                    yield self._execute_command_steps(cmd, timeout, wait_for_string)
             except ConnectionError:
                 self._warning("Connection lost. Disconnecting.")
                 self.disconnect()
                 raise
 
-            self._info("Command executed successfully: '{}'".format(cmd))
+            self._info("Command executed successfully: '{}'", cmd)
             output = self.ctrl.before
             # if output.startswith(cmd):
             #    remove first line which contains the command itself
             #    second_line_index = output.find('\n') + 1
             #    output = output[second_line_index:]
             output = output.replace('\r', '')
-            return output
+            if self.command_framing == 'prompt':
+                output = self._strip_echo(output, cmd)
+            if cache is not None and self.mode != 'config':
+                cache.set(self.mode, cmd, output, device=self.command_cache_key)
+            raise Return(output)
+
+        else:
+            raise ConnectionError("Device not connected", host=self.hostname)
+
+    def send_many(self, commands, timeout=60, max_in_flight=4):
+        """
+        Send the batch of commands to the device and return the list of outputs.
+
+        The commands are written to the session without waiting for the prompt of the previous command,
+        so the round trip time is paid once per batch instead of twice per command. The returned stream
+        is split on the target device prompt. Not more than *max_in_flight* commands are sent ahead
+        to not overrun the device input buffer. The terminal pager must be disabled
+        (see :meth:`prepare_terminal_session`) as the commands sent ahead would answer the --More-- prompt.
+
+        Args:
+            commands (list): List of command strings for execution.
+            timeout (int): Timeout in seconds for each command. Defaults to 60s
+            max_in_flight (int): Max number of commands sent and not yet completed. Defaults to 4.
+
+        Returns:
+            A list of strings containing the command outputs in the same order as commands.
+
+        Raises:
+            ConnectionError: General connection error during command execution
+            CommandSyntaxError: Command syntax error or unknown command. The `command` attribute
+                contains the failed command. The outputs of the commands sent ahead are discarded.
+            CommandTimeoutError: Timeout during command execution
+        """
+        if self.connected:
+            commands = list(commands)
+            self._debug("Sending {} commands. Max in flight: {}", len(commands), max_in_flight)
+
+            try:
+                outputs = self._execute_commands(commands, timeout, max(1, max_in_flight))
+            except ConnectionError:
+                self._warning("Connection lost. Disconnecting.")
+                self.disconnect()
+                raise
+
+            self._info("Commands executed successfully: {}", len(commands))
+            return outputs
+
+        else:
+            raise ConnectionError("Device not connected", host=self.hostname)
+
+    def send_iter(self, cmd="", timeout=60, chunk='line'):
+        """
+        Send the command to the device and yield the output as it is received from the device.
+
+        Only the last unterminated line is kept in the memory so this is suitable for the very long
+        outputs. The --More-- prompt is handled and removed from the output together with the backspaces
+        erasing it, so the concatenated chunks are equal to the :meth:`send` output with the backspace
+        characters removed.
+
+        The command lock is held only while reading from the device. If the iteration is not finished the
+        next command discards the rest of the output before it is sent, and resuming the abandoned
+        iteration afterwards raises GeneralError.
+
+        Args:
+            cmd (str): Command string for execution. Defaults to empty string.
+            timeout (int): Timeout in seconds for receiving the prompt. Defaults to 60s
+            chunk (str): 'line' yields the lines including the new line character. The extremely long lines
+                may be split. 'raw' yields all the complete lines received so far. Defaults to 'line'.
+
+        Yields:
+            The strings containing the command output.
+
+        Raises:
+            ConnectionError: General connection error during command execution
+            CommandSyntaxError: Command syntax error or unknown command. Raised after the prompt is received.
+            CommandTimeoutError: Timeout during command execution
+        """
+        if chunk not in ('line', 'raw'):
+            raise GeneralError("Unknown chunk type: {}".format(chunk), host=self.hostname)
+
+        if self.connected:
+            self._debug("Sending command: '{}'", cmd)
+
+            stream = self._stream_command(cmd, timeout, chunk == 'line')
+            started = False
+            try:
+                while True:
+                    with self.command_execution_pending:
+                        if not started:
+                            self._drain_stream()
+                            self._stream = stream
+                            started = True
+                        elif self._stream is not stream:
+                            raise GeneralError("Command output discarded by another command", host=self.hostname)
+                        try:
+                            data = next(stream)
+                        except StopIteration:
+                            self._stream = None
+                            break
+                        except Exception:
+                            self._stream = None
+                            raise
+                    yield data
+            except ConnectionError:
+                self._warning("Connection lost. Disconnecting.")
+                self.disconnect()
+                raise
+
+            self._info("Command executed successfully: '{}'", cmd)
 
         else:
             raise ConnectionError("Device not connected", host=self.hostname)
@@ -330,9 +507,18 @@ class Connection(object):
 
         """
 
-        self._send_command(command)
+        return run_steps(self.run_fsm_steps(name, command, events, transitions, timeout, max_transitions))
+
+    def run_fsm_steps(self, name, command, events, transitions, timeout, max_transitions=20):
+        """
+        Returns the steps generator running the Finite State Machine. The generator yields the
+        :class:`condoor.controllers.expect.Expect` requests and returns the FSM result.
+        The arguments are the same as for :meth:`run_fsm`.
+        """
+        yield self._send_command_steps(command)
         fsm = FSM(name, self.ctrl, events, transitions, timeout=timeout, max_transitions=max_transitions)
-        return fsm.run()
+        result = yield fsm.steps()
+        raise Return(result)
 
     @property
     def os_type(self):
@@ -353,22 +539,53 @@ class Connection(object):
     def _compile_prompts(self):
         self.compiled_prompts = [re.compile(re.escape(prompt)) for prompt in self.ctrl.detected_prompts]
 
+    def _set_search_windows(self):
+        # the prompts never span multiple lines
+        prompts = [self.platform_prompt, self.rommon_prompt] + self.compiled_prompts
+        for prompt in prompts:
+            if prompt is not None:
+                self.ctrl.set_search_window(prompt, TAIL)
+
     def _send_command(self, cmd):
+        run_steps(self._send_command_steps(cmd))
+
+    def _send_command_steps(self, cmd):
+        if self.command_framing == 'prompt':
+            # the output is framed by the prompts, the echo is removed from the output
+            self.ctrl.sendline(cmd)
+            return
+
         self.ctrl.setecho(False)
         self.ctrl.send(cmd)
-        self.ctrl.expect_exact([cmd, pexpect.TIMEOUT], timeout=15)
+        with self.metrics.timer('condoor_echo_wait_seconds'):
+            if (yield Expect(self.ctrl, [cmd, pexpect.TIMEOUT], timeout=15, exact=True)) == 1:
+                self.metrics.inc('condoor_timeouts_total', phase='echo')
         self.ctrl.sendline()
         self.ctrl.setecho(True)
 
-    def _execute_command(self, cmd, timeout, wait_for_string):
+    def _drain_stream(self):
+        # must be called with the command lock held
+        stream, self._stream = self._stream, None
+        if stream is None:
+            return
+
+        self._warning("Discarding the output of the unfinished command stream")
+        try:
+            for _ in stream:
+                pass
+        except CommandError:
+            pass
+
+    def _execute_command_steps(self, cmd, timeout, wait_for_string):
         with self.command_execution_pending:
             try:
-                self._send_command(cmd)
+                self._drain_stream()
+                yield self._send_command_steps(cmd)
 
                 if wait_for_string:
-                    success = self._wait_for_string(wait_for_string, timeout)
+                    success = yield self._wait_for_string_steps(wait_for_string, timeout)
                 else:
-                    success = self.wait_for_prompt(timeout)
+                    success = yield self._wait_for_prompt_steps(timeout)
 
                 if not success:
                     self._error("Unexpected session disconnect")
@@ -376,11 +593,15 @@ class Connection(object):
 
             except CommandSyntaxError as e:
                 self._error("{}: '{}'".format(e.message, cmd))
+                if self.command_framing == 'prompt':
+                    # the prompt following the error message would frame the next command output
+                    self._drain_prompts(1, timeout)
                 e.command = cmd
                 raise
 
             except (CommandTimeoutError, pexpect.TIMEOUT) as e:
                 self._error("Command timeout: '{}'".format(cmd))
+                self.metrics.inc('condoor_timeouts_total', phase='command')
                 raise CommandTimeoutError(message="Command timeout", host=self.hostname, command=cmd)
 
             except ConnectionError as e:
@@ -396,15 +617,170 @@ class Connection(object):
                 self._error("Exception: {}:{}".format(err.__class__, error_msg))
                 raise ConnectionError(message=error_msg, host=self.hostname)
 
+    def _stream_command(self, cmd, timeout, by_line):
+        try:
+            self._send_command(cmd)
+        except pexpect.EOF:
+            self._error("Unexpected session disconnect")
+            raise ConnectionError("Unexpected session disconnect", host=self.hostname)
+
+        target_prompt = self.compiled_prompts[-1]
+        strip_echo = self.command_framing == 'prompt'
+        syntax_error = False
+        pending = ""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                data = self.ctrl.read(_STREAM_READ_SIZE, max(0, deadline - time.time()))
+            except pexpect.TIMEOUT:
+                self._error("Command timeout: '{}'".format(cmd))
+                self.metrics.inc('condoor_timeouts_total', phase='command')
+                raise CommandTimeoutError(message="Command timeout", host=self.hostname, command=cmd)
+            except pexpect.EOF:
+                self._error("Unexpected session disconnect")
+                raise ConnectionError("Unexpected session disconnect", host=self.hostname)
+
+            pending += _STREAM_JUNK.sub('', data)
+            if strip_echo and '\n' in pending:
+                pending = self._strip_echo(pending, cmd)
+                strip_echo = False
+
+            line_start = pending.rfind('\n') + 1
+            tail = pending[line_start:]
+            match = self.more.search(tail)
+            if match:
+                self.ctrl.send(' ')
+                self.metrics.inc('condoor_more_pages_total')
+                tail = tail[:match.start()] + tail[match.end():]
+                pending = pending[:line_start] + tail
+                deadline = time.time() + timeout
+
+            match = target_prompt.search(tail)
+            if match:
+                self.ctrl.unread(tail[match.end():])
+                release = pending[:line_start] + tail[:match.start()]
+                if strip_echo:
+                    release = self._strip_echo(release, cmd)
+            else:
+                for index, prompt in enumerate(self.compiled_prompts[:-1]):
+                    if prompt.search(tail):
+                        self._error("Received the jump host prompt: '{}'".format(prompt.pattern))
+                        self.ctrl.last_hop = index
+                        self.ctrl.connected = False
+                        raise ConnectionError("Unexpected session disconnect", host=self.hostname)
+
+                if len(tail) > _STREAM_MAX_LINE:
+                    line_start = len(pending) - _STREAM_KEEP
+                release = pending[:line_start]
+                pending = pending[line_start:]
+
+            if self.command_syntax_re.search(release):
+                syntax_error = True
+            if self.connection_closed_re.search(release):
+                self._warning("Device disconnected")
+                self.ctrl.connected = False
+
+            if release:
+                if by_line:
+                    for line in release.splitlines(True):
+                        yield line
+                else:
+                    yield release
+
+            if match:
+                prompt = match.group()
+                self.ctrl.detected_target_prompt = prompt
+                self._determine_config_mode(prompt)
+                self.determine_hostname(prompt)
+                break
+
+        if syntax_error:
+            self._error("Command unknown: '{}'".format(cmd))
+            raise CommandSyntaxError("Command unknown", host=self.hostname, command=cmd)
+
+    def _execute_commands(self, commands, timeout, max_in_flight):
+        outputs = []
+        with self.command_execution_pending:
+            self._drain_stream()
+            sent = 0
+            for cmd in commands:
+                while sent < len(commands) and sent - len(outputs) < max_in_flight:
+                    self.ctrl.sendline(commands[sent])
+                    sent += 1
+
+                try:
+                    if not self.wait_for_prompt(timeout):
+                        self._error("Unexpected session disconnect")
+                        raise ConnectionError("Unexpected session disconnect", host=self.hostname)
+
+                except CommandSyntaxError as e:
+                    self._error("{}: '{}'".format(e.message, cmd))
+                    # the commands already sent are still executed by the device
+                    self._drain_prompts(sent - len(outputs), timeout)
+                    e.command = cmd
+                    raise
+
+                except (CommandTimeoutError, pexpect.TIMEOUT) as e:
+                    self._error("Command timeout: '{}'".format(cmd))
+                    self.metrics.inc('condoor_timeouts_total', phase='command')
+                    raise CommandTimeoutError(message="Command timeout", host=self.hostname, command=cmd)
+
+                except ConnectionError as e:
+                    self._error("{}: '{}'".format(e.message, cmd))
+                    raise
+
+                except pexpect.EOF:
+                    self._error("Unexpected session disconnect")
+                    raise ConnectionError("Unexpected session disconnect", host=self.hostname)
+
+                except Exception as err:
+                    error_msg = str(err)
+                    self._error("Exception: {}:{}".format(err.__class__, error_msg))
+                    raise ConnectionError(message=error_msg, host=self.hostname)
+
+                output = self.ctrl.before.replace('\r', '')
+                outputs.append(self._strip_echo(output, cmd))
+
+        return outputs
+
+    def _drain_prompts(self, count, timeout):
+        while count > 0:
+            try:
+                self.wait_for_prompt(timeout)
+            except CommandSyntaxError:
+                # the prompt follows the error message
+                continue
+            except (CommandTimeoutError, pexpect.TIMEOUT):
+                self._warning("Timeout waiting for the pending commands")
+                return
+            count -= 1
+
+    def _strip_echo(self, output, cmd):
+        # the command echo precedes the output if it was not consumed before waiting for the prompt
+        # the echo can be wrapped by the terminal so the line breaks are skipped while matching the command
+        position = 0
+        for char in cmd:
+            while position < len(output) and output[position] in '\r\n' and output[position] != char:
+                position += 1
+            if position == len(output) or output[position] != char:
+                # garbled echo, the first line is dropped
+                self._debug("Command echo not recognized: '{}'", cmd)
+                line_end = output.find('\n')
+                return output[line_end:] if line_end >= 0 else output
+            position += 1
+        return output[position:]
+
     def _determine_config_mode(self, prompt):
         if 'config' in prompt:
+            if self.mode != 'config' and self.command_cache is not None:
+                self.command_cache.invalidate("config mode", device=self.command_cache_key)
             self.mode = 'config'
         elif 'admin' in prompt:
             self.mode = 'admin'
         else:
             self.mode = 'global'
 
-        self._debug("Mode: {}".format(self.mode))
+        self._debug("Mode: {}", self.mode)
 
     def determine_hostname(self, prompt):
         self._debug("Hostname detecting not implemented for generic driver")
@@ -472,17 +848,26 @@ class Connection(object):
     @action
     def _send_space(self, ctx):
         ctx.ctrl.send(' ')
+        self.metrics.inc('condoor_more_pages_total')
         return True
 
     def wait_for_prompt(self, timeout=60):
+        return run_steps(self._wait_for_prompt_steps(timeout))
+
+    def _wait_for_prompt_steps(self, timeout):
+        self._debug("Waiting for prompt")
+        template = self._fsm_template("WAIT-4-PROMPT", self._wait_for_prompt_fsm)
+        with self.metrics.timer('condoor_prompt_wait_seconds'):
+            result = yield template.steps(self.ctrl, timeout=timeout)
+        raise Return(result)
+
+    def _wait_for_prompt_fsm(self):
         events = [self.command_syntax_re, self.connection_closed_re,
                   pexpect.TIMEOUT, pexpect.EOF, self.compiled_prompts[-1], self.press_return, self.more]
 
         # add detected prompts chain
         events += self.compiled_prompts[:-1]  # without target prompt
 
-        self._debug("Waiting for prompt")
-
         transitions = [
             (self.command_syntax_re, [0], -1, CommandSyntaxError("Command unknown", self.hostname), 0),
             (self.connection_closed_re, [0], 1, self._connection_closed, 10),
@@ -496,18 +881,21 @@ class Connection(object):
         for prompt in self.compiled_prompts[:-1]:
             transitions.append((prompt, [0, 1], 0, self._unexpected_prompt, 0))
 
-        sm = FSM("WAIT-4-PROMPT", self.ctrl, events, transitions, timeout=timeout)
-        return sm.run()
+        return events, transitions
 
-    def _wait_for_string(self, expected_string, timeout=60):
+    def _wait_for_string_steps(self, expected_string, timeout):
+        self._debug("Waiting for string: '{}'", repr(expected_string))
+        template = self._fsm_template("WAIT-4-STR", self._wait_for_string_fsm, expected_string)
+        result = yield template.steps(self.ctrl, timeout=timeout)
+        raise Return(result)
+
+    def _wait_for_string_fsm(self, expected_string):
         events = [self.command_syntax_re, self.connection_closed_re,
                   pexpect.TIMEOUT, pexpect.EOF, expected_string, self.press_return, self.more]
 
         # add detected prompts chain
         events += self.compiled_prompts[:-1]  # without target prompt
 
-        self._debug("Waiting for string: '{}'".format(repr(expected_string)))
-
         transitions = [
             (self.command_syntax_re, [0], -1, CommandSyntaxError("Command unknown", self.hostname), 0),
             (self.connection_closed_re, [0], 1, self._connection_closed, 10),
@@ -521,20 +909,37 @@ class Connection(object):
         for prompt in self.compiled_prompts[:-1]:
             transitions.append((prompt, [0, 1], 0, self._unexpected_prompt, 0))
 
-        sm = FSM("WAIT-4-STR", self.ctrl, events, transitions, timeout=timeout)
-        return sm.run()
+        return events, transitions
+
+    def _fsm_template(self, name, build, *args):
+        # the template is compiled once for the detected prompts and the hostname used in the error messages
+        prompts = tuple(prompt.pattern for prompt in self.compiled_prompts if prompt is not None)
+        key = (name, self.hostname, prompts) + args
+        template = self._fsm_templates.get(key)
+        if template is None:
+            if len(self._fsm_templates) >= _MAX_FSM_TEMPLATES:
+                self._fsm_templates.clear()
+            events, transitions = build(*args)
+            template = FSMTemplate(name, events, transitions)
+            self._fsm_templates[key] = template
+        return template
 
     def prepare_prompt(self):
         self.prompt = self.ctrl.detected_target_prompt
 
-    def _debug(self, msg):
-        self.logger.debug("[{}]: {}".format(self.hostname, msg))
+    def _log(self, level, msg, args):
+        # the message is formatted only if the level is enabled
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "[{}]: {}".format(self.hostname, msg.format(*args) if args else msg))
+
+    def _debug(self, msg, *args):
+        self._log(logging.DEBUG, msg, args)
 
-    def _error(self, msg):
-        self.logger.error("[{}]: {}".format(self.hostname, msg))
+    def _error(self, msg, *args):
+        self._log(logging.ERROR, msg, args)
 
-    def _info(self, msg):
-        self.logger.info("[{}]: {}".format(self.hostname, msg))
+    def _info(self, msg, *args):
+        self._log(logging.INFO, msg, args)
 
-    def _warning(self, msg):
-        self.logger.warning("[{}]: {}".format(self.hostname, msg))
+    def _warning(self, msg, *args):
+        self._log(logging.WARNING, msg, args)
@@ -0,0 +1,194 @@
+# =============================================================================
+# reachability
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import errno
+import logging
+import select
+import socket
+import threading
+import time
+
+# the connect in progress
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
+
+def _interleave(addresses):
+    """Returns the addresses with the families alternated starting with the first family returned by the
+    resolver (RFC 8305)."""
+    families = []
+    by_family = {}
+    for family, _, _, _, sockaddr in addresses:
+        if family not in by_family:
+            families.append(family)
+            by_family[family] = []
+        if (family, sockaddr) not in by_family[family]:
+            by_family[family].append((family, sockaddr))
+    result = []
+    while any(by_family.values()):
+        for family in families:
+            if by_family[family]:
+                result.append(by_family[family].pop(0))
+    return result
+
+
+class ReachabilityService(object):
+    """This class verifies if the hosts accept the TCP connections. All the addresses of the host are tried
+    concurrently in the happy eyeballs style: the next address is tried if the previous one did not connect within
+    *attempt_delay* and the first successful connection wins. The results are cached for *ttl* seconds.
+    """
+
+    def __init__(self, timeout=5, ttl=10, attempt_delay=0.25, max_workers=32):
+        """This is a class constructor.
+
+        Args:
+            timeout (float): The maximum time in seconds to wait for the connection to the host.
+            ttl (float): The time in seconds the probe result is cached.
+            attempt_delay (float): The time in seconds before trying the next address of the host.
+            max_workers (int): The maximum number of hosts probed in parallel by :meth:`check_all`.
+        """
+        self.timeout = timeout
+        self.ttl = ttl
+        self.attempt_delay = attempt_delay
+        self.max_workers = max_workers
+        self.logger = logging.getLogger("condoor.reachability")
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def is_reachable(self, host, port=23):
+        """Returns *True* if the *host* accepts the TCP connections on *port*. The cached result is returned
+        if not expired. This method can be passed as the *verify_reachability* callable of
+        :class:`condoor.hopinfo.HopInfo`.
+        """
+        key = (host, int(port))
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+
+        begin = time.time()
+        result = self.probe(host, port)
+        self.logger.debug("{}:{} {} ({:.3f}s)".format(
+            host, port, "reachable" if result else "not reachable", time.time() - begin))
+        with self._lock:
+            self._cache[key] = (result, time.time() + self.ttl)
+        return result
+
+    def check_all(self, targets):
+        """Verifies the reachability of all the *targets* in parallel.
+
+        Args:
+            targets (list): The list of (host, port) tuples.
+
+        Returns:
+            The dictionary (host, port) -> bool.
+        """
+        targets = list(set((host, int(port)) for host, port in targets))
+        results = {}
+
+        def worker(host, port):
+            results[(host, port)] = self.is_reachable(host, port)
+
+        for index in xrange(0, len(targets), self.max_workers):
+            threads = [threading.Thread(target=worker, args=target, name="condoor-reachability")
+                       for target in targets[index:index + self.max_workers]]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return results
+
+    def probe(self, host, port=23):
+        """Returns *True* if the TCP connection to *host* and *port* can be established. The result is not cached.
+        """
+        try:
+            addresses = _interleave(socket.getaddrinfo(host, port, socket.AF_UNSPEC, socket.SOCK_STREAM))
+        except socket.gaierror:
+            return False
+
+        deadline = time.time() + self.timeout
+        next_attempt = 0
+        pending = []
+        try:
+            while addresses or pending:
+                now = time.time()
+                if now >= deadline:
+                    return False
+
+                if addresses and (now >= next_attempt or not pending):
+                    family, sockaddr = addresses.pop(0)
+                    sock = socket.socket(family, socket.SOCK_STREAM)
+                    sock.setblocking(0)
+                    error = sock.connect_ex(sockaddr)
+                    if error == 0:
+                        sock.close()
+                        return True
+                    if error in _IN_PROGRESS:
+                        pending.append(sock)
+                        next_attempt = now + self.attempt_delay
+                    else:
+                        sock.close()
+                    continue
+
+                wait = deadline - now
+                if addresses:
+                    wait = min(wait, next_attempt - now)
+                _, writable, _ = select.select([], pending, [], max(0, wait))
+                for sock in writable:
+                    if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                        return True
+                    # failed, try the next address at once
+                    pending.remove(sock)
+                    sock.close()
+                    next_attempt = 0
+            return False
+        finally:
+            for sock in pending:
+                sock.close()
+
+    def invalidate(self, host=None, port=None):
+        """Removes the cached results for the *host* and *port* or all the results if *host* is *None*."""
+        with self._lock:
+            if host is None:
+                self._cache.clear()
+            else:
+                self._cache.pop((host, int(port)), None)
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def get_default_service():
+    """Returns the process wide :class:`ReachabilityService`."""
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = ReachabilityService()
+        return _default_service
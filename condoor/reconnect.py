@@ -0,0 +1,168 @@
+# =============================================================================
+# reconnect
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import logging
+import random
+import threading
+import time
+
+
+def hop_key(hop):
+    """Returns the key identifying the *hop* (:class:`condoor.hopinfo.HopInfo`) in the health history."""
+    return hop.protocol, hop.hostname, hop.port
+
+
+def path_key(hops):
+    """Returns the key identifying the chain of *hops* in the health history."""
+    return tuple(hop_key(hop) for hop in hops)
+
+
+class _Health(object):
+    """The failure history of the path or the hop."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = None
+        self.last_success = None
+        self.ready = 0.0  # the time the next attempt is allowed
+
+    def as_dict(self):
+        return {
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_failure': self.last_failure,
+            'last_success': self.last_success,
+            'ready': self.ready,
+        }
+
+
+class ReconnectScheduler(object):
+    """This class schedules the reconnect attempts over the alternative connection paths.
+
+    Every path and every hop failing to connect is backed off exponentially: the n-th consecutive failure
+    delays the next attempt by *initial_delay* * *multiplier* ** (n - 1) seconds, capped at *max_delay*. The delay
+    is randomly shortened by up to *jitter* fraction so the sessions reconnecting after the same event do not retry
+    in lockstep. The path is delayed also by the backoff of its hops, so the failing jumphost or terminal server
+    delays all the paths going through it. The path allowed to connect first is tried first and the healthier path
+    wins the tie. The success resets the history of the path and its hops.
+
+    The scheduler can be shared by the connections to share the health of the common jumphosts and
+    terminal servers.
+    """
+
+    def __init__(self, initial_delay=1.0, max_delay=60.0, multiplier=2.0, jitter=0.5, seed=None):
+        """This is a class constructor.
+
+        Args:
+            initial_delay (float): The delay in seconds after the first failure.
+            max_delay (float): The maximum delay in seconds.
+            multiplier (float): The delay multiplier for every next consecutive failure.
+            jitter (float): The maximum fraction of the delay randomly removed. Between 0 and 1.
+            seed (int): The random generator seed.
+        """
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.logger = logging.getLogger("condoor.reconnect")
+        self._random = random.Random(seed)
+        self._paths = {}
+        self._hops = {}
+        self._lock = threading.Lock()
+
+    def backoff(self, failures):
+        """Returns the delay in seconds after *failures* consecutive failures."""
+        if failures < 1:
+            return 0.0
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** (failures - 1))
+        return delay * (1 - self.jitter * self._random.random())
+
+    def choose(self, paths, current=None):
+        """Returns the index of the path to try next and the time to wait before trying it.
+
+        Args:
+            paths (list): The list of the alternative paths. Every path is the list of
+                :class:`condoor.hopinfo.HopInfo` objects.
+            current (int): The index of the current path preferred in case of the tie.
+
+        Returns:
+            The (index, delay) tuple.
+        """
+        now = time.time()
+        with self._lock:
+            def rank(index):
+                health = self._paths.get(path_key(paths[index]), _Health())
+                return (self._ready(paths[index]), health.consecutive_failures, health.failures,
+                        index != current, index)
+            index = min(xrange(len(paths)), key=rank)
+            return index, max(0.0, self._ready(paths[index]) - now)
+
+    def record(self, path, success, failed_hop=None):
+        """Records the result of the attempt to connect over the *path*.
+
+        Args:
+            path (list): The list of the :class:`condoor.hopinfo.HopInfo` objects.
+            success (bool): *True* if connected.
+            failed_hop (int): The index of the failed hop in the *path* if known.
+        """
+        now = time.time()
+        with self._lock:
+            entries = [self._paths.setdefault(path_key(path), _Health())]
+            if success:
+                entries.extend(self._hops.setdefault(hop_key(hop), _Health()) for hop in path)
+            elif failed_hop is not None and 0 <= failed_hop < len(path):
+                entries.append(self._hops.setdefault(hop_key(path[failed_hop]), _Health()))
+
+            for health in entries:
+                health.attempts += 1
+                if success:
+                    health.consecutive_failures = 0
+                    health.last_success = now
+                    health.ready = 0.0
+                else:
+                    health.failures += 1
+                    health.consecutive_failures += 1
+                    health.last_failure = now
+                    health.ready = now + self.backoff(health.consecutive_failures)
+
+    def health(self):
+        """Returns the dictionary with the failure history of the paths and the hops."""
+        with self._lock:
+            return {
+                'paths': [dict(path=list(key), **health.as_dict()) for key, health in self._paths.items()],
+                'hops': [dict(hop=key, **health.as_dict()) for key, health in self._hops.items()],
+            }
+
+    def _ready(self, path):
+        ready = [self._paths[path_key(path)].ready] if path_key(path) in self._paths else [0.0]
+        ready.extend(self._hops[hop_key(hop)].ready for hop in path if hop_key(hop) in self._hops)
+        return max(ready)
@@ -0,0 +1,292 @@
+# =============================================================================
+# sessionlog
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+"""The session logs written by the background thread. The device output is put to the bounded queue, so the disk
+latency does not delay the expect loop.
+"""
+
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from condoor.exceptions import GeneralError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# the compression and the file name extension
+COMPRESSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+_SYNC = 'sync'
+_CLOSE = 'close'
+_STOP = 'stop'
+
+
+def _file_name(name):
+    """Returns the *name* with the characters not allowed in the file names replaced."""
+    return re.sub(r'[^\w.-]', '_', name) or 'session'
+
+
+class _RotatingFile(object):
+    """The session log file written by the writer thread. The size is counted in the uncompressed bytes, the same
+    unit as *max_bytes*, regardless of the compression. The size of the closed file is kept in *sizes* and used
+    when the file is opened again, so the compressed file is not read back."""
+
+    def __init__(self, stem, max_bytes, max_age, backups, compression, sizes):
+        self.stem = stem
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.compression = compression
+        self.extension = COMPRESSIONS[compression]
+        self.filename = stem + self.extension
+        self.sizes = sizes
+        self._open()
+
+    def _open(self):
+        size = self.sizes.pop(self.filename, None)
+        if not os.path.exists(self.filename):
+            self.size = 0
+        elif size is not None:
+            self.size = size
+        else:
+            # the file left by another logger, the compressed size is less than the uncompressed size
+            self.size = os.path.getsize(self.filename)
+        if self.compression == 'gzip':
+            self._stream = gzip.open(self.filename, 'ab')
+        elif self.compression == 'zstd':
+            self._stream = zstandard.ZstdCompressor().stream_writer(open(self.filename, 'ab'))
+        else:
+            self._stream = open(self.filename, 'ab')
+        self.opened = time.time()
+
+    def _backup_name(self, index):
+        return "{}.{}{}".format(self.stem, index, self.extension)
+
+    def rotate(self):
+        self.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(self._backup_name(index)):
+                os.rename(self._backup_name(index), self._backup_name(index + 1))
+        if self.backups > 0:
+            os.rename(self.filename, self._backup_name(1))
+        else:
+            os.remove(self.filename)
+        self.sizes.pop(self.filename, None)
+        self._open()
+
+    def write(self, data):
+        if self.size and ((self.max_bytes and self.size + len(data) > self.max_bytes) or
+                          (self.max_age and time.time() - self.opened >= self.max_age)):
+            self.rotate()
+        self._stream.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        self._stream.flush()
+
+    def close(self):
+        self._stream.close()
+        self.sizes[self.filename] = self.size
+
+
+class SessionLog(object):
+    """The file like object passed to the session as the log file. The data written is handed over to the
+    :class:`SessionLogger` writer thread. The log can be written again after closing, the file is opened again
+    in the append mode.
+    """
+
+    def __init__(self, logger, filename):
+        self._logger = logger
+        self.name = filename
+
+    def write(self, data):
+        """Puts the *data* to the writer queue."""
+        if data:
+            self._logger.put(self.name, data)
+
+    def flush(self):
+        """Does nothing. The writer thread flushes the file when there is no more data in the queue."""
+        pass
+
+    def sync(self, timeout=None):
+        """Waits until the data written so far is flushed to the file. Returns *False* on timeout."""
+        return self._logger.control(self.name, _SYNC, timeout)
+
+    def close(self, timeout=None):
+        """Flushes the data written so far and closes the file. Returns *False* on timeout."""
+        return self._logger.control(self.name, _CLOSE, timeout)
+
+
+class SessionLogger(object):
+    """This class writes the session logs of the devices in the background thread. Every device is logged to the
+    separate *<name>.session.log* file in *log_dir*. Here is the example of usage::
+
+        logger = SessionLogger("/tmp/logs", max_bytes=1024 * 1024, backups=3, compression="gzip")
+        conn = condoor.Connection("router1", urls, session_logger=logger)
+        conn.connect()  # the session is logged to /tmp/logs/router1.session.log.gz
+
+    The file is rotated when the uncompressed session output exceeds *max_bytes* or when it is older than
+    *max_age*. The rotated files are renamed to *<name>.session.log.1*, *<name>.session.log.2*, etc. and the oldest
+    file above *backups* is removed. The logs are compressed on the fly if *compression* is set. The compressed file
+    left by the previous logger is counted with its size on disk, so it may grow above *max_bytes* before rotated.
+    """
+
+    def __init__(self, log_dir, max_bytes=10 * 1024 * 1024, max_age=None, backups=5, compression=None,
+                 queue_size=4096, block=True):
+        """This is a class constructor.
+
+        Args:
+            log_dir (str): The directory for the session logs.
+            max_bytes (int): The maximum uncompressed size of the file before rotation. *None* disables the size
+                based rotation.
+            max_age (float): The time in seconds after the file is rotated. *None* disables the time based rotation.
+            backups (int): The number of the rotated files kept.
+            compression (str): Either *None*, 'gzip' or 'zstd'. The 'zstd' requires the zstandard package.
+            queue_size (int): The maximum number of the writes waiting for the writer thread.
+            block (bool): If *True* the session waits for the writer when the queue is full.
+                Otherwise the data is dropped and counted in :attr:`dropped`.
+
+        Raises:
+            GeneralError: If the compression is unknown or not available.
+        """
+        if compression not in COMPRESSIONS:
+            raise GeneralError("Unknown session log compression: {}".format(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise GeneralError("The zstandard package is required for the zstd session log compression")
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.compression = compression
+        self.block = block
+        self.dropped = 0
+        self.logger = logging.getLogger("condoor.sessionlog")
+        self._queue = Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sizes = {}
+
+    def open(self, name):
+        """Returns the :class:`SessionLog` for the device *name*. The file is opened on the first write."""
+        return SessionLog(self, os.path.join(self.log_dir, _file_name(name) + '.session.log'))
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="condoor-session-log")
+                self._thread.daemon = True
+                self._thread.start()
+
+    def put(self, filename, data):
+        """Puts the *data* to be written to the *filename* to the queue."""
+        self._start()
+        if self.block:
+            self._queue.put((filename, data))
+        else:
+            try:
+                self._queue.put_nowait((filename, data))
+            except Full:
+                with self._lock:
+                    self.dropped += 1
+
+    def control(self, filename, command, timeout=None):
+        """Puts the *command* for the *filename* to the queue and waits until the writer thread executes it."""
+        self._start()
+        done = threading.Event()
+        self._queue.put((filename, (command, done)))
+        done.wait(timeout)
+        return done.is_set()
+
+    def close(self, timeout=None):
+        """Flushes and closes all the files and stops the writer thread."""
+        if self._thread is not None and self._thread.is_alive():
+            self.control(None, _STOP, timeout)
+            self._thread.join(timeout)
+
+    def _run(self):
+        files = {}
+        while True:
+            items = [self._queue.get()]
+            try:
+                while True:
+                    items.append(self._queue.get_nowait())
+            except Empty:
+                pass
+
+            dirty = set()
+            for filename, data in items:
+                if isinstance(data, tuple):
+                    command, done = data
+                    if command == _STOP:
+                        for stream in files.values():
+                            self._close(stream)
+                        done.set()
+                        return
+                    if filename in files:
+                        self._flush(files[filename])
+                        dirty.discard(filename)
+                        if command == _CLOSE:
+                            self._close(files.pop(filename))
+                    done.set()
+                    continue
+
+                stream = files.get(filename)
+                try:
+                    if stream is None:
+                        stream = files[filename] = _RotatingFile(filename, self.max_bytes, self.max_age,
+                                                                 self.backups, self.compression, self._sizes)
+                    stream.write(data)
+                    dirty.add(filename)
+                except (IOError, OSError) as e:
+                    self.logger.warning("Unable to write the session log {}: {}".format(filename, e))
+                    dirty.discard(filename)
+                    if filename in files:
+                        self._close(files.pop(filename))
+
+            for filename in dirty:
+                self._flush(files[filename])
+
+    def _flush(self, stream):
+        try:
+            stream.flush()
+        except (IOError, OSError) as e:
+            self.logger.warning("Unable to flush the session log {}: {}".format(stream.filename, e))
+
+    def _close(self, stream):
+        try:
+            stream.close()
+        except (IOError, OSError) as e:
+            self.logger.warning("Unable to close the session log {}: {}".format(stream.filename, e))
@@ -57,6 +57,7 @@ packages = [
     'condoor',
     'condoor.controllers',
     'condoor.controllers.protocols',
+    'condoor.controllers.transports',
     'condoor.platforms',
 ]
 
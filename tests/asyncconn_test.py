@@ -0,0 +1,170 @@
+# =============================================================================
+# asyncconn_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import os
+import sys
+import threading
+import time
+
+import pexpect
+import pytest
+
+import condoor
+from condoor.asyncconn import AsyncConnection, EventLoop, Executor, as_completed
+from condoor.controllers.expect import Expect, Return
+from condoor.controllers.pexpect_ctrl import Controller
+from condoor.exceptions import CommandSyntaxError, ConnectionTimeoutError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import Simulator  # noqa
+
+
+class FakeConnection(object):
+    def __init__(self, name):
+        self.name = name
+        self.calls = []
+        self.connected = False
+        self.hostname = name
+
+    def connect(self, logfile=None):
+        time.sleep(0.05)
+        self.calls.append('connect')
+        self.connected = True
+
+    def send_steps(self, cmd="", timeout=60, wait_for_string=None):
+        self.calls.append(cmd)
+        if cmd == "bad":
+            raise CommandSyntaxError("Command unknown", self.name, cmd)
+        raise Return("{}: {}".format(self.name, cmd) if self.connected else None)
+        yield
+
+    def disconnect(self, remove_metrics=False):
+        self.calls.append('disconnect')
+
+
+def make_connection(name, executor, tmpdir, loop=None):
+    connection = AsyncConnection(name, ["telnet://{}".format(name)], executor=executor, loop=loop,
+                                 log_dir=str(tmpdir), log_level=0)
+    connection.connection = FakeConnection(name)
+    return connection
+
+
+def make_controller(command):
+    ctrl = Controller(None, "local", [])
+    ctrl._session = pexpect.spawn(command)
+    return ctrl
+
+
+def wait_for(ctrl, pattern, timeout=5):
+    index = yield Expect(ctrl, [pattern, pexpect.TIMEOUT], timeout=timeout)
+    raise Return(ctrl.before.strip() if index == 0 else None)
+
+
+def expect_only(ctrl, pattern, timeout):
+    yield Expect(ctrl, [pattern], timeout=timeout)
+
+
+class TestClass:
+    def test_operations_ordered(self, tmpdir):
+        connection = make_connection("dev1", Executor(workers=4), tmpdir)
+        connection.connect()
+        first = connection.send("show version")
+        error = connection.send("bad")
+        last = connection.send("show users")
+        connection.disconnect().result(timeout=5)
+        assert first.result() == "dev1: show version"
+        assert isinstance(error.exception(), CommandSyntaxError)
+        assert last.result() == "dev1: show users"
+        assert connection.calls == ['connect', 'show version', 'bad', 'show users', 'disconnect']
+        assert connection.hostname == "dev1"
+
+    def test_as_completed(self, tmpdir):
+        executor = Executor(workers=2)
+        connections = [make_connection("dev{}".format(i), executor, tmpdir) for i in xrange(6)]
+        for connection in connections:
+            connection.connect()
+        futures = [conn.send("show version") for conn in connections]
+        results = [future.result() for future in as_completed(futures, timeout=5)]
+        assert sorted(results) == sorted("dev{}: show version".format(i) for i in xrange(6))
+
+    def test_result_timeout(self, tmpdir):
+        connection = make_connection("dev1", Executor(workers=1), tmpdir)
+        with pytest.raises(ConnectionTimeoutError):
+            connection.connect().result(timeout=0.001)
+
+    def test_loop_waits_for_many_sessions_in_one_thread(self):
+        loop = EventLoop()
+        controllers = [make_controller("sh -c 'sleep 0.5; echo done{}; sleep 5'".format(i)) for i in xrange(40)]
+        threads = threading.active_count()
+        started = time.time()
+        futures = [loop.spawn(wait_for(ctrl, r"done\d+")) for ctrl in controllers]
+        assert sorted(future.result(timeout=10) for future in futures) == [""] * 40
+        # all the sessions waited at the same time in the single loop thread
+        assert time.time() - started < 3
+        assert threading.active_count() <= threads + 1
+        assert loop.pending == 0
+        for ctrl in controllers:
+            assert ctrl.after.startswith("done")
+            ctrl._session.close(force=True)
+
+    def test_loop_timeout_and_eof(self):
+        loop = EventLoop()
+        silent = make_controller("sleep 5")
+        closed = make_controller("true")
+        assert loop.spawn(wait_for(silent, "never", timeout=0.2)).result(timeout=5) is None
+        with pytest.raises(pexpect.TIMEOUT):
+            loop.spawn(expect_only(silent, "never", timeout=0.2)).result(timeout=5)
+        with pytest.raises(pexpect.EOF):
+            loop.spawn(wait_for(closed, "never")).result(timeout=5)
+        silent._session.close(force=True)
+
+    def test_send_on_simulated_devices(self, tmpdir):
+        simulator = Simulator()
+        for index in xrange(3):
+            simulator.add_device("xr{}".format(index), platform="XR", hostname="sim-xr{}".format(index))
+        with simulator:
+            loop = EventLoop()
+            connections = []
+            for index in xrange(3):
+                host, port = simulator.address("telnet", "xr{}".format(index), 23)
+                connection = AsyncConnection("xr{}".format(index), ["telnet://admin:admin@{}:{}".format(host, port)],
+                                             loop=loop, log_dir=str(tmpdir), log_level=0, transport="native",
+                                             metrics_registry=condoor.metrics.MetricsRegistry())
+                connection.discovery()
+                connection.connect()
+                connections.append(connection)
+            futures = [conn.send("show version") for conn in connections]
+            for index, future in enumerate(futures):
+                assert "sim-xr{} uptime is".format(index) in future.result(timeout=30)
+            bad = connections[0].send("show bogus")
+            assert isinstance(bad.exception(timeout=30), CommandSyntaxError)
+            assert "uptime" in connections[0].send("show version").result(timeout=30)
+            for connection in connections:
+                connection.disconnect().result(timeout=30)
@@ -0,0 +1,247 @@
+# =============================================================================
+# driver_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+import pexpect
+import pytest
+
+from condoor.controllers.pexpect_ctrl import Controller
+from condoor.hopinfo import make_hop_info_from_url
+from condoor.platforms import generic
+from condoor.exceptions import GeneralError, CommandSyntaxError, CommandTimeoutError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import Simulator  # noqa
+
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.py")
+OUTPUTS = {"show clock": "*12:00:00.000 UTC Mon Jan 1 2016\n"}
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    simulator = Simulator()
+    # the devices have no login and the same prompt, the session starts at the router# prompt
+    simulator.add_device("router", platform="IOS", username=None, outputs=OUTPUTS, page_length=0)
+    simulator.add_device("paging", platform="IOS", username=None, hostname="router", outputs=OUTPUTS,
+                         page_length=10)
+    simulator.add_device("console", platform="IOS", username=None, hostname="router", outputs=OUTPUTS,
+                         page_length=0, echo=False)
+    with simulator:
+        yield simulator
+
+
+def make_driver(simulator, name):
+    hosts = [make_hop_info_from_url("telnet://{}".format(name))]
+    driver = generic.Connection("router", hosts, Controller, logging.getLogger("condoor"))
+    ctrl = Controller(driver, "router", hosts)
+    env = dict(os.environ, **simulator.environ)
+    ctrl._session = pexpect.spawn(sys.executable, [SIMULATOR, "telnet", name], env=env, timeout=10)
+    ctrl._session.expect_exact("router#")
+    # the simulated device echoes the characters itself, the local terminal echo must stay disabled
+    ctrl._session.setecho = lambda state: None
+    ctrl.detected_prompts = ["FaKePrOmPt", "router#"]
+    ctrl.connected = True
+    driver.ctrl = ctrl
+    driver.connected = True
+    driver._compile_prompts()
+    driver._set_search_windows()
+    driver.prepare_prompt()
+    return driver
+
+
+@contextmanager
+def connected(simulator, name):
+    driver = make_driver(simulator, name)
+    try:
+        yield driver
+    finally:
+        driver.ctrl._session.close(force=True)
+
+
+@pytest.fixture
+def driver(simulator):
+    with connected(simulator, "router") as driver:
+        yield driver
+
+
+@pytest.fixture
+def paging_driver(simulator):
+    with connected(simulator, "paging") as driver:
+        yield driver
+
+
+@pytest.fixture
+def no_echo_driver(simulator):
+    with connected(simulator, "console") as driver:
+        yield driver
+
+
+class TestClass:
+
+    def test_send(self, driver):
+        output = driver.send("show clock")
+        assert output.strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+
+    def test_send_many(self, driver):
+        commands = ["show version", "show clock", "lines 100", "show clock"]
+        outputs = driver.send_many(commands, max_in_flight=2)
+        assert len(outputs) == 4
+        assert outputs[0] == driver.send("show version")
+        assert outputs[1].strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+        assert outputs[2].strip().splitlines() == ["line {}".format(index) for index in range(100)]
+        assert outputs[3] == outputs[1]
+
+    def test_send_many_single_in_flight(self, driver):
+        outputs = driver.send_many(["show clock", "show clock"], max_in_flight=1)
+        assert outputs[0] == outputs[1]
+
+    def test_send_many_syntax_error(self, driver):
+        with pytest.raises(CommandSyntaxError) as excinfo:
+            driver.send_many(["show clock", "show foo", "show clock", "show version"], max_in_flight=4)
+        assert excinfo.value.command == "show foo"
+        # the session is in sync after the error
+        assert driver.send_many(["show version"]) == [driver.send("show version")]
+
+    def test_send_many_timeout(self, driver):
+        with pytest.raises(CommandTimeoutError) as excinfo:
+            driver.send_many(["show clock", "sleep 3"], timeout=1)
+        assert excinfo.value.command == "sleep 3"
+
+    def test_prompt_framing(self, driver):
+        echo_output = driver.send("show version")
+        driver.command_framing = 'prompt'
+        assert driver.send("show version") == echo_output
+        assert driver.send_many(["show version"]) == [echo_output]
+
+    def test_prompt_framing_no_echo(self, no_echo_driver):
+        no_echo_driver.command_framing = 'prompt'
+        start = time.time()
+        output = no_echo_driver.send("show clock")
+        assert time.time() - start < 5
+        assert output == "\n*12:00:00.000 UTC Mon Jan 1 2016\n"
+
+    def test_strip_echo(self, driver):
+        assert driver._strip_echo("show clock\n12:00\n", "show clock") == "\n12:00\n"
+        # wrapped by the terminal
+        assert driver._strip_echo("show cl\nock\n12:00\n", "show clock") == "\n12:00\n"
+        # garbled
+        assert driver._strip_echo("sh%$ clock\n12:00\n", "show clock") == "\n12:00\n"
+
+    def test_read_unread_with_expect(self, driver):
+        ctrl = driver.ctrl
+        ctrl.sendline("lines 3")
+        ctrl.expect("line 1")
+        assert ctrl.read(1, 5) == "\r"
+        ctrl.expect("router#")
+        # the data handed out by read() is not searched again
+        assert ctrl.before == "\nline 2\r\n"
+
+        ctrl.unread("first\r\nsecond\r\n")
+        ctrl.expect("second")
+        assert ctrl.before == "first\r\n"
+        assert ctrl.read(2, 5) == "\r\n"
+
+        ctrl.sendline("lines 2")
+        assert ctrl.expect(["never", pexpect.TIMEOUT], timeout=1) == 1
+        data = ctrl.read(100000, 1)
+        assert "line 1" in data
+        assert ctrl.expect(["line", pexpect.TIMEOUT], timeout=0.5) == 1
+
+    def test_send_iter(self, driver):
+        lines = list(driver.send_iter("lines 1000"))
+        assert lines[0] == "\n"
+        assert lines[1:] == ["line {}\n".format(index) for index in range(1000)]
+        assert "".join(driver.send_iter("show version", chunk='raw')) == driver.send("show version")
+
+    def test_send_iter_more(self, paging_driver):
+        lines = list(paging_driver.send_iter("lines 25"))
+        assert lines[1:] == ["line {}\n".format(index) for index in range(25)]
+        assert paging_driver.send("show clock").strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+
+    def test_send_iter_prompt_framing(self, driver):
+        driver.command_framing = 'prompt'
+        assert "".join(driver.send_iter("lines 10")) == driver.send("lines 10")
+
+    def test_send_iter_syntax_error(self, driver):
+        with pytest.raises(CommandSyntaxError) as excinfo:
+            list(driver.send_iter("show foo"))
+        assert excinfo.value.command == "show foo"
+        assert driver.send("show clock").strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+
+    def test_send_iter_abandoned(self, driver):
+        lines = driver.send_iter("lines 1000")
+        next(lines)
+        next(lines)
+        # the lock is not held between the chunks
+        assert driver.command_execution_pending.acquire(False)
+        driver.command_execution_pending.release()
+        assert driver.send("show clock").strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+        with pytest.raises(GeneralError):
+            next(lines)
+
+        lines = driver.send_iter("lines 1000")
+        next(lines)
+        del lines
+        assert driver.send_many(["show clock"])[0].strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+
+    def test_send_iter_timeout(self, driver):
+        with pytest.raises(CommandTimeoutError):
+            list(driver.send_iter("sleep 3", timeout=1))
+
+    def test_prompt_framing_syntax_error(self, driver):
+        driver.command_framing = 'prompt'
+        with pytest.raises(CommandSyntaxError):
+            driver.send("show foo")
+        assert driver.send("show clock").strip() == "*12:00:00.000 UTC Mon Jan 1 2016"
+
+    def test_metrics(self, paging_driver):
+        paging_driver.send("lines 25")
+        with pytest.raises(CommandTimeoutError):
+            paging_driver.send("sleep 3", timeout=1)
+        stats = paging_driver.metrics.as_dict()
+        counters = dict((name, sum(sample['value'] for sample in samples))
+                        for name, samples in stats['counters'].items())
+        assert counters['condoor_more_pages_total'] == 2
+        assert counters['condoor_timeouts_total'] == 1
+        assert counters['condoor_bytes_received_total'] > 25 * len("line 0")
+        assert counters['condoor_fsm_transitions_total'] == 4
+        commands = dict((sample['labels']['command'], sample)
+                        for sample in stats['histograms']['condoor_command_seconds'])
+        assert commands['lines']['count'] == 1
+        assert commands['sleep']['sum'] >= 1
+        # the empty command verifying the prompt is not timed
+        paging_driver.send()
+        assert len(paging_driver.metrics.as_dict()['histograms']['condoor_command_seconds']) == 2
+        assert stats['histograms']['condoor_echo_wait_seconds'][0]['count'] == 2
@@ -0,0 +1,136 @@
+# =============================================================================
+# expect_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import re
+import sys
+import random
+
+import pexpect
+from pexpect.expect import searcher_re
+
+from condoor.controllers.expect import IncrementalSearcher, EventMatcher, TAIL, MAX_LINE, literal_alternatives
+
+PROMPT = re.compile("RP/0/RSP0/CPU0:ios#")
+MORE = re.compile(" --More-- ")
+SYNTAX_ERROR = re.compile("% Invalid input detected")
+
+
+def make_searcher(patterns, windows=None, default_window=16):
+    return IncrementalSearcher(patterns, windows, default_window)
+
+
+class TestClass:
+
+    def test_eof_timeout_index(self):
+        searcher = make_searcher([PROMPT, pexpect.TIMEOUT, pexpect.EOF])
+        assert searcher.timeout_index == 1
+        assert searcher.eof_index == 2
+
+    def test_longest_string(self):
+        assert make_searcher([MORE, re.compile(".*#")]).longest_string == 16
+        assert make_searcher([PROMPT], {PROMPT.pattern: TAIL}).longest_string == MAX_LINE
+        assert make_searcher([PROMPT], {PROMPT.pattern: None}).longest_string == 0
+        # literal uses its own length
+        assert make_searcher([re.compile("Connection closed")], default_window=0).longest_string == 17
+
+    def test_fresh_data_only(self):
+        searcher = make_searcher([SYNTAX_ERROR], default_window=0)
+        buffer = "% Invalid input detected\nline\n"
+        # the error is in the data already searched
+        assert searcher.search(buffer, 5) == -1
+        assert searcher.search(buffer, len(buffer)) == 0
+        assert (searcher.start, searcher.end) == (0, 24)
+
+    def test_overlap(self):
+        searcher = make_searcher([SYNTAX_ERROR], default_window=24)
+        buffer = "xxxx% Invalid input detected"
+        # the match started in the data already searched
+        assert searcher.search(buffer, 3) == 0
+        assert searcher.start == 4
+
+    def test_tail(self):
+        searcher = make_searcher([PROMPT], {PROMPT.pattern: TAIL})
+        buffer = "RP/0/RSP0/CPU0:ios#\nline 1\nRP/0/RSP0/CPU0:i"
+        assert searcher.search(buffer, 3) == -1
+        buffer += "os#"
+        # the prompt started in the trailing line received before
+        assert searcher.search(buffer, 3) == 0
+        assert searcher.start == len(buffer) - 19
+
+    def test_priority(self):
+        searcher = make_searcher([MORE, PROMPT, re.compile("ios#")], {PROMPT.pattern: TAIL})
+        buffer = "line\nRP/0/RSP0/CPU0:ios# --More-- "
+        # the earliest match wins
+        assert searcher.search(buffer, len(buffer)) == 1
+        # the first event wins for the same position
+        searcher = make_searcher([re.compile("RP/0"), PROMPT])
+        assert searcher.search(buffer, len(buffer)) == 0
+
+    def test_expect_loop(self):
+        script = "import sys; sys.stdout.write(''.join('line %d\\n' % i for i in range(20000)) + 'router#')"
+        session = pexpect.spawn(sys.executable, ["-c", script], timeout=10)
+        patterns = session.compile_pattern_list([SYNTAX_ERROR, re.compile("router#"), pexpect.EOF])
+        searcher = make_searcher(patterns, {"router#": TAIL})
+        assert session.expect_loop(searcher, 10) == 1
+        assert session.before.splitlines()[-1] == "line 19999"
+        session.close(force=True)
+
+    def test_event_matcher_same_as_pexpect(self):
+        events = [re.compile("% Invalid input detected|% Ambiguous command:"), re.compile("Connection closed"),
+                  pexpect.TIMEOUT, pexpect.EOF, re.compile(r"(RP/\d+/RS?P[0-1]/CPU[0-3]:.*?)(\([^()]*\))?#"),
+                  re.compile(r"Press RETURN to get started\."), re.compile(" --More-- "), re.compile("CPU0:ios#"),
+                  re.compile("reset by peer|closed by foreign host"), re.compile("(a)\\1"), re.compile("[Pp]assword")]
+        fragments = ["line\n", "RP/0/RSP0/CPU0:ios#", "RP/0/RSP0/CPU0:ios(config)#", " --More-- ", "Password",
+                     "% Ambiguous command:", "Connection closed", "closed by foreign host", "aa", "Press RETURN"]
+        plain = searcher_re(events)
+        matcher = EventMatcher(events, dict((event.pattern, None) for event in events if hasattr(event, 'pattern')))
+        random.seed(1)
+        for _ in range(2000):
+            buffer = "".join(random.choice(fragments) for _ in range(random.randint(0, 6)))
+            index = plain.search(buffer, len(buffer))
+            assert matcher.search(buffer, len(buffer)) == index
+            if index >= 0:
+                assert (matcher.start, matcher.end) == (plain.start, plain.end)
+                assert matcher.match.groups() == plain.match.groups()
+
+    def test_event_matcher_groups(self):
+        events = [re.compile(r"Press RETURN to get started\."), re.compile("(a)\\1"),
+                  re.compile("x+"), re.compile("y+"), re.compile("(?i)z")]
+        matcher = EventMatcher(events, default_window=None)
+        assert [index for index, _, _ in matcher._literals] == [0]
+        assert [index for index, _, _ in matcher._separate] == [1, 4]
+        assert [compiled.pattern for _, compiled in matcher._alternations] == ["(?P<_e2>x+)|(?P<_e3>y+)"]
+
+    def test_literal_alternatives(self):
+        assert literal_alternatives(re.compile("reset by peer|closed by foreign host")) == \
+            ["reset by peer", "closed by foreign host"]
+        assert literal_alternatives(re.compile(r"Press RETURN to get started\.")) == ["Press RETURN to get started."]
+        assert literal_alternatives(re.compile("[Pp]assword")) is None
+        assert literal_alternatives(re.compile(r"\d+")) is None
+        assert literal_alternatives(re.compile("password", re.IGNORECASE)) is None
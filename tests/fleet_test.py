@@ -0,0 +1,145 @@
+# =============================================================================
+# fleet_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import threading
+import time
+
+from condoor.fleet import Fleet, run_on_devices
+from condoor.exceptions import CommandTimeoutError, ConnectionError, ConnectionTimeoutError
+
+
+class FakeConnection(object):
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def __init__(self, name, urls, delay=0.01):
+        if name.startswith("broken"):
+            raise ValueError("Invalid URL")
+        self.name = name
+        self.urls = urls
+        self.delay = delay
+        self.closed = threading.Event()
+
+    def discovery(self):
+        pass
+
+    def connect(self):
+        if self.name.startswith("dead"):
+            raise ConnectionError("Unable to connect", self.name)
+        with FakeConnection.lock:
+            FakeConnection.active += 1
+            FakeConnection.max_active = max(FakeConnection.max_active, FakeConnection.active)
+
+    def send(self, cmd, timeout=60):
+        if self.name.startswith("hang"):
+            self.closed.wait(5)
+            raise ConnectionError("Session closed", self.name)
+        if cmd == "slow":
+            raise CommandTimeoutError("Command timeout", self.name, cmd)
+        time.sleep(self.delay)
+        return "{}: {}".format(self.name, cmd)
+
+    def disconnect(self):
+        with FakeConnection.lock:
+            if not self.closed.is_set() and not self.name.startswith("dead"):
+                FakeConnection.active -= 1
+        self.closed.set()
+
+    @property
+    def device_info(self):
+        return {'family': 'FAKE'}
+
+
+class TestClass:
+    def setup_method(self, method):
+        FakeConnection.active = 0
+        FakeConnection.max_active = 0
+
+    def test_all_results_streamed(self):
+        inventory = dict(("dev{}".format(i), ["telnet://dev{}".format(i)]) for i in xrange(20))
+        fleet = Fleet(inventory, ["show version", "show users"], concurrency=4, connection_class=FakeConnection)
+        results = list(fleet)
+        assert sorted(result.name for result in results) == sorted(inventory.keys())
+        assert all(result.succeeded for result in results)
+        assert results[0].outputs[0] == ("show version", "{}: show version".format(results[0].name))
+        assert results[0].device_info == {'family': 'FAKE'}
+        assert fleet.summary.total == 20
+        assert fleet.summary.succeeded == 20
+        assert fleet.summary.throughput > 0
+
+    def test_concurrency_bound(self):
+        inventory = [("dev{}".format(i), ["telnet://dev{}".format(i)]) for i in xrange(12)]
+        list(Fleet(inventory, ["show version"], concurrency=3, connection_class=FakeConnection))
+        assert 1 < FakeConnection.max_active <= 3
+
+    def test_errors_reported(self):
+        inventory = [("dead1", ["telnet://dead1"]), ("dev1", ["telnet://dev1"])]
+        results = dict((r.name, r) for r in run_on_devices(inventory, ["slow"], connection_class=FakeConnection))
+        assert isinstance(results["dead1"].error, ConnectionError)
+        assert isinstance(results["dev1"].error, CommandTimeoutError)
+
+    def test_device_timeout(self):
+        inventory = [("hang1", ["telnet://hang1"]), ("dev1", ["telnet://dev1"])]
+        fleet = Fleet(inventory, ["show version"], concurrency=2, timeout=0.2, connection_class=FakeConnection)
+        results = dict((r.name, r) for r in fleet)
+        assert isinstance(results["hang1"].error, ConnectionTimeoutError)
+        assert results["dev1"].succeeded
+        assert fleet.summary.timed_out == 1
+        assert fleet.summary.percentile(50) is not None
+
+    def test_device_timeout_while_others_finish(self):
+        inventory = [("hang1", ["telnet://hang1"]), ("hang2", ["telnet://hang2"])]
+        inventory += [("dev{}".format(i), ["telnet://dev{}".format(i)]) for i in xrange(100)]
+        fleet = Fleet(inventory, ["show version"], concurrency=4, timeout=0.5, connection_class=FakeConnection)
+        results = list(fleet)
+        names = [result.name for result in results]
+        assert len(results) == 102
+        for name in ("hang1", "hang2"):
+            result = results[names.index(name)]
+            assert isinstance(result.error, ConnectionTimeoutError)
+            # expired and disconnected in time, not when the device gave up on its own
+            assert result.elapsed < 2
+            assert names.index(name) < len(names) - 1
+        assert fleet.summary.timed_out == 2
+        assert fleet.summary.succeeded == 100
+
+    def test_constructor_error_reported(self):
+        inventory = [("broken1", ["telnet://1.1.1.1:23,34/x"]), ("dev1", ["telnet://dev1"])]
+        fleet = Fleet(inventory, ["show version"], concurrency=1, timeout=5, connection_class=FakeConnection)
+        results = dict((r.name, r) for r in fleet)
+        assert isinstance(results["broken1"].error, ValueError)
+        assert results["dev1"].succeeded
+
+    def test_same_device_twice(self):
+        inventory = [("dev1", ["telnet://dev1"]), ("dev1", ["telnet://dev1"])]
+        fleet = Fleet(inventory, ["show version"], concurrency=2, timeout=5, connection_class=FakeConnection)
+        results = list(fleet)
+        assert len(results) == 2
+        assert all(result.succeeded for result in results)
@@ -0,0 +1,149 @@
+# =============================================================================
+# fsm_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import re
+import logging
+
+import pexpect
+import pytest
+
+from condoor.controllers.fsm import FSM, FSMTemplate
+from condoor.exceptions import CommandSyntaxError, ConnectionError
+
+PROMPT = re.compile("router#")
+MORE = re.compile(" --More-- ")
+ERROR = re.compile("% Invalid input")
+
+
+class FakeController(object):
+    """Returns the events from the script in order"""
+    hostname = "router"
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.sent = []
+
+    def expect(self, events, timeout):
+        event = self.script.pop(0)
+        if event is pexpect.EOF:
+            raise pexpect.EOF("EOF")
+        return events.index(event)
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+def send_space(ctx):
+    ctx.ctrl.send(' ')
+    return True
+
+
+def finish(ctx):
+    ctx.finished = True
+    return True
+
+
+def make_template():
+    events = [ERROR, pexpect.TIMEOUT, PROMPT, MORE]
+    transitions = [
+        (ERROR, [0], -1, CommandSyntaxError("Command unknown", "router"), 0),
+        (MORE, [0], 0, send_space, 10),
+        (PROMPT, [0], -1, finish, 0),
+    ]
+    return FSMTemplate("WAIT-4-PROMPT", events, transitions)
+
+
+class TestClass:
+
+    def test_dense_table(self):
+        template = make_template()
+        assert len(template.table) == 1
+        assert len(template.table[0]) == 4
+        assert template.table[0][1] is None
+        assert template.table[0][2][0] == -1
+
+    def test_run_many_times(self):
+        template = make_template()
+        for _ in range(3):
+            ctrl = FakeController([MORE, MORE, PROMPT])
+            assert template.run(ctrl, timeout=1)
+            assert ctrl.sent == [' ', ' ']
+
+    def test_exception_not_shared(self):
+        template = make_template()
+        errors = []
+        for _ in range(2):
+            with pytest.raises(CommandSyntaxError) as excinfo:
+                template.run(FakeController([ERROR]))
+            errors.append(excinfo.value)
+        assert errors[0] is not errors[1]
+        assert str(errors[0]) == str(errors[1]) == "router: Command unknown"
+
+    def test_eof(self):
+        with pytest.raises(ConnectionError):
+            make_template().run(FakeController([pexpect.EOF]))
+
+    def test_init_pattern(self):
+        ctrl = FakeController([])
+        assert make_template().run(ctrl, init_pattern=PROMPT)
+
+    def test_fsm(self):
+        events = [PROMPT, MORE]
+        transitions = [(MORE, [0], 0, send_space, 0), (PROMPT, [0], -1, None, 0)]
+        ctrl = FakeController([MORE, PROMPT])
+        assert FSM("TEST", ctrl, events, transitions, timeout=1).run()
+        assert ctrl.sent == [' ']
+
+    def test_event_hook(self):
+        ctrl = FakeController([MORE, PROMPT])
+        events = []
+        ctrl.fsm_event_hook = events.append
+        assert make_template().run(ctrl, timeout=1)
+        assert [(event.state, event.next_state, event.action) for event in events] == \
+            [(0, 0, 'send_space'), (0, -1, 'finish')]
+        assert events[0].fsm_name == "WAIT-4-PROMPT"
+        assert events[0].pattern is MORE
+        assert events[1].hostname == "router"
+
+    def test_no_formatting_if_disabled(self):
+        class Pattern(object):
+            def encode(self, codec):
+                raise AssertionError("Formatted while logging disabled")
+
+        class Prompt(object):
+            pattern = Pattern()
+
+        logger = logging.getLogger('condoor.fsm')
+        level = logger.level
+        logger.setLevel(logging.INFO)
+        try:
+            template = FSMTemplate("TEST", [Prompt], [(Prompt, [0], -1, None, 0)])
+            assert template.run(FakeController([]), init_pattern=Prompt)
+        finally:
+            logger.setLevel(level)
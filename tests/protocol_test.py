@@ -0,0 +1,182 @@
+# =============================================================================
+# protocol_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import re
+
+import pexpect
+import pytest
+
+from condoor.controllers.protocols import base
+from condoor.exceptions import ConnectionError
+from condoor.platforms import generic
+
+XR_PROMPT = "RP/0/RSP0/CPU0:ios#"
+SHELL = "[jumphost:~]$ "
+
+
+class FakeController(object):
+    """Answers every new line with the echo and the prompt. The *answered* number of the new lines is
+    answered immediately, the rest only after the reader waits for the data."""
+    def __init__(self, prompt, is_target=True, answered=None, stale="", response="^J\r\n{}"):
+        self.prompt = prompt
+        self.response = response
+        self.is_target = is_target
+        self.platform = generic.Connection
+        self.hostname = "fake"
+        self.answered = answered
+        self.buffer = stale
+        self.incoming = []
+        self.delayed = []
+        self.timeouts = 0
+        self.lines = 0
+
+    def sendline(self, line=""):
+        self.lines += 1
+        response = self.response.format(self.prompt)
+        if self.answered is None or self.lines <= self.answered:
+            self.incoming.append(response)
+        else:
+            self.delayed.append(response)
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        if not self.incoming:
+            self.timeouts += 1
+            self.incoming, self.delayed = self.delayed, []
+            raise pexpect.TIMEOUT("Timeout")
+        return self.incoming.pop(0)
+
+    def read(self, size, timeout):
+        data, self.buffer = self.buffer, ""
+        return data or self.read_nonblocking(size, timeout)
+
+    def expect(self, patterns, timeout=-1):
+        data = "".join(self.incoming + self.delayed)
+        match = patterns[0].search(data)
+        if match is None:
+            return 1
+        rest = data[match.end():]
+        self.incoming, self.delayed = [rest] if rest else [], []
+        return 0
+
+
+class NodeInfo(object):
+    protocol = 'telnet'
+    hostname = 'fake'
+    port = 23
+    password = None
+    username = 'admin'
+
+
+class FakeProtocol(base.Protocol):
+    def _dbg(self, level, msg, *args):
+        pass
+
+
+def make_protocol(ctrl):
+    return FakeProtocol(ctrl, NodeInfo())
+
+
+class TestClass:
+    def test_read_until_quiet(self):
+        ctrl = FakeController(XR_PROMPT)
+        ctrl.incoming = ["a", "b", "c"]
+        assert make_protocol(ctrl).read_until_quiet(1, 1, 10) == "abc"
+        assert ctrl.timeouts == 1
+
+    def test_read_until_quiet_stop(self):
+        ctrl = FakeController(XR_PROMPT)
+        ctrl.incoming = ["first\r\n", "second\r\n", "third\r\n"]
+        data = make_protocol(ctrl).read_until_quiet(1, 1, 10, stop=lambda data: "second" in data)
+        assert data == "first\r\nsecond\r\n"
+        assert ctrl.incoming == ["third\r\n"]
+        assert ctrl.timeouts == 0
+
+    def test_read_until_quiet_eof(self):
+        ctrl = FakeController(XR_PROMPT)
+        ctrl.read_nonblocking = lambda size, timeout: (_ for _ in ()).throw(pexpect.EOF("closed"))
+        with pytest.raises(ConnectionError):
+            make_protocol(ctrl).read_until_quiet(1, 1, 10)
+
+    def test_flush(self):
+        ctrl = FakeController(XR_PROMPT, stale="User Access Verification\r\n")
+        ctrl.incoming = ["Last login: Mon Jan 1\r\n"]
+        assert make_protocol(ctrl).flush() == "User Access Verification\r\nLast login: Mon Jan 1\r\n"
+        assert ctrl.buffer == "" and ctrl.incoming == []
+
+    def test_detect_repeated_prompt(self):
+        ctrl = FakeController(SHELL, is_target=False)
+        protocol = make_protocol(ctrl)
+        assert protocol.detect_prompt()
+        assert protocol.prompt == SHELL.strip()
+        # the flush is the only read waiting for the timeout
+        assert ctrl.timeouts == 1
+        assert "".join(ctrl.incoming + ctrl.delayed).strip() == ""
+
+    def test_detect_known_prompt_single_response(self):
+        ctrl = FakeController(XR_PROMPT, answered=1)
+        protocol = make_protocol(ctrl)
+        assert protocol.detect_prompt()
+        assert protocol.prompt == XR_PROMPT
+        assert ctrl.timeouts == 1
+        # the response received late is consumed as well
+        assert ctrl.incoming == [] and ctrl.delayed == []
+
+    def test_detect_prompt_echo_after_new_line(self):
+        ctrl = FakeController(XR_PROMPT, answered=1, response="\r\n^J{}")
+        protocol = make_protocol(ctrl)
+        assert protocol.detect_prompt()
+        assert protocol.prompt == XR_PROMPT
+        assert ctrl.incoming == [] and ctrl.delayed == []
+
+    def test_detect_prompt_after_stale_output(self):
+        ctrl = FakeController(XR_PROMPT, stale="\r\nUser Access Verification\r\n\r\nUsername: ")
+        protocol = make_protocol(ctrl)
+        assert protocol.detect_prompt()
+        assert protocol.prompt == XR_PROMPT
+
+    def test_detect_prompt_fails(self):
+        ctrl = FakeController("")
+        assert not make_protocol(ctrl).detect_prompt(sync_multiplier=0.01)
+
+    @pytest.mark.parametrize("data, same", [
+        ("router#\r\nrouter#", True),
+        ("router#^J\r\nrouter#", True),
+        ("router#\r\n\r\n", False),
+        ("router#\r\nswitch#", False),
+        ("*************\r\n*************", False),
+        ("User Access Verification\r\nUser Access Verification", False),
+    ])
+    def test_same_trailing_lines(self, data, same):
+        assert base._same_trailing_lines(data) == same
+
+    def test_prompt_received(self):
+        stop = base._prompt_received([re.compile(r"[\w\-]+#")])
+        assert stop("^J\r\nrouter#")
+        assert not stop("^J\r\nrout")
+        assert not stop("Username: ")
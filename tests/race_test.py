@@ -0,0 +1,99 @@
+# =============================================================================
+# race_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import os
+import sys
+import time
+
+import pytest
+
+import condoor
+from condoor.exceptions import ConnectionError
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import Simulator  # noqa
+
+
+@pytest.fixture
+def simulator():
+    simulator = Simulator()
+    device = simulator.add_device("xr", platform="XR", hostname="sim-xr")
+    simulator.add_silent_line("ts", 2001)
+    simulator.add_standby_console("ts", 2002)
+    simulator.add_terminal_server_line("ts", 2003, device)
+    with simulator:
+        yield simulator
+
+
+def url(simulator, port):
+    return "telnet://admin:admin@{}:{}".format(*simulator.address("telnet", "ts", port))
+
+
+def make_connection(urls, tmpdir, **kwargs):
+    return condoor.Connection("xr", urls, log_dir=str(tmpdir), log_level=0,
+                              metrics_registry=condoor.metrics.MetricsRegistry(), transport="native", **kwargs)
+
+
+class TestClass:
+    def test_race(self, simulator, tmpdir):
+        urls = [[url(simulator, 2001)], [url(simulator, 2002)], [url(simulator, 2003)]]
+        conn = make_connection(urls, tmpdir, race=True)
+        begin = time.time()
+        conn.discovery(reuse_session=True)
+        assert time.time() - begin < 10
+        assert conn.hostname == "sim-xr"
+        assert conn.is_console
+        assert conn._last_driver_index == 2
+        assert "ASR9K" in conn.send("show version brief")
+        conn.disconnect()
+
+        # the session log contains the winner session only
+        with open(str(tmpdir.join("session.log"))) as log:
+            data = log.read()
+        assert "sim-xr" in data
+        assert "Standby console" not in data
+
+    def test_race_first_chains(self, simulator, tmpdir):
+        urls = [[url(simulator, 2002)], [url(simulator, 2003)], [url(simulator, 2001)]]
+        conn = make_connection(urls, tmpdir, race=2)
+        conn.discovery(reuse_session=True)
+        assert conn._last_driver_index == 1
+        conn.disconnect()
+        # the platform driver races again
+        assert conn.connect()
+        assert conn._last_driver_index == 1
+        assert conn._driver.platform == "ASR9K"
+        conn.disconnect()
+
+    def test_race_all_failed(self, simulator, tmpdir):
+        urls = [[url(simulator, 2002)], [url(simulator, 2002)]]
+        conn = make_connection(urls, tmpdir, race=True)
+        with pytest.raises(ConnectionError):
+            conn.discovery()
@@ -0,0 +1,117 @@
+# =============================================================================
+# reconnect_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+import condoor
+from condoor.exceptions import ConnectionTimeoutError
+from condoor.hopinfo import make_hop_info_from_url
+from condoor.reconnect import ReconnectScheduler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import Simulator  # noqa
+
+
+def path(*urls):
+    return [make_hop_info_from_url(url) for url in urls]
+
+
+class TestClass:
+    def test_backoff(self):
+        scheduler = ReconnectScheduler(initial_delay=1, max_delay=10, multiplier=2, jitter=0)
+        assert [scheduler.backoff(failures) for failures in range(6)] == [0, 1, 2, 4, 8, 10]
+        scheduler = ReconnectScheduler(initial_delay=1, max_delay=10, multiplier=2, jitter=0.5, seed=1)
+        delays = [scheduler.backoff(3) for _ in range(100)]
+        assert all(2 <= delay <= 4 for delay in delays)
+        assert len(set(delays)) > 1
+
+    def test_choose_healthy_path(self):
+        scheduler = ReconnectScheduler(initial_delay=10, jitter=0)
+        paths = [path("telnet://ts1:2001"), path("telnet://ts2:2001")]
+        assert scheduler.choose(paths, current=1) == (1, 0)
+        scheduler.record(paths[1], False, failed_hop=0)
+        index, delay = scheduler.choose(paths, current=1)
+        assert (index, delay) == (0, 0)
+        scheduler.record(paths[0], False, failed_hop=0)
+        index, delay = scheduler.choose(paths, current=0)
+        assert index == 1
+        assert 9 < delay <= 10
+        scheduler.record(paths[1], True)
+        assert scheduler.choose(paths, current=0) == (1, 0)
+
+    def test_shared_hop_failure(self):
+        scheduler = ReconnectScheduler(initial_delay=10, jitter=0)
+        paths = [path("ssh://jumphost", "telnet://ts1:2001"), path("ssh://jumphost", "telnet://ts2:2001"),
+                 path("ssh://backup", "telnet://ts2:2001")]
+        # the jumphost failed, the other path through it is delayed too
+        scheduler.record(paths[0], False, failed_hop=0)
+        assert scheduler.choose(paths, current=0)[0] == 2
+        health = scheduler.health()
+        assert health['hops'][0]['hop'] == ('ssh', 'jumphost', 22)
+        assert health['hops'][0]['consecutive_failures'] == 1
+        assert health['paths'][0]['failures'] == 1
+
+    def test_reconnect_timeline(self, tmpdir):
+        simulator = Simulator()
+        device = simulator.add_device("xr", platform="XR", hostname="sim-xr")
+        with simulator:
+            host, port = simulator.address("telnet", "xr", 23)
+            scheduler = ReconnectScheduler(initial_delay=0.5, jitter=0)
+            conn = condoor.Connection("xr", ["telnet://admin:admin@{}:{}".format(host, port)], log_dir=str(tmpdir),
+                                      log_level=0, metrics_registry=condoor.metrics.MetricsRegistry(),
+                                      transport="native", reconnect_scheduler=scheduler)
+            conn.discovery(reuse_session=True)
+            conn.disconnect()
+
+            device.available = False
+            timer = threading.Timer(1.2, setattr, (device, "available", True))
+            timer.start()
+            conn.reconnect(max_timeout=30)
+            timer.join()
+            timeline = conn.reconnect_timeline
+            assert len(timeline) >= 3
+            assert not timeline[0]['connected']
+            assert timeline[0]['failed_hop'] == 0
+            assert timeline[-1]['connected']
+            delays = [attempt['delay'] for attempt in timeline]
+            assert [round(delay, 1) for delay in delays[:3]] == [0, 0.5, 1.0]
+            assert conn.reconnect_health['paths'][0]['consecutive_failures'] == 0
+            conn.disconnect()
+
+            device.available = False
+            begin = time.time()
+            with pytest.raises(ConnectionTimeoutError):
+                conn.reconnect(max_timeout=2)
+            assert time.time() - begin < 5
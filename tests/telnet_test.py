@@ -0,0 +1,166 @@
+# =============================================================================
+# telnet_test
+#
+# Copyright (c)  2016, Cisco Systems
+# All rights reserved.
+#
+# # Author: Klaudiusz Staniek
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+# Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation
+# and/or other materials provided with the distribution.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+# =============================================================================
+
+import os
+import socket
+import sys
+import threading
+import time
+
+import pexpect
+import pytest
+
+import condoor
+from condoor.exceptions import ConnectionError, GeneralError
+from condoor.controllers.transports.telnet import TelnetSession, IAC, DO, DONT, WILL, WONT, SB, SE, \
+    ECHO, SGA, TTYPE, NAWS
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from simulator import Simulator  # noqa
+
+NEW_ENVIRON = chr(39)
+
+
+class TelnetServer(object):
+    """The local telnet server stand-in accepting single connection."""
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.connection = None
+        self._accepted = threading.Event()
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+
+    def _accept(self):
+        self.connection, _ = self.listener.accept()
+        self._accepted.set()
+
+    def send(self, data):
+        self._accepted.wait(5)
+        self.connection.sendall(data)
+
+    def receive(self, size, timeout=5):
+        self._accepted.wait(timeout)
+        data = ""
+        deadline = time.time() + timeout
+        self.connection.settimeout(timeout)
+        while len(data) < size and time.time() < deadline:
+            data += self.connection.recv(size - len(data))
+        return data
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+        self.listener.close()
+
+
+@pytest.fixture
+def server():
+    server = TelnetServer()
+    yield server
+    server.close()
+
+
+class TestClass:
+    def test_option_negotiation(self, server):
+        session = TelnetSession("127.0.0.1", server.port)
+        server.send(IAC + WILL + ECHO + IAC + WILL + SGA + IAC + DO + TTYPE + IAC + DO + NAWS +
+                    IAC + DO + NEW_ENVIRON + IAC + WILL + NEW_ENVIRON + "Username: ")
+        assert session.expect("Username: ", timeout=5) == 0
+        assert session.before == ""
+        expected = (IAC + DO + ECHO + IAC + DO + SGA + IAC + WILL + TTYPE + IAC + WILL + NAWS +
+                    IAC + SB + NAWS + "\x00\xa0\x00\x18" + IAC + SE + IAC + WONT + NEW_ENVIRON +
+                    IAC + DONT + NEW_ENVIRON)
+        assert server.receive(len(expected)) == expected
+
+        server.send(IAC + SB + TTYPE + chr(1) + IAC + SE)
+        with pytest.raises(pexpect.TIMEOUT):
+            session.read_nonblocking(100, 0.2)
+        expected = IAC + SB + TTYPE + chr(0) + "VT100" + IAC + SE
+        assert server.receive(len(expected)) == expected
+
+        # already enabled options are not acknowledged again
+        server.send(IAC + WILL + ECHO + IAC + DO + NAWS + "x")
+        assert session.read_nonblocking(100, 1) == "x"
+
+        session.setwinsize(50, 200)
+        expected = IAC + SB + NAWS + "\x00\xc8\x00\x32" + IAC + SE
+        assert server.receive(len(expected)) == expected
+        session.close()
+
+    def test_data_escaping(self, server):
+        session = TelnetSession("127.0.0.1", server.port)
+        server.send("a" + IAC + IAC + "b\r\x00c\r")
+        assert session.expect("c\r", timeout=5) == 0
+        assert session.before == "a\xffb\r"
+        server.send("\x00d\r\n")
+        assert session.read_nonblocking(100, 1) == "d\r\n"
+
+        session.send("a\xffb\rc\r\n")
+        session.sendcontrol("]")
+        assert server.receive(10) == "a\xff\xffb\r\x00c\r\n\x1d"
+
+    def test_eof(self, server):
+        session = TelnetSession("127.0.0.1", server.port)
+        server.send("bye")
+        server.connection.close()
+        assert session.expect(pexpect.EOF, timeout=5) == 0
+        assert session.before == "bye"
+        assert not session.isalive()
+
+    def test_connection_refused(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        listener.close()
+        with pytest.raises(ConnectionError):
+            TelnetSession("127.0.0.1", port)
+
+    def test_unknown_transport(self):
+        with pytest.raises(GeneralError):
+            condoor.Connection("xr", ["telnet://admin:admin@xr"], transport="carrier-pigeon")
+
+    def test_native_discovery(self, tmpdir):
+        simulator = Simulator()
+        simulator.add_device("xr", platform="XR", hostname="sim-xr")
+        with simulator:
+            host, port = simulator.address("telnet", "xr", 23)
+            conn = condoor.Connection("xr", ["telnet://admin:admin@{}:{}".format(host, port)], log_dir=str(tmpdir),
+                                      log_level=0, metrics_registry=condoor.metrics.MetricsRegistry(),
+                                      transport="native")
+            conn.discovery(reuse_session=True)
+            assert conn.hostname == "sim-xr"
+            assert conn.family == "ASR9K"
+            assert "ASR9K" in conn.send("show version brief")
+            assert simulator.hosts["xr"].commands[-1] == "show version brief"
+            conn.disconnect()